@@ -0,0 +1,321 @@
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import IVF_NLIST, IVF_NPROBE, IVF_PQ_M, IVF_RERANK
+from similarity import Vector, as_matrix, normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix product while assigning vectors to centroids
+_ASSIGN_CHUNK = 8192
+
+
+def save_array(path: str, array: np.ndarray) -> None:
+    """np.save through a temporary file, so readers mapping ``path`` keep the old data."""
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, inner_product: bool) -> np.ndarray:
+    """Index of the closest centroid for every row of ``data``."""
+    assignments = np.empty(data.shape[0], dtype=np.int32)
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    for start in range(0, data.shape[0], _ASSIGN_CHUNK):
+        block = np.asarray(data[start:start + _ASSIGN_CHUNK], dtype=np.float32)
+        products = block @ centroids.T
+        if inner_product:
+            assignments[start:start + len(block)] = products.argmax(axis=1)
+        else:
+            # ||x - c||^2 without the ||x||^2 term, which is the same for every c
+            assignments[start:start + len(block)] = (centroid_norms - 2 * products).argmin(axis=1)
+    return assignments
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 20, seed: int = 0, spherical: bool = False) -> np.ndarray:
+    """Lloyd's k-means; ``spherical`` keeps centroids unit length and assigns by inner product."""
+    rng = np.random.default_rng(seed)
+    n = data.shape[0]
+    centroids = data[rng.choice(n, size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = _nearest(data, centroids, inner_product=spherical)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        # Per-cluster sums from one sorted pass (np.add.at is far slower)
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(data[order], starts[~empty], axis=0)
+        centroids = sums / np.maximum(counts, 1)[:, None]
+        # Restart empty clusters from random points rather than losing them
+        if empty.any():
+            centroids[empty] = data[rng.choice(n, size=int(empty.sum()), replace=False)]
+        if spherical:
+            centroids = normalize_rows(centroids)
+    return centroids
+
+
+class _Segments:
+    """Row-addressable array made of a (possibly memory-mapped) base plus appended blocks.
+
+    Appending never copies the base, so inserts into a loaded index do not
+    pull the mapped file into memory.
+    """
+
+    def __init__(self, base: np.ndarray):
+        self.blocks: List[np.ndarray] = [base]
+        self.starts: List[int] = [0]
+        self.length = base.shape[0]
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, rows: np.ndarray) -> None:
+        self.blocks.append(rows)
+        self.starts.append(self.length)
+        self.length += rows.shape[0]
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        if len(self.blocks) == 1:
+            return np.asarray(self.blocks[0][ids])
+        out = np.empty((len(ids),) + self.blocks[0].shape[1:], dtype=self.blocks[0].dtype)
+        for block, start in zip(self.blocks, self.starts):
+            mask = (ids >= start) & (ids < start + block.shape[0])
+            if mask.any():
+                out[mask] = block[ids[mask] - start]
+        return out
+
+    def to_array(self) -> np.ndarray:
+        return np.concatenate(self.blocks) if len(self.blocks) > 1 else np.asarray(self.blocks[0])
+
+
+class IVFIndex:
+    """Inverted-file ANN index over L2-normalized vectors (cosine similarity).
+
+    Vectors are clustered around ``nlist`` k-means centroids; a search scores
+    only the rows in the ``nprobe`` lists whose centroids are closest to the
+    query, so ``nprobe`` trades recall for latency. With product
+    quantization (``pq_m`` sub-vectors of 8-bit codes) candidates are first
+    ranked from the compact codes and only the best ``rerank`` are re-scored
+    against the full vectors, which can then stay memory-mapped on disk.
+
+    Inserts are assigned to the existing centroids; deletes are tombstones.
+    Retrain with ``build`` once the data has drifted far from the centroids.
+    """
+
+    def __init__(self, centroids: np.ndarray, vectors: np.ndarray, list_offsets: np.ndarray,
+                 list_rows: np.ndarray, deleted: Optional[np.ndarray] = None,
+                 codebooks: Optional[np.ndarray] = None, codes: Optional[np.ndarray] = None,
+                 nprobe: int = IVF_NPROBE, rerank: int = IVF_RERANK):
+        self.centroids = centroids
+        self.vectors = _Segments(vectors)
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        # Rows inserted since the index was built or loaded, per list
+        self.added: Dict[int, List[int]] = {}
+        self.deleted = deleted if deleted is not None else np.zeros(vectors.shape[0], dtype=bool)
+        self.codebooks = codebooks
+        self.codes = _Segments(codes) if codes is not None else None
+        self.nprobe = nprobe
+        self.rerank = rerank
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @classmethod
+    def build(cls, vectors, nlist: int = IVF_NLIST, pq_m: int = IVF_PQ_M, iterations: int = 20,
+              seed: int = 0, max_training_points: int = 100_000, **kwargs) -> "IVFIndex":
+        """Train centroids (and PQ codebooks) on ``vectors`` and index them all.
+
+        ``nlist`` 0 picks about 4 * sqrt(n) lists.
+        """
+        vectors = normalize_rows(as_matrix(vectors))
+        n, dim = vectors.shape
+        if n == 0:
+            raise ValueError("Cannot build an IVF index without vectors")
+        nlist = min(n, nlist or max(1, int(4 * math.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        training = vectors[rng.choice(n, size=min(n, max_training_points), replace=False)]
+
+        started = time.perf_counter()
+        centroids = kmeans(training, nlist, iterations, seed, spherical=True)
+        assignments = _nearest(vectors, centroids, inner_product=True)
+        list_rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))]).astype(np.int64)
+
+        codebooks = codes = None
+        if pq_m:
+            if dim % pq_m:
+                raise ValueError(f"pq_m ({pq_m}) must divide the vector dimension ({dim})")
+            sub_dim = dim // pq_m
+            ksub = min(256, training.shape[0])
+            codebooks = np.stack([
+                kmeans(training[:, m * sub_dim:(m + 1) * sub_dim], ksub, iterations, seed + m)
+                for m in range(pq_m)
+            ])
+            codes = encode_pq(codebooks, vectors)
+        logger.info(f"Built IVF index: {n} vectors, {nlist} lists, pq_m={pq_m} "
+                    f"in {time.perf_counter() - started:.1f}s")
+        return cls(centroids, vectors, list_offsets, list_rows, codebooks=codebooks, codes=codes, **kwargs)
+
+    def add(self, vectors) -> np.ndarray:
+        """Insert vectors and return their ids (consecutive, after the existing rows)."""
+        vectors = normalize_rows(as_matrix(vectors))
+        ids = np.arange(len(self), len(self) + vectors.shape[0])
+        for row_id, list_id in zip(ids, _nearest(vectors, self.centroids, inner_product=True)):
+            self.added.setdefault(int(list_id), []).append(int(row_id))
+        self.vectors.append(vectors)
+        if self.codes is not None:
+            self.codes.append(encode_pq(self.codebooks, vectors))
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(ids), dtype=bool)])
+        return ids
+
+    def delete(self, ids) -> None:
+        self.deleted[np.asarray(ids, dtype=np.int64)] = True
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        probes = top_k_indices(self.centroids @ query, self.nprobe)
+        parts = [self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes]
+        parts += [np.asarray(self.added[int(p)], dtype=np.int64) for p in probes if int(p) in self.added]
+        candidates = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return candidates[~self.deleted[candidates]]
+
+    def search(self, query_vector: Vector, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm == 0 or len(self) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+        query = query / norm
+
+        candidates = self._candidates(query)
+        if self.codes is not None and len(candidates) > max(k, self.rerank):
+            pq_m, _, sub_dim = self.codebooks.shape
+            # Asymmetric distance: score every code from a per-query lookup table
+            lookup = np.einsum("msd,md->ms", self.codebooks, query.reshape(pq_m, sub_dim))
+            approx = lookup[np.arange(pq_m), self.codes.take(candidates)].sum(axis=1)
+            candidates = candidates[top_k_indices(approx, max(k, self.rerank))]
+
+        # Ascending ids read the mapped vectors front to back
+        candidates = np.sort(candidates)
+        scores = self.vectors.take(candidates) @ query
+        order = top_k_indices(scores, k)
+        return candidates[order], scores[order]
+
+    def save(self, path: str) -> None:
+        """Write the index into directory ``path``, folding inserts into the lists."""
+        os.makedirs(path, exist_ok=True)
+        assignments = np.empty(len(self), dtype=np.int32)
+        for list_id in range(self.nlist):
+            assignments[self.list_rows[self.list_offsets[list_id]:self.list_offsets[list_id + 1]]] = list_id
+        for list_id, rows in self.added.items():
+            assignments[rows] = list_id
+        list_rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.nlist))])
+
+        save_array(os.path.join(path, "vectors.npy"), self.vectors.to_array().astype(np.float32))
+        save_array(os.path.join(path, "ann_centroids.npy"), self.centroids)
+        save_array(os.path.join(path, "ann_list_offsets.npy"), list_offsets.astype(np.int64))
+        save_array(os.path.join(path, "ann_list_rows.npy"), list_rows)
+        save_array(os.path.join(path, "ann_deleted.npy"), self.deleted)
+        if self.codes is not None:
+            save_array(os.path.join(path, "ann_codebooks.npy"), self.codebooks)
+            save_array(os.path.join(path, "ann_codes.npy"), self.codes.to_array())
+        with open(os.path.join(path, "ann_meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"type": "ivf", "nlist": self.nlist, "pq": self.codes is not None}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, **kwargs) -> "IVFIndex":
+        """Load an index saved by ``save``; vectors and PQ codes are memory-mapped."""
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "ann_meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            np.load(os.path.join(path, "ann_centroids.npy")),
+            np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, "ann_list_offsets.npy")),
+            np.load(os.path.join(path, "ann_list_rows.npy"), mmap_mode=mode),
+            # Loaded into memory: deletes write to it
+            deleted=np.load(os.path.join(path, "ann_deleted.npy")),
+            codebooks=np.load(os.path.join(path, "ann_codebooks.npy")) if meta["pq"] else None,
+            codes=np.load(os.path.join(path, "ann_codes.npy"), mmap_mode=mode) if meta["pq"] else None,
+            **kwargs
+        )
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "ann_meta.json"))
+
+
+def encode_pq(codebooks: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """8-bit product-quantization codes of ``vectors``, one column per sub-vector."""
+    pq_m, _, sub_dim = codebooks.shape
+    codes = np.empty((vectors.shape[0], pq_m), dtype=np.uint8)
+    for m in range(pq_m):
+        codes[:, m] = _nearest(vectors[:, m * sub_dim:(m + 1) * sub_dim], codebooks[m], inner_product=False)
+    return codes
+
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, k: int = 10, nlist: int = IVF_NLIST,
+              pq_m: int = IVF_PQ_M, nprobes=(1, 2, 4, 8, 16, 32, 64), rerank: int = IVF_RERANK) -> List[Dict]:
+    """Recall@k and mean latency of IVFIndex at each nprobe, against exact search."""
+    vectors = normalize_rows(as_matrix(vectors))
+    queries = normalize_rows(as_matrix(queries))
+
+    started = time.perf_counter()
+    truth = [set(top_k_indices(vectors @ query, k).tolist()) for query in queries]
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    index = IVFIndex.build(vectors, nlist=nlist, pq_m=pq_m, rerank=rerank)
+    rows = [{"nprobe": "exact", "recall": 1.0, "latency_ms": exact_ms}]
+    for nprobe in nprobes:
+        if nprobe > index.nlist:
+            break
+        index.nprobe = nprobe
+        started = time.perf_counter()
+        found = [set(index.search(query, k)[0].tolist()) for query in queries]
+        latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = sum(len(f & t) for f, t in zip(found, truth)) / sum(len(t) for t in truth)
+        rows.append({"nprobe": nprobe, "recall": recall, "latency_ms": latency_ms})
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recall vs latency of the IVF index against exact search")
+    parser.add_argument("--index", help="local index directory whose vectors.npy to use (default: synthetic data)")
+    parser.add_argument("--n", type=int, default=100_000, help="synthetic vectors")
+    parser.add_argument("--dim", type=int, default=256, help="synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=IVF_NLIST)
+    parser.add_argument("--pq-m", type=int, default=IVF_PQ_M)
+    parser.add_argument("--rerank", type=int, default=IVF_RERANK)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index:
+        data = np.load(os.path.join(args.index, "vectors.npy"))
+        # Queries are perturbed copies of indexed vectors
+        picked = data[rng.choice(data.shape[0], size=args.queries, replace=False)]
+        query_set = picked + rng.normal(scale=0.05, size=picked.shape).astype(np.float32)
+    else:
+        # Clustered data, closer to real embeddings than uniform noise
+        centers = rng.normal(size=(1000, args.dim)).astype(np.float32)
+        data = centers[rng.integers(0, 1000, args.n)] + rng.normal(scale=1.0, size=(args.n, args.dim)).astype(np.float32)
+        query_set = centers[rng.integers(0, 1000, args.queries)] + \
+            rng.normal(scale=1.0, size=(args.queries, args.dim)).astype(np.float32)
+
+    print(f"{'nprobe':>8} {'recall@' + str(args.k):>10} {'ms/query':>10}")
+    for row in benchmark(data, query_set, k=args.k, nlist=args.nlist, pq_m=args.pq_m, rerank=args.rerank):
+        print(f"{row['nprobe']:>8} {row['recall']:>10.3f} {row['latency_ms']:>10.3f}")
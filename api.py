@@ -2,68 +2,80 @@ import os
 import logging
 import traceback
 import json
+import csv
+import io
+import time
 import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, make_response
 from flask_cors import CORS
-import logging.handlers
+from logging_setup import configure_logging
 
 # --- Improved Logger Configuration ---
 # Determine log level based on environment
 log_level = logging.DEBUG if os.getenv('FLASK_ENV') != 'production' else logging.INFO
 
-# Configure root logger
+# Request threads only enqueue records; logging_setup's listener thread
+# formats them and writes to the console and the shared logs/api.log
+configure_logging()
 logger = logging.getLogger(__name__)
 logger.setLevel(log_level)
 
-# Create formatter with more detailed information for production
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(process)d - %(thread)d - %(message)s')
-
-# Ensure logs directory exists
-os.makedirs('logs', exist_ok=True)
-
-# Only add handlers if they haven't been added already
-if not logger.handlers:
-    # File Handler with rotation
-    file_handler = logging.handlers.RotatingFileHandler(
-        "logs/api.log", 
-        maxBytes=10485760,  # 10MB
-        backupCount=10
-    )
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
-    # Stream Handler (to console)
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
-
 logger.info(f"Starting application in {os.getenv('FLASK_ENV', 'development')} mode")
 # --- End Logger Configuration ---
 
-from assistant_core import run_chat
-from vote_manager import record_vote, init_db, fetch_votes, get_vote_statistics
+from assistant_core import run_chat, stream_chat, get_evaluation
+from vote_manager import (
+    record_vote, init_db, fetch_vote, fetch_votes, fetch_votes_page, get_vote_statistics,
+    get_accuracy_breakdown, iter_votes, EXPORT_COLUMNS, VoteQueueFull,
+)
+from config import VOTES_PAGE_SIZE, VOTES_MAX_PAGE_SIZE
+import metrics
+from tracing import new_trace_id, start_trace
 
 
 app = Flask(__name__)
 # logger = logging.getLogger(__name__) # Already got logger above
 
-# Configure CORS based on environment
+# Configure CORS based on environment. X-Request-ID carries the trace id, so
+# let the frontend read it.
 if os.getenv('FLASK_ENV') == 'production':
     # For production, only allow requests from the Netlify domain
     # Replace 'your-netlify-app.netlify.app' with your actual Netlify domain
     netlify_domain = os.getenv('NETLIFY_DOMAIN', 'your-netlify-app.netlify.app')
     logger.info(f"Configuring CORS for production, allowing origin: {netlify_domain}")
-    CORS(app, resources={r"/*": {"origins": f"https://{netlify_domain}"}})
+    CORS(app, resources={r"/*": {"origins": f"https://{netlify_domain}"}}, expose_headers=["X-Request-ID"])
 else:
     # For development, allow all origins
     logger.info("Configuring CORS for development, allowing all origins")
-    CORS(app)
+    CORS(app, expose_headers=["X-Request-ID"])
 
 # Initialize the database (use the logger we just configured)
 logger.info("Initializing database...") # This should now log correctly
 init_db() # Assuming init_db doesn't configure logging itself
 logger.info("Database initialized successfully")
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request_duration(response):
+    # Label by route template, not raw path, so /votes/<id> stays one series.
+    # Streamed responses are timed to their first byte.
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_REQUEST_DURATION.labels(endpoint, request.method, str(response.status_code)).observe(
+            time.perf_counter() - start
+        )
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint: per-stage latency, token usage and HTTP latency"""
+    payload, content_type = metrics.render()
+    return Response(payload, content_type=content_type)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for monitoring and container orchestration"""
@@ -75,9 +87,18 @@ def health_check():
 
 @app.route('/chat', methods=['POST']) # Removed /api prefix
 def chat():
+    # Every span below, down to the individual Azure calls, shares this trace
+    # ID; it is returned as X-Request-ID to look the request up afterwards
+    with start_trace("POST /chat") as trace:
+        response = make_response(_answer_chat())
+        trace.set_attribute("http.status_code", response.status_code)
+    response.headers['X-Request-ID'] = trace.trace_id
+    return response
+
+def _answer_chat():
     logger.info("Received /chat request") # Updated log message
     data = request.json
-    logger.debug(f"Request data: {data}")
+    logger.debug("Request data: %s", data)
     
     query = data.get('query', '')
     logger.info(f"Query: {query}")
@@ -88,9 +109,11 @@ def chat():
     
     try:
         logger.info("Calling run_chat function...")
-        result = run_chat(query)
+        result = run_chat(query, async_evaluation=data.get('async_evaluation'))
         logger.info("run_chat completed successfully")
-        logger.debug(f"Result: {json.dumps(result, default=str)[:500]}...")  # Log first 500 chars of result
+        # result is patched up below, so serialise it now, and only when DEBUG is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Result: %.500s...", json.dumps(result, default=str))  # Log first 500 chars of result
         
         # Ensure all required fields are present
         if 'answer' not in result:
@@ -101,7 +124,7 @@ def chat():
             logger.warning("Missing 'sources' field in result")
             result['sources'] = []
             
-        if 'evaluation' not in result:
+        if 'evaluation' not in result and 'evaluation_id' not in result:
             logger.warning("Missing 'evaluation' field in result")
             result['evaluation'] = {"raw_text": "No evaluation available"}
         
@@ -111,23 +134,60 @@ def chat():
         logger.error(traceback.format_exc())
         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
 
-@app.route('/votes', methods=['GET'])
-def get_votes():
-    """Endpoint to retrieve votes with optional filtering and pagination"""
-    logger.info("Received /votes request")
-    
-    # Parse query parameters
-    limit = request.args.get('limit', type=int)
-    offset = request.args.get('offset', 0, type=int)
-    vote_filter = request.args.get('vote')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-sent events version of /chat: answer tokens, then sources, then the evaluation"""
+    logger.info("Received /chat/stream request")
+    data = request.json
+    logger.debug("Request data: %s", data)
 
+    query = data.get('query', '')
+    logger.info(f"Query: {query}")
+
+    if not query:
+        logger.warning("No query provided in request")
+        return jsonify({"error": "No query provided"}), 400
+
+    # The work happens while the body streams, after this view has returned,
+    # so the trace is opened inside the generator under a pre-allocated ID
+    request_id = new_trace_id()
+
+    def events():
+        with start_trace("POST /chat/stream", trace_id=request_id):
+            for event, payload in stream_chat(query, async_evaluation=data.get('async_evaluation')):
+                yield f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # Stop proxies from buffering the stream
+            'X-Request-ID': request_id
+        }
+    )
+
+@app.route('/evaluation/<evaluation_id>', methods=['GET'])
+def evaluation_status(evaluation_id):
+    """Endpoint to poll for an evaluation queued by /chat"""
+    logger.info(f"Received /evaluation request for {evaluation_id}")
+
+    try:
+        evaluation = get_evaluation(evaluation_id)
+        if evaluation is None:
+            return jsonify({"error": "Unknown evaluation id"}), 404
+        return jsonify(evaluation)
+    except Exception as e:
+        logger.error(f"Error fetching evaluation: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+
+def _vote_filter_error(vote_filter, start_date, end_date):
+    """Return a 400 response for invalid vote/date filters, or None if they are valid"""
     if vote_filter and vote_filter not in ['yes', 'no']:
         logger.warning(f"Invalid vote filter: {vote_filter}")
         return jsonify({"error": "Vote filter must be 'yes' or 'no'"}), 400
 
-    # Validate date formats
     for date_label, date_value in [('start_date', start_date), ('end_date', end_date)]:
         if date_value:
             try:
@@ -135,17 +195,149 @@ def get_votes():
             except Exception as e:
                 logger.warning(f"Invalid {date_label} format: {date_value} - {e}")
                 return jsonify({"error": f"{date_label} must be in YYYY-MM-DD format"}), 400
+    return None
+
+@app.route('/votes', methods=['GET'])
+def get_votes():
+    """Endpoint to retrieve votes with optional filtering and pagination
+
+    Pages are cursor-based: pass the previous response's next_cursor as
+    ?cursor= to get the next page. ?offset= is still accepted for old clients.
+    bot_response and evaluation_json are only included with ?include=payload;
+    /votes/<id> returns them for a single vote.
+    """
+    logger.info("Received /votes request")
+    
+    # Parse query parameters
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', type=int)
+    cursor = request.args.get('cursor')
+    vote_filter = request.args.get('vote')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    include_payload = request.args.get('include') == 'payload'
+
+    filter_error = _vote_filter_error(vote_filter, start_date, end_date)
+    if filter_error:
+        return filter_error
+
+    if limit is not None and limit <= 0:
+        logger.warning(f"Invalid limit: {limit}")
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    page_size = min(limit or VOTES_PAGE_SIZE, VOTES_MAX_PAGE_SIZE)
 
     try:
-        logger.info(f"Fetching votes with limit={limit}, offset={offset}, vote_filter={vote_filter}, start_date={start_date}, end_date={end_date}")
-        votes = fetch_votes(limit=limit, offset=offset, vote_filter=vote_filter, start_date=start_date, end_date=end_date)
+        if offset is not None:
+            logger.info(f"Fetching votes with limit={page_size}, offset={offset}, vote_filter={vote_filter}, start_date={start_date}, end_date={end_date}")
+            votes = fetch_votes(limit=page_size, offset=offset, vote_filter=vote_filter, start_date=start_date, end_date=end_date, include_payload=include_payload)
+            logger.info(f"Retrieved {len(votes)} votes")
+            return jsonify({"votes": votes})
+
+        logger.info(f"Fetching votes with limit={page_size}, cursor={cursor}, vote_filter={vote_filter}, start_date={start_date}, end_date={end_date}")
+        try:
+            votes, next_cursor = fetch_votes_page(page_size, cursor=cursor, vote_filter=vote_filter, start_date=start_date, end_date=end_date, include_payload=include_payload)
+        except ValueError as e:
+            logger.warning(str(e))
+            return jsonify({"error": "Invalid cursor"}), 400
         logger.info(f"Retrieved {len(votes)} votes")
-        return jsonify({"votes": votes})
+        return jsonify({"votes": votes, "next_cursor": next_cursor})
     except Exception as e:
         logger.error(f"Error fetching votes: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
 
+@app.route('/votes/<int:vote_id>', methods=['GET'])
+def get_vote(vote_id):
+    """Endpoint to retrieve one vote with its full response and evaluation"""
+    logger.info(f"Received /votes/{vote_id} request")
+
+    try:
+        vote = fetch_vote(vote_id)
+        if vote is None:
+            return jsonify({"error": "Unknown vote id"}), 404
+        return jsonify(vote)
+    except Exception as e:
+        logger.error(f"Error fetching vote: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+
+@app.route('/votes/export', methods=['GET'])
+def export_votes():
+    """Endpoint to download every matching vote as NDJSON (default) or CSV
+
+    Rows are streamed from the database as they are read, so memory use does
+    not grow with the number of votes. Accepts the same vote, start_date and
+    end_date filters as /votes.
+    """
+    logger.info("Received /votes/export request")
+
+    export_format = request.args.get('format', 'ndjson')
+    vote_filter = request.args.get('vote')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    if export_format not in ['ndjson', 'csv']:
+        logger.warning(f"Invalid export format: {export_format}")
+        return jsonify({"error": "format must be 'ndjson' or 'csv'"}), 400
+
+    filter_error = _vote_filter_error(vote_filter, start_date, end_date)
+    if filter_error:
+        return filter_error
+
+    def rows():
+        count = 0
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS) if export_format == 'csv' else None
+        if writer:
+            writer.writeheader()
+        try:
+            for vote in iter_votes(vote_filter=vote_filter, start_date=start_date, end_date=end_date):
+                if writer:
+                    writer.writerow(vote)
+                else:
+                    buffer.write(json.dumps(vote, default=str) + "\n")
+                count += 1
+                # Hand the WSGI server reasonably sized chunks
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+            logger.info(f"Exported {count} votes as {export_format}")
+        except Exception as e:
+            # Headers are already sent; all we can do is log and end the stream
+            logger.error(f"Error exporting votes after {count} rows: {str(e)}")
+            logger.error(traceback.format_exc())
+
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    return Response(
+        stream_with_context(rows()),
+        mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=votes_export.{extension}'}
+    )
+
+@app.route('/votes/accuracy', methods=['GET'])
+def get_accuracy():
+    """Endpoint to retrieve evaluator accuracy broken down by day and response type"""
+    logger.info("Received /votes/accuracy request")
+
+    vote_filter = request.args.get('vote')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    filter_error = _vote_filter_error(vote_filter, start_date, end_date)
+    if filter_error:
+        return filter_error
+
+    try:
+        breakdown = get_accuracy_breakdown(start_date=start_date, end_date=end_date, vote_filter=vote_filter)
+        logger.info(f"Retrieved accuracy breakdown with {len(breakdown)} rows")
+        return jsonify({"breakdown": breakdown})
+    except Exception as e:
+        logger.error(f"Error fetching accuracy breakdown: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+
 @app.route('/votes/statistics', methods=['GET'])
 def get_statistics():
     """Endpoint to retrieve vote statistics"""
@@ -165,25 +357,42 @@ def get_statistics():
 def feedback():
     logger.info("Received /feedback request") # Updated log message
     data = request.json
-    logger.debug(f"Feedback data: {data}")
+    logger.debug("Feedback data: %s", data)
     
-    required_fields = ['user_query', 'bot_response', 'evaluation_json', 'vote']
+    # evaluation_json may be left out when evaluation_id names a queued evaluation
+    required_fields = ['user_query', 'bot_response', 'vote']
+    if 'evaluation_id' not in data:
+        required_fields.append('evaluation_json')
     for field in required_fields:
         if field not in data:
             logger.warning(f"Missing required field in feedback: {field}")
             return jsonify({"error": f"Missing required field: {field}"}), 400
     
     try:
+        evaluation_json = data.get('evaluation_json')
+        if evaluation_json in (None, 'null') and data.get('evaluation_id'):
+            # The vote can beat the UI's poll; attach the evaluation if it has finished
+            queued = get_evaluation(data['evaluation_id'])
+            if queued is not None and queued['evaluation'] is not None:
+                evaluation_json = json.dumps(queued['evaluation'])
+            else:
+                logger.warning("Evaluation %s not available for feedback", data['evaluation_id'])
+        if evaluation_json is None:
+            evaluation_json = 'null'
+
         logger.info(f"Recording vote: {data['vote']}")
         record_vote(
             data['user_query'],
             data['bot_response'],
-            data['evaluation_json'],
+            evaluation_json,
             data['vote'],
             data.get('comment', '')
         )
         logger.info("Vote recorded successfully")
         return jsonify({"success": True})
+    except VoteQueueFull:
+        logger.warning("Vote queue full, rejecting feedback")
+        return jsonify({"error": "Too many pending votes, please retry"}), 503
     except Exception as e:
         logger.error(f"Error recording vote: {str(e)}")
         logger.error(traceback.format_exc())
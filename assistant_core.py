@@ -6,8 +6,15 @@ import logging
 import traceback
 import datetime
 import json
-from rag_assistant import AzureRAGAssistant
+from rag_assistant import ANSWER_ERROR_TEXT, AzureRAGAssistant
+from response_cache import SemanticResponseCache
+from pipeline import PipelineExecutor, Stage
+from evaluation_queue import EvaluationQueue, EvaluationQueueFull
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from vote_manager import init_db, record_vote
+from metrics import record_usage, track_stage
+from tracing import span
 
 
 
@@ -26,9 +33,9 @@ subscription_key = OPENAI_KEY
 api_version = "2024-12-01-preview" # Or fetch from config if defined there
 
 # Log the configuration being used
-logging.info(f"Using endpoint: {endpoint}")
-logging.info(f"Using deployment: {deployment}")
-logging.info(f"API key set: {'Yes' if subscription_key else 'No'}")
+logging.info("Using endpoint: %s", endpoint)
+logging.info("Using deployment: %s", deployment)
+logging.info("API key set: %s", 'Yes' if subscription_key else 'No')
 
 # Ensure endpoint starts with https:// (Optional: Add check if needed, but assume .env is correct)
 # if endpoint and not endpoint.startswith(('http://', 'https://')):
@@ -49,35 +56,19 @@ except Exception as e:
 
 rag_assistant = AzureRAGAssistant(client)
 
+response_cache = None
+if RESPONSE_CACHE_SIZE > 0:
+    response_cache = SemanticResponseCache(
+        embed=rag_assistant.generate_embedding,
+        max_size=RESPONSE_CACHE_SIZE,
+        ttl=RESPONSE_CACHE_TTL,
+        similarity_threshold=RESPONSE_CACHE_THRESHOLD
+    )
 
-def run_chat(query):
-    try:
-        logging.info(f"Starting run_chat with query: {query}")
-        
-        # Grab context manually from rag_assistant
-        logging.info("Searching knowledge base...")
-        search_results = rag_assistant.search_knowledge_base(query)
-        logging.info(f"Found {len(search_results)} search results")
-        
-        logging.info("Preparing context from search results...")
-        context, source_map = rag_assistant._prepare_context(search_results)
-        logging.info(f"Context prepared with {len(source_map)} sources")
-        
-        logging.info("Generating answer...")
-        answer = rag_assistant._generate_answer(query, context, source_map)
-        logging.info(f"Answer generated: {answer[:100]}...")  # Log first 100 chars
-        
-        logging.info("Filtering cited sources...")
-        cited_sources = rag_assistant._filter_cited_sources(answer, source_map)
-        logging.info(f"Found {len(cited_sources)} cited sources")
-        
-        logging.info("Getting recommendations...")
-        recommendations = rag_assistant.get_recommendations(search_results)
-        
-        # ----- Evaluate the interaction -----
-        # Evaluation step using the actual context
-        logging.info("Starting evaluation...")
-        evaluation_system_prompt = """
+pipeline = PipelineExecutor(ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="rag-pipeline"))
+
+
+EVALUATION_SYSTEM_PROMPT = """
 You are a forensic LLM evaluator. Your job is to assess whether the model's answer is factually supported by the provided context.
 
 You must be STRICT. The model's answer should ONLY include facts that are clearly and explicitly stated in the context.
@@ -129,58 +120,321 @@ Return ONLY the following JSON structure — no Markdown, no formatting:
 }
 """
 
-        evaluation_messages = [
-    {
-        "role": "system",
-        "content": evaluation_system_prompt.strip()
-    },
-    {
-        "role": "user",
-        "content": f"Context:\n{context}\n\nUser Question: {query}\n\nModel Answer: {answer}"
-    }
-]
+def _evaluation_messages(query, context, answer):
+    return [
+        {
+            "role": "system",
+            "content": EVALUATION_SYSTEM_PROMPT.strip()
+        },
+        {
+            "role": "user",
+            "content": f"Context:\n{context}\n\nUser Question: {query}\n\nModel Answer: {answer}"
+        }
+    ]
+
+
+def _parse_evaluation(eval_text):
+    try:
+        logging.info("Parsing evaluation JSON...")
+        evaluation = json.loads(eval_text)
+        logging.info("Evaluation JSON parsed successfully")
+    except json.JSONDecodeError as json_err:
+        logging.error("Failed to parse evaluation JSON: %s", json_err)
+        logging.error("Raw evaluation text: %s", eval_text)
+        evaluation = {"raw_text": eval_text, "error": f"Failed to parse evaluation JSON: {str(json_err)}"}
+    return evaluation
+
+
+def _request_evaluation(query, context, answer):
+    """Ask the evaluator model to fact-check ``answer`` against ``context``.
+
+    Raises if the request fails; evaluate_answer is the version that reports
+    the failure in the returned dict instead.
+    """
+    logging.info("Starting evaluation...")
+    logging.info("Sending evaluation request to Azure OpenAI...")
+    with track_stage("evaluation"), span("chat.completions.create", kind="client", purpose="evaluation"):
+        eval_response = client.chat.completions.create(
+            model=deployment,
+            messages=_evaluation_messages(query, context, answer),
+            temperature=0.1,
+            max_tokens=800
+        )
+    record_usage("evaluation", eval_response)
+    logging.info("Received evaluation response")
+    eval_text = eval_response.choices[0].message.content.strip()
+    logging.debug("Evaluation text: %.200s...", eval_text)  # Log first 200 chars
+    return _parse_evaluation(eval_text)
+
+
+def evaluate_answer(query, context, answer):
+    """Ask the evaluator model to fact-check ``answer`` against ``context``."""
+    try:
+        return _request_evaluation(query, context, answer)
+    except Exception as eval_err:
+        logging.error("Error during evaluation request: %s", eval_err)
+        return {"error": f"Evaluation failed: {str(eval_err)}"}
+
+
+_evaluation_queue = None
+_evaluation_queue_lock = threading.Lock()
+
+
+def get_evaluation_queue():
+    """The process's EvaluationQueue, created on first use.
+
+    Creating it opens EVALUATION_DB and starts worker threads, so it must not
+    happen at import time (or before a gunicorn fork).
+    """
+    global _evaluation_queue
+    if _evaluation_queue is None:
+        with _evaluation_queue_lock:
+            if _evaluation_queue is None:
+                _evaluation_queue = EvaluationQueue(
+                    evaluate_answer,
+                    db_path=EVALUATION_DB,
+                    max_workers=EVALUATION_WORKERS,
+                    max_pending=EVALUATION_QUEUE_SIZE
+                )
+    return _evaluation_queue
+
+
+def _build_chat_stages(query, evaluate=True):
+    def search():
+        # Grab context manually from rag_assistant
+        logging.info("Searching knowledge base...")
+        search_results = rag_assistant.search_knowledge_base(query)
+        logging.info("Found %d search results", len(search_results))
+        return search_results
+
+    def prepared(search):
+        logging.info("Preparing context from search results...")
+        context, source_map = rag_assistant._prepare_context(search, query)
+        logging.info("Context prepared with %d sources", len(source_map))
+        return context, source_map
+
+    def answer(prepared):
+        logging.info("Generating answer...")
+        context, _ = prepared
+        answer = rag_assistant._complete_answer(query, context)
+        logging.info("Answer generated (%d chars)", len(answer))
+        logging.debug("Answer: %.100s...", answer)  # Log first 100 chars
+        return answer
+
+    def sources(answer, prepared):
+        logging.info("Filtering cited sources...")
+        cited_sources = rag_assistant._filter_cited_sources(answer, prepared[1])
+        logging.info("Found %d cited sources", len(cited_sources))
+        return cited_sources
+
+    def recommendations(search):
+        logging.info("Getting recommendations...")
+        return rag_assistant.get_recommendations(search)
+
+    def evaluation(answer, prepared):
+        # Raise, so the failure is counted and on_error supplies the fallback
+        return _request_evaluation(query, prepared[0], answer)
+
+    # Recommendations only need the search results, and the evaluation runs
+    # alongside source filtering once the answer exists
+    stages = [
+        Stage("search", search, timeout=SEARCH_STAGE_TIMEOUT),
+        Stage("prepared", prepared, requires=["search"]),
+        Stage("recommendations", recommendations, requires=["search"], on_error=lambda e: []),
+        Stage("answer", answer, requires=["prepared"], timeout=ANSWER_STAGE_TIMEOUT,
+              on_error=lambda e: ANSWER_ERROR_TEXT),
+        Stage("sources", sources, requires=["answer", "prepared"]),
+    ]
+    if evaluate:
+        stages.append(Stage("evaluation", evaluation, requires=["answer", "prepared"], timeout=EVALUATION_STAGE_TIMEOUT,
+                            on_error=lambda e: {"error": f"Evaluation failed: {str(e)}"}))
+    return stages
+
+
+def _cacheable(pending):
+    """Whether the pipeline's answer is worth caching: the search found
+    something and the answer stage did not fall back to ANSWER_ERROR_TEXT."""
+    return response_cache is not None and bool(pending["search"]) and "answer" not in pending.errors
+
+
+def start_chat(query, evaluate=True, detach_evaluation=False):
+    """Run the chat pipeline.
+
+    Returns ``(result, pending)``, where ``pending`` holds every stage's
+    result. The evaluation runs alongside source filtering and ``result``
+    includes it. With ``detach_evaluation`` start_chat returns as soon as the
+    answer is ready instead, leaving "evaluation" out of ``result``;
+    ``pending.wait("evaluation")`` returns it once the evaluator finishes.
+    With ``evaluate=False`` the evaluator is not run at all. On a cache hit or
+    an error, ``pending`` is None and ``result`` is already complete.
+    """
+    try:
+        logging.info("Starting run_chat with query: %s", query)
+
+        if response_cache is not None:
+            cached_result = response_cache.get(query)
+            if cached_result is not None:
+                logging.info("Returning cached response")
+                return cached_result, None
+
+        detach = ["evaluation"] if evaluate and detach_evaluation else []
+        pending = pipeline.run(_build_chat_stages(query, evaluate), detach=detach)
+        context, _ = pending["prepared"]
+        result = {
+            "answer": pending["answer"],
+            "sources": pending["sources"],
+            "recommendations": pending["recommendations"],
+            "context": context
+        }
+
+        # Only cache complete answers; failures should be retried next time
+        if not evaluate:
+            return result, pending
+
+        if not detach:
+            result["evaluation"] = pending["evaluation"]
+            if _cacheable(pending) and "error" not in result["evaluation"]:
+                response_cache.put(query, dict(result))
+            return result, pending
+
+        if _cacheable(pending):
+            snapshot = dict(result)
+
+            def cache_result(future):
+                # Runs on the pipeline's thread; pending.wait() belongs to the
+                # caller and calling it here too would race it
+                if future.cancelled() or future.exception() is not None:
+                    return
+                evaluation = future.result()
+                if "error" not in evaluation:
+                    response_cache.put(query, dict(snapshot, evaluation=evaluation))
+
+            pending.detached["evaluation"].add_done_callback(cache_result)
+
+        return result, pending
+
+    except Exception as e:
+        logging.error("❌ Error in run_chat: Connection error or processing failure.")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception args: %s", e.args)
+        logging.error("Stack trace:\n%s", traceback.format_exc())
+        return {"error": str(e)}, None
+
+
+def run_chat(query, async_evaluation=None):
+    """Answer ``query``.
+
+    With ``async_evaluation`` (default: ASYNC_EVALUATION) the result carries an
+    "evaluation_id" instead of an "evaluation"; poll ``get_evaluation`` for it.
+    """
+    if async_evaluation is None:
+        async_evaluation = ASYNC_EVALUATION
+
+    if async_evaluation:
+        result, pending = start_chat(query, evaluate=False)
+        if pending is None:
+            return result
+        snapshot = dict(result)
+        cacheable = _cacheable(pending)
+
+        def cache_result(evaluation):
+            if cacheable and "error" not in evaluation:
+                response_cache.put(query, dict(snapshot, evaluation=evaluation))
 
-        logging.info("Sending evaluation request to Azure OpenAI...")
         try:
-            eval_response = client.chat.completions.create(
-                model=deployment,
-                messages=evaluation_messages,
-                temperature=0.1,
-                max_tokens=800
+            result["evaluation_id"] = get_evaluation_queue().submit(
+                query, result["context"], result["answer"], on_complete=cache_result
             )
-            logging.info("Received evaluation response")
-            eval_text = eval_response.choices[0].message.content.strip()
-            logging.debug(f"Evaluation text: {eval_text[:200]}...")  # Log first 200 chars
-            
-            try:
-                logging.info("Parsing evaluation JSON...")
-                evaluation = json.loads(eval_text)
-                logging.info("Evaluation JSON parsed successfully")
-            except json.JSONDecodeError as json_err:
-                logging.error(f"Failed to parse evaluation JSON: {str(json_err)}")
-                logging.error(f"Raw evaluation text: {eval_text}")
-                evaluation = {"raw_text": eval_text, "error": f"Failed to parse evaluation JSON: {str(json_err)}"}
-        except Exception as eval_err:
-            logging.error(f"Error during evaluation request: {str(eval_err)}")
-            evaluation = {"error": f"Evaluation failed: {str(eval_err)}"}
+            logging.info("run_chat completed successfully, evaluation queued")
+            return result
+        except EvaluationQueueFull:
+            logging.warning("Evaluation queue full, evaluating inline")
+            result["evaluation"] = evaluate_answer(query, result["context"], result["answer"])
+            cache_result(result["evaluation"])
+            return result
+
+    result, pending = start_chat(query)
+    if pending is not None:
+        logging.info("run_chat completed successfully")
+    return result
+
+
+def stream_chat(query, async_evaluation=None):
+    """Generator version of run_chat yielding ``(event, data)`` pairs.
+
+    Events arrive in order: "token" for each piece of the answer, "sources"
+    once the answer is complete, then "evaluation" (or "evaluation_id" in
+    async mode), and finally "done". A failure, even one partway through the
+    answer, ends the stream with a single "error" and nothing is cached.
+    """
+    if async_evaluation is None:
+        async_evaluation = ASYNC_EVALUATION
+    try:
+        logging.info("Starting stream_chat with query: %s", query)
+
+        if response_cache is not None:
+            cached_result = response_cache.get(query)
+            if cached_result is not None:
+                logging.info("Returning cached response")
+                yield "token", {"text": cached_result["answer"]}
+                yield "sources", {"sources": cached_result["sources"], "recommendations": cached_result["recommendations"]}
+                yield "evaluation", {"evaluation": cached_result["evaluation"]}
+                yield "done", {}
+                return
+
+        logging.info("Searching knowledge base...")
+        search_results = rag_assistant.search_knowledge_base(query)
+        logging.info("Found %d search results", len(search_results))
+        context, source_map = rag_assistant._prepare_context(search_results, query)
+        recommendations = rag_assistant.get_recommendations(search_results)
+
+        logging.info("Streaming answer...")
+        pieces = []
+        for text in rag_assistant.stream_answer(query, context, source_map):
+            pieces.append(text)
+            yield "token", {"text": text}
+        answer = "".join(pieces).strip()
+
+        cited_sources = rag_assistant._filter_cited_sources(answer, source_map)
+        yield "sources", {"sources": cited_sources, "recommendations": recommendations}
 
         result = {
             "answer": answer,
             "sources": cited_sources,
             "recommendations": recommendations,
-            "evaluation": evaluation,
             "context": context
         }
-        
-        logging.info("run_chat completed successfully")
-        return result
+
+        def cache_result(evaluation):
+            if response_cache is not None and search_results and "error" not in evaluation:
+                response_cache.put(query, dict(result, evaluation=evaluation))
+
+        evaluation = None
+        if async_evaluation:
+            try:
+                evaluation_id = get_evaluation_queue().submit(query, context, answer, on_complete=cache_result)
+                yield "evaluation_id", {"evaluation_id": evaluation_id}
+            except EvaluationQueueFull:
+                logging.warning("Evaluation queue full, evaluating inline")
+                evaluation = evaluate_answer(query, context, answer)
+        else:
+            evaluation = evaluate_answer(query, context, answer)
+        if evaluation is not None:
+            cache_result(evaluation)
+            yield "evaluation", {"evaluation": evaluation}
+
+        logging.info("stream_chat completed successfully")
+        yield "done", {}
 
     except Exception as e:
-        logging.error("❌ Error in run_chat: Connection error or processing failure.")
-        logging.error(f"Exception type: {type(e).__name__}")
-        logging.error(f"Exception args: {e.args}")
-        logging.error("Stack trace:\n" + traceback.format_exc())
-        return {"error": str(e)}
+        logging.error("Error in stream_chat: %s", e)
+        logging.error("Stack trace:\n%s", traceback.format_exc())
+        yield "error", {"error": str(e)}
+
+
+def get_evaluation(evaluation_id):
+    """Look up a queued evaluation; None if the id is unknown or expired."""
+    return get_evaluation_queue().get(evaluation_id)
 
 if __name__ == "__main__":
     # Initialize database first
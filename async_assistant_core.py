@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import traceback
+
+from openai import AsyncAzureOpenAI
+
+from async_rag_assistant import AsyncAzureRAGAssistant
+from assistant_core import (
+    _evaluation_messages,
+    _parse_evaluation,
+    api_version,
+    deployment,
+    endpoint,
+    get_evaluation_queue,
+    rag_assistant as sync_rag_assistant,
+    response_cache,
+    subscription_key,
+)
+from evaluation_queue import EvaluationQueueFull
+from metrics import record_error, record_usage, track_stage
+from rag_assistant import ANSWER_ERROR_TEXT
+from tracing import span
+from config import (
+    ASYNC_EVALUATION,
+    SEARCH_STAGE_TIMEOUT,
+    ANSWER_STAGE_TIMEOUT,
+    EVALUATION_STAGE_TIMEOUT,
+)
+
+# asyncio counterpart of assistant_core: same pipeline, same response cache and
+# evaluation queue, but the OpenAI and search calls never block a thread.
+
+try:
+    client = AsyncAzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=subscription_key,
+    )
+    logging.info("AsyncAzureOpenAI client initialized successfully.")
+except Exception as e:
+    logging.error("Failed to initialize AsyncAzureOpenAI client", exc_info=True)
+    raise
+
+# Share assistant_core's retriever: with SEARCH_BACKEND=local it has already
+# loaded the index, and searching it is read-only
+rag_assistant = AsyncAzureRAGAssistant(client, retriever=sync_rag_assistant.retriever)
+
+
+async def evaluate_answer(query, context, answer):
+    """Async version of assistant_core.evaluate_answer."""
+    logging.info("Sending evaluation request to Azure OpenAI...")
+    try:
+        with track_stage("evaluation"), span("chat.completions.create", kind="client", purpose="evaluation"):
+            eval_response = await client.chat.completions.create(
+                model=deployment,
+                messages=_evaluation_messages(query, context, answer),
+                temperature=0.1,
+                max_tokens=800
+            )
+        record_usage("evaluation", eval_response)
+        logging.info("Received evaluation response")
+        eval_text = eval_response.choices[0].message.content.strip()
+        logging.debug("Evaluation text: %.200s...", eval_text)  # Log first 200 chars
+        evaluation = _parse_evaluation(eval_text)
+    except Exception as eval_err:
+        logging.error("Error during evaluation request: %s", eval_err)
+        evaluation = {"error": f"Evaluation failed: {str(eval_err)}"}
+    return evaluation
+
+
+async def run_chat(query, async_evaluation=None):
+    """Async version of assistant_core.run_chat with the same result shape."""
+    if async_evaluation is None:
+        async_evaluation = ASYNC_EVALUATION
+    try:
+        logging.info("Starting async run_chat with query: %s", query)
+
+        # The search embeds the query too; the embedding cache serves it twice
+        query_embedding = await rag_assistant.generate_embedding(query)
+        if response_cache is not None:
+            cached_result = response_cache.get(query, query_embedding=query_embedding, embed=False)
+            if cached_result is not None:
+                logging.info("Returning cached response")
+                return cached_result
+
+        logging.info("Searching knowledge base...")
+        search_results = await asyncio.wait_for(rag_assistant.search_knowledge_base(query), SEARCH_STAGE_TIMEOUT)
+        logging.info("Found %d search results", len(search_results))
+
+        context, source_map = rag_assistant._prepare_context(search_results, query)
+        recommendations = rag_assistant.get_recommendations(search_results)
+
+        logging.info("Generating answer...")
+        # Like the sync pipeline's answer stage: a failure or timeout is answered
+        # with ANSWER_ERROR_TEXT, which must not be cached
+        answered = False
+        try:
+            answer = await asyncio.wait_for(rag_assistant._complete_answer(query, context), ANSWER_STAGE_TIMEOUT)
+            answered = True
+        except asyncio.TimeoutError:
+            logging.error("Answer generation timed out after %ss", ANSWER_STAGE_TIMEOUT)
+            record_error("answer")
+            answer = ANSWER_ERROR_TEXT
+        except Exception as e:
+            logging.error("Failed to generate answer: %s", e, exc_info=True)
+            answer = ANSWER_ERROR_TEXT
+        logging.info("Answer generated (%d chars)", len(answer))
+        logging.debug("Answer: %.100s...", answer)  # Log first 100 chars
+
+        result = {
+            "answer": answer,
+            "sources": rag_assistant._filter_cited_sources(answer, source_map),
+            "recommendations": recommendations,
+            "context": context
+        }
+        snapshot = dict(result)
+
+        def cache_result(evaluation):
+            if response_cache is not None and search_results and answered and "error" not in evaluation:
+                response_cache.put(query, dict(snapshot, evaluation=evaluation), query_embedding=query_embedding)
+
+        if async_evaluation:
+            try:
+                # Creating the queue and inserting its row are SQLite I/O
+                result["evaluation_id"] = await asyncio.to_thread(
+                    lambda: get_evaluation_queue().submit(query, context, answer, on_complete=cache_result)
+                )
+                logging.info("async run_chat completed successfully, evaluation queued")
+                return result
+            except EvaluationQueueFull:
+                logging.warning("Evaluation queue full, evaluating inline")
+
+        try:
+            result["evaluation"] = await asyncio.wait_for(
+                evaluate_answer(query, context, answer), EVALUATION_STAGE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            result["evaluation"] = {"error": f"Evaluation failed: timed out after {EVALUATION_STAGE_TIMEOUT}s"}
+        cache_result(result["evaluation"])
+
+        logging.info("async run_chat completed successfully")
+        return result
+
+    except Exception as e:
+        logging.error("❌ Error in async run_chat: Connection error or processing failure.")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Stack trace:\n%s", traceback.format_exc())
+        return {"error": str(e) or type(e).__name__}
+
+
+async def close():
+    await rag_assistant.close()
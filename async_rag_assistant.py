@@ -0,0 +1,247 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.models import VectorizedQuery
+
+from diversity import diversify
+from metrics import record_usage, track_stage
+from tracing import span
+from rag_assistant import ANSWER_ERROR_TEXT, AzureRAGAssistant
+from config import RERANK_RESULTS
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAzureRAGAssistant(AzureRAGAssistant):
+    """asyncio version of AzureRAGAssistant for use with AsyncAzureOpenAI.
+
+    Every method that does network I/O is a coroutine here; prompt building,
+    context preparation and source filtering are inherited unchanged. Must be
+    used from a single event loop, since the pooled search session is bound
+    to the loop it was created on. The embedding cache's SQLite tier is read
+    and written in a worker thread.
+    """
+
+    def __init__(self, client, retriever=None):
+        super().__init__(client, retriever)
+        self._async_search_state: Optional[Tuple[Tuple, SearchClient]] = None
+        # Created on first use so it binds to the serving event loop
+        self._async_search_lock: Optional[asyncio.Lock] = None
+        # Searches in flight per client; a replaced client is closed by its last user
+        self._search_client_users: Dict[SearchClient, int] = {}
+        self._retired_search_clients: Set[SearchClient] = set()
+
+    def _search_lock(self) -> asyncio.Lock:
+        if self._async_search_lock is None:
+            self._async_search_lock = asyncio.Lock()
+        return self._async_search_lock
+
+    async def generate_embedding(self, text: str) -> Optional[List[float]]:
+        if not text:
+            logger.warning("Empty text provided for embedding generation")
+            return None
+        return (await self.generate_embeddings([text]))[0]
+
+    async def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        embeddings, batches = await asyncio.to_thread(self._embedding_batches, texts)
+
+        async def embed_batch(batch):
+            try:
+                with track_stage("embedding"), span("embeddings.create", kind="client", inputs=len(batch)):
+                    response = await self.client.embeddings.create(
+                        input=[text for _, text in batch],
+                        model=self.embedding_deployment
+                    )
+                record_usage("embedding", response)
+                for item in response.data:
+                    embeddings[batch[item.index][0]] = item.embedding
+                if self.embedding_cache is not None:
+                    await asyncio.to_thread(self.embedding_cache.put_many, [(text, embeddings[i]) for i, text in batch])
+            except Exception as e:
+                logger.error(f"Embedding generation error for batch of {len(batch)}: {e}")
+
+        # Batches are independent, so send them concurrently
+        await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        return embeddings
+
+    async def rerank_results(self, results: List[Dict], query: str, top_k: Optional[int] = None,
+                             similarity_threshold: Optional[float] = None) -> List[Dict]:
+        if not results:
+            return []
+        embeddings = await self.generate_embeddings([query] + [result.get('chunk', '') for result in results])
+        return self._rank_results(results, embeddings, top_k, similarity_threshold)
+
+    async def filter_results(self, results: List[Dict], query: str, similarity_threshold: float = 0.7) -> List[Dict]:
+        return await self.rerank_results(results, query, similarity_threshold=similarity_threshold)
+
+    def _build_async_search_client(self) -> SearchClient:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.search_pool_maxsize)
+        )
+        transport = AioHttpTransport(session=session, session_owner=True)
+        logger.info(f"Creating pooled async SearchClient for index '{self.search_index}' (pool size {self.search_pool_maxsize})")
+        return SearchClient(
+            endpoint=f"https://{self.search_endpoint}.search.windows.net",
+            index_name=self.search_index,
+            credential=AzureKeyCredential(self.search_key),
+            transport=transport
+        )
+
+    async def get_search_client(self) -> SearchClient:
+        key = self._search_client_key()
+        state = self._async_search_state
+        if state is not None and state[0] == key:
+            return state[1]
+        async with self._search_lock():
+            state = self._async_search_state
+            if state is None or state[0] != key:
+                state = (key, self._build_async_search_client())
+                self._async_search_state = state
+            return state[1]
+
+    async def reset_search_client(self, stale_client: Optional[SearchClient] = None) -> None:
+        """Discard the shared SearchClient so the next call builds a fresh one.
+
+        Other searches may still be reading results on its session, so it is
+        closed only once the last of them finishes.
+        """
+        async with self._search_lock():
+            state = self._async_search_state
+            if state is not None and (stale_client is None or state[1] is stale_client):
+                self._async_search_state = None
+                if self._search_client_users.get(state[1]):
+                    self._retired_search_clients.add(state[1])
+                else:
+                    await state[1].close()
+
+    async def _run_counted_search(self, search_client: SearchClient, query: str,
+                                  vector_query: VectorizedQuery) -> List[Dict]:
+        users = self._search_client_users
+        users[search_client] = users.get(search_client, 0) + 1
+        try:
+            return await self._run_search(search_client, query, vector_query)
+        finally:
+            users[search_client] -= 1
+            if not users[search_client]:
+                del users[search_client]
+                if search_client in self._retired_search_clients:
+                    self._retired_search_clients.discard(search_client)
+                    await search_client.close()
+
+    async def _run_search(self, search_client: SearchClient, query: str, vector_query: VectorizedQuery) -> List[Dict]:
+        with span("SearchClient.search", kind="client", index=self.search_index):
+            results = await search_client.search(
+                search_text=query,
+                vector_queries=[vector_query],
+                top=10,
+                select=["chunk", "title"]
+            )
+            processed_results = []
+            async for result in results:
+                title = result.get("title", "Untitled Document")
+                chunk = result.get("chunk", "")
+                processed_results.append({
+                    "chunk": chunk.strip(),
+                    "title": title,
+                    "relevance": 1.0
+                })
+            return processed_results
+
+    async def search_knowledge_base(self, query: str) -> List[Dict]:
+        results = await self._search(query)
+        if RERANK_RESULTS and results:
+            results = await self.rerank_results(results, query) or results
+        with span("diversify", hits=len(results)):
+            return diversify(results)
+
+    async def _search(self, query: str) -> List[Dict]:
+        try:
+            query_embedding = await self.generate_embedding(query)
+            if not query_embedding:
+                return []
+            if self.retriever is not None:
+                # Local retrieval is CPU-bound; keep it off the event loop
+                with track_stage("search"), span("retriever.search", retriever=type(self.retriever).__name__):
+                    return await asyncio.to_thread(self.retriever.search, query, query_embedding, 10)
+            vector_query = VectorizedQuery(
+                vector=query_embedding,
+                k_nearest_neighbors=10,
+                fields=self.vector_field
+            )
+            search_client = await self.get_search_client()
+            with track_stage("search"):
+                try:
+                    return await self._run_counted_search(search_client, query, vector_query)
+                except (ServiceRequestError, ServiceResponseError) as e:
+                    logger.warning(f"Search connection error, rebuilding SearchClient: {e}")
+                    await self.reset_search_client(search_client)
+                    return await self._run_counted_search(await self.get_search_client(), query, vector_query)
+        except Exception as e:
+            logger.error(f"Knowledge base search error: {e}")
+            return []
+
+    async def _complete_answer(self, query: str, context: str) -> str:
+        with track_stage("answer"), span("chat.completions.create", kind="client", purpose="answer"):
+            response = await self.client.chat.completions.create(
+                model=self.chat_deployment,
+                messages=self._answer_messages(query, context),
+                temperature=0.2,
+                max_tokens=800
+            )
+        record_usage("answer", response)
+        return response.choices[0].message.content.strip()
+
+    async def _generate_answer(self, query: str, context: str, source_map: Dict) -> str:
+        try:
+            return await self._complete_answer(query, context)
+        except Exception as e:
+            logger.error(f"Failed to generate answer: {e}", exc_info=True)
+            return ANSWER_ERROR_TEXT
+
+    async def stream_answer(self, query: str, context: str, source_map: Dict) -> AsyncIterator[str]:
+        try:
+            with track_stage("answer"), span("chat.completions.create", kind="client", purpose="answer", stream=True):
+                response = await self.client.chat.completions.create(
+                    model=self.chat_deployment,
+                    messages=self._answer_messages(query, context),
+                    temperature=0.2,
+                    max_tokens=800,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async for chunk in response:
+                    record_usage("answer", chunk)
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        yield text
+        except Exception as e:
+            logger.error(f"Failed to stream answer: {e}", exc_info=True)
+            raise
+
+    async def generate_rag_response(self, query: str) -> Tuple[str, List[Dict], List[Dict]]:
+        try:
+            search_results = await self.search_knowledge_base(query)
+            context, source_map = self._prepare_context(search_results, query)
+            answer = await self._generate_answer(query, context, source_map)
+            cited_sources = self._filter_cited_sources(answer, source_map)
+            recommendations = self.get_recommendations(search_results)
+            return answer, cited_sources, recommendations
+        except Exception as e:
+            logger.error(f"RAG response generation error: {e}")
+            return "Sorry, I encountered an error.", [], []
+
+    async def close(self) -> None:
+        """Close the pooled search session and the OpenAI client."""
+        await self.reset_search_client()
+        # Shutting down: nothing should still be searching on replaced clients
+        while self._retired_search_clients:
+            await self._retired_search_clients.pop().close()
+        await self.client.close()
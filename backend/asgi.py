@@ -0,0 +1,130 @@
+import json
+import os
+import time
+import traceback
+
+from a2wsgi import WSGIMiddleware
+
+# Importing api sets up logging, CORS and the vote database exactly as the
+# WSGI entry point does; every route except POST /chat is served by Flask.
+from api import app as flask_app, logger
+import async_assistant_core
+from metrics import HTTP_REQUEST_DURATION
+from tracing import start_trace
+from config import ASGI_WSGI_THREADS
+
+# Serve with: uvicorn asgi:app --host 0.0.0.0 --port 5001
+# One process handles many concurrent chats, since the RAG pipeline awaits
+# network I/O instead of holding a thread for it.
+
+# asgiref's WsgiToAsgi runs every request on one shared thread, so a single
+# /chat/stream would stall all other Flask routes; this bridge uses a pool.
+wsgi_app = WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)
+
+if os.getenv('FLASK_ENV') == 'production':
+    allowed_origin = f"https://{os.getenv('NETLIFY_DOMAIN', 'your-netlify-app.netlify.app')}"
+else:
+    allowed_origin = "*"
+
+
+async def _read_json(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return json.loads(body or b"{}")
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", allowed_origin.encode()),
+            (b"access-control-expose-headers", b"X-Request-ID"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(scope, receive, send):
+    """Async version of api.chat"""
+    logger.info("Received /chat request (asgi)")
+    try:
+        data = await _read_json(receive)
+    except ValueError:
+        await _send_json(send, 400, {"error": "Request body must be JSON"})
+        return
+    logger.debug("Request data: %s", data)
+
+    query = data.get('query', '')
+    logger.info(f"Query: {query}")
+
+    if not query:
+        logger.warning("No query provided in request")
+        await _send_json(send, 400, {"error": "No query provided"})
+        return
+
+    try:
+        result = await async_assistant_core.run_chat(query, async_evaluation=data.get('async_evaluation'))
+        logger.info("run_chat completed successfully")
+
+        if 'answer' not in result:
+            logger.error("Missing 'answer' field in result")
+            result['answer'] = "Sorry, I couldn't generate a proper response."
+
+        if 'sources' not in result:
+            logger.warning("Missing 'sources' field in result")
+            result['sources'] = []
+
+        if 'evaluation' not in result and 'evaluation_id' not in result:
+            logger.warning("Missing 'evaluation' field in result")
+            result['evaluation'] = {"raw_text": "No evaluation available"}
+
+        await _send_json(send, 200, result)
+    except Exception as e:
+        logger.error(f"Error in chat endpoint: {str(e)}")
+        logger.error(traceback.format_exc())
+        await _send_json(send, 500, {"error": str(e), "traceback": traceback.format_exc()})
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_assistant_core.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/chat" and scope["method"] == "POST":
+        # Flask's request hooks and api.chat never see this route, so time and
+        # trace it here
+        start = time.perf_counter()
+        status = 500
+        with start_trace("POST /chat") as trace:
+
+            async def send_with_status(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    message["headers"] = list(message["headers"]) + [(b"x-request-id", trace.trace_id.encode())]
+                await send(message)
+
+            try:
+                await chat(scope, receive, send_with_status)
+            finally:
+                trace.set_attribute("http.status_code", status)
+                HTTP_REQUEST_DURATION.labels("/chat", "POST", str(status)).observe(time.perf_counter() - start)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,154 @@
+import logging
+import math
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # fall back to an approximate count
+    tiktoken = None
+
+from retrieval import tokenize
+from config import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_CHUNK_TOKENS,
+    CONTEXT_MAX_CHUNKS,
+    CONTEXT_TOKENIZER,
+    TOKEN_COUNT_CACHE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_APPROX_RE = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """The tiktoken encoding, or None when tiktoken or its BPE file is unavailable."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                if tiktoken is not None:
+                    try:
+                        _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+                    except Exception as e:
+                        logger.warning(f"Could not load tokenizer '{CONTEXT_TOKENIZER}', approximating token counts: {e}")
+                _encoding_loaded = True
+    return _encoding
+
+
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    """Token count of ``text``; cached, since the same chunks come back across requests."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Roughly four characters per token, and at least one per word or symbol
+    return sum((len(piece) + 3) // 4 for piece in _APPROX_RE.findall(text))
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if sentence.strip()]
+
+
+def truncate_to_tokens(text: str, limit: int) -> str:
+    """Cut ``text`` to at most ``limit`` tokens, on a word boundary.
+
+    A first word that alone is over the limit (a URL, a part number) is cut
+    mid-word rather than dropped.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= limit:
+            return text
+        text = encoding.decode(tokens[:limit])
+        head = text.rsplit(" ", 1)[0]
+        return head if head.strip() else text
+    words = text.split()
+    while len(words) > 1 and count_tokens(" ".join(words)) > limit:
+        words = words[:max(1, min(len(words) - 1, int(len(words) * 0.9)))]
+    text = " ".join(words)
+    if count_tokens(text) > limit:
+        # Down to one word; cut it at about four characters per token
+        text = text[:limit * 4]
+        while count_tokens(text) > limit:
+            text = text[:int(len(text) * 0.9)]
+    return text
+
+
+def trim_to_relevant_sentences(text: str, query_terms: FrozenSet[str], limit: int) -> str:
+    """Keep the sentences sharing the most terms with the query, in their original order.
+
+    A single sentence longer than ``limit`` is cut to fit.
+    """
+    sentences = split_sentences(text)
+    scored = []
+    for position, sentence in enumerate(sentences):
+        terms = tokenize(sentence)
+        overlap = sum(1 for term in terms if term in query_terms)
+        # Normalise by length so long sentences do not win on size alone
+        scored.append((overlap / math.sqrt(len(terms) + 1), position))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    kept, used = [], 0
+    for _, position in scored:
+        tokens = count_tokens(sentences[position]) + 1
+        if used + tokens <= limit:
+            kept.append(position)
+            used += tokens
+    if not kept:
+        return truncate_to_tokens(sentences[scored[0][1]], limit) if sentences else ""
+    return " ".join(sentences[position] for position in sorted(kept))
+
+
+class ContextBuilder:
+    """Packs search results into the answer/evaluator context under a token budget.
+
+    Results are taken in the order given, which search_knowledge_base has
+    already deduplicated and diversified (see diversity.py). A chunk longer
+    than ``chunk_tokens``, or than what is left of the budget, is cut down to
+    its most query-relevant sentences.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, chunk_tokens: int = CONTEXT_CHUNK_TOKENS,
+                 max_chunks: int = CONTEXT_MAX_CHUNKS, min_chunk_tokens: int = 32):
+        self.token_budget = token_budget
+        self.chunk_tokens = chunk_tokens
+        self.max_chunks = max_chunks
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def build(self, query: str, search_results: List[Dict]) -> List[Tuple[Dict, str]]:
+        """Return ``(result, text)`` pairs to put in the context, in order."""
+        query_terms = frozenset(tokenize(query))
+        packed: List[Tuple[Dict, str]] = []
+        remaining = self.token_budget
+
+        for result in search_results:
+            if len(packed) >= self.max_chunks or remaining < self.min_chunk_tokens:
+                break
+            chunk = result.get('chunk', '').strip()
+            if not chunk:
+                continue
+            # "Source_N: " and the blank line between entries
+            overhead = 6
+            limit = min(self.chunk_tokens, remaining - overhead)
+            if limit < self.min_chunk_tokens:
+                break
+            if count_tokens(chunk) > limit:
+                chunk = trim_to_relevant_sentences(chunk, query_terms, limit)
+                if not chunk:
+                    continue
+            packed.append((result, chunk))
+            remaining -= count_tokens(chunk) + overhead
+
+        logger.debug("Packed %d of %d results into %d of %d context tokens",
+                     len(packed), len(search_results), self.token_budget - remaining, self.token_budget)
+        return packed
@@ -0,0 +1,21 @@
+import os
+import shutil
+import tempfile
+
+# Loaded by gunicorn automatically from the working directory; command-line
+# flags (start_app.sh, Procfile) still take precedence over anything here.
+
+# prometheus_client multiprocess mode: each worker writes its metrics under
+# this directory and /metrics merges them. It must be set before the workers
+# import prometheus_client, and emptied so counters restart with the server.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "rag-assistant-metrics")
+)
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges; its counters and histograms are kept
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,240 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, rotation is per process
+    fcntl = None
+
+from tracing import current_trace_id
+from config import (
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_FILE,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE_RATES,
+)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(process)d - %(thread)d - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra= and
+# goes into the JSON record as its own field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the request ID and any ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps only a fraction of DEBUG records, per logger.
+
+    ``rates`` maps logger-name prefixes to the fraction to keep; the longest
+    matching prefix wins and loggers with no match are not sampled.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            best = -1
+            for prefix, prefix_rate in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = prefix_rate, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse ``"api=0.1,azure=0.01"`` into ``{"api": 0.1, "azure": 0.01}``."""
+    rates = {}
+    for item in spec.split(","):
+        if item.strip():
+            name, _, rate = item.partition("=")
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class RequestQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread with only the message rendered.
+
+    ``msg % args`` is applied in the logging thread, since the arguments may
+    change once the call returns; the formatter (timestamps, JSON, exception
+    text) runs in the listener. The request ID is read now, while the
+    request's context is current. A full queue drops the record rather than
+    block the request.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class MultiProcessRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that several gunicorn workers can share.
+
+    Size checks and rollovers happen under an flock on ``<file>.lock``, and a
+    worker whose file was rotated by another one reopens the new file
+    instead of writing on into a renamed backup.
+    """
+
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, delay=True)
+        self._lock_file = open(f"{self.baseFilename}.lock", "a") if fcntl else None
+
+    def after_fork(self) -> None:
+        # flock belongs to the open file description, which a forked child
+        # shares with its parent; each process needs its own to exclude the others
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = open(f"{self.baseFilename}.lock", "a")
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def _reopen_if_rotated(self) -> None:
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            current = None
+        opened = os.fstat(self.stream.fileno())
+        if current is None or (current.st_ino, current.st_dev) != (opened.st_ino, opened.st_dev):
+            self.stream.close()
+            self.stream = None  # emit() reopens it
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._lock_file is None:
+            super().emit(record)
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        super().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[RequestQueueHandler] = None
+_handlers: List[logging.Handler] = []
+
+
+def _start_listener(log_queue: queue.Queue, handlers) -> None:
+    global _listener
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _after_fork() -> None:
+    if _queue_handler is None:
+        return
+    for handler in _handlers:
+        if isinstance(handler, MultiProcessRotatingFileHandler):
+            handler.after_fork()
+    # Records still in the inherited queue are the parent's to write, and its
+    # listener may have held the queue's lock mid-fork; start from a new one
+    _queue_handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _start_listener(_queue_handler.queue, _handlers)
+
+
+def configure_logging() -> None:
+    """Route root logging through a queue to the console and LOG_FILE.
+
+    Loggers only enqueue records; a listener thread formats and writes them.
+    The root level is LOG_LEVEL; loggers that set their own level (api's
+    DEBUG outside production) still reach these handlers. Safe to call more
+    than once (e.g. api imported by asgi).
+    """
+    global _queue_handler, _handlers
+    root = logging.getLogger()
+    if any(isinstance(handler, RequestQueueHandler) for handler in root.handlers):
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
+        handlers.append(MultiProcessRotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = RequestQueueHandler(log_queue)
+    rates = parse_sample_rates(LOG_SAMPLE_RATES)
+    if rates:
+        queue_handler.addFilter(DebugSampler(rates))
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    _queue_handler, _handlers = queue_handler, handlers
+
+    _start_listener(log_queue, handlers)
+    atexit.register(_stop_listener)
+    # A worker forked after this ran (gunicorn --preload) inherits the handler
+    # but not the listener thread. Registered once: the hook reads the
+    # module state, and forked children keep it.
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_after_fork)
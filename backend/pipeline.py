@@ -0,0 +1,158 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+from metrics import record_error
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class StageError(Exception):
+    """A pipeline stage failed or timed out and has no ``on_error`` fallback."""
+
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+class Stage:
+    """One step of a pipeline.
+
+    ``func`` is called with the results of the stages named in ``requires`` as
+    keyword arguments. ``timeout`` (seconds) counts from the moment the stage
+    is submitted. If the stage raises or times out, ``on_error(exc)`` provides
+    its result instead; without it the whole pipeline fails with StageError.
+    """
+
+    def __init__(self, name: str, func: Callable[..., Any], requires: Sequence[str] = (),
+                 timeout: Optional[float] = None, on_error: Optional[Callable[[BaseException], Any]] = None):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.timeout = timeout
+        self.on_error = on_error
+
+    def resolve_error(self, exc: BaseException) -> Any:
+        # Failures and timeouts both end up here, with or without a fallback
+        record_error(self.name, exc)
+        if self.on_error is None:
+            raise StageError(self.name, exc) from exc
+        logger.warning(f"Stage '{self.name}' failed, using fallback: {exc}")
+        return self.on_error(exc)
+
+
+class PipelineResult:
+    """Results of the stages that finished, plus handles on detached ones.
+
+    ``errors`` maps each stage whose result came from its ``on_error``
+    fallback to the exception (or TimeoutError) that caused it.
+    """
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.durations: Dict[str, float] = {}
+        self._detached: Dict[str, tuple] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        return self.results[name]
+
+    @property
+    def detached(self) -> Dict[str, Future]:
+        return {name: future for name, (_, future, _) in self._detached.items()}
+
+    def wait(self, name: str) -> Any:
+        """Block until a detached stage finishes, honouring its timeout and fallback."""
+        if name in self.results:
+            return self.results[name]
+        stage, future, deadline = self._detached[name]
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            value = future.result(timeout=remaining)
+        except FuturesTimeoutError:
+            future.cancel()
+            value = self._fail(stage, TimeoutError(f"timed out after {stage.timeout}s"))
+        except Exception as exc:
+            value = self._fail(stage, exc)
+        self.results[name] = value
+        return value
+
+    def _fail(self, stage: Stage, exc: BaseException) -> Any:
+        self.errors[stage.name] = exc
+        return stage.resolve_error(exc)
+
+
+class PipelineExecutor:
+    """Runs stages on a thread pool, each as soon as its inputs are ready."""
+
+    def __init__(self, executor: Executor):
+        self.executor = executor
+
+    def _submit(self, stage: Stage, result: PipelineResult) -> Future:
+        kwargs = {name: result.results[name] for name in stage.requires}
+
+        def timed():
+            start = time.perf_counter()
+            try:
+                with span(f"stage:{stage.name}"):
+                    return stage.func(**kwargs)
+            finally:
+                result.durations[stage.name] = time.perf_counter() - start
+
+        # Run in a copy of the caller's context so the stage joins its trace
+        return self.executor.submit(contextvars.copy_context().run, timed)
+
+    def run(self, stages: Iterable[Stage], detach: Iterable[str] = ()) -> PipelineResult:
+        """Run every stage and return once all non-detached stages are done.
+
+        Detached stages are started as soon as their inputs are ready, but run()
+        does not wait for them; use ``PipelineResult.wait(name)`` to collect them.
+        No stage may depend on a detached one.
+        """
+        pending: Dict[str, Stage] = {stage.name: stage for stage in stages}
+        detach = set(detach)
+        result = PipelineResult()
+        running: Dict[Future, tuple] = {}
+
+        while pending or running:
+            ready = [stage for stage in pending.values()
+                     if all(name in result.results for name in stage.requires)]
+            for stage in ready:
+                del pending[stage.name]
+                deadline = None if stage.timeout is None else time.monotonic() + stage.timeout
+                future = self._submit(stage, result)
+                if stage.name in detach:
+                    result._detached[stage.name] = (stage, future, deadline)
+                else:
+                    running[future] = (stage, deadline)
+
+            if not running:
+                if pending:
+                    raise StageError(next(iter(pending)), RuntimeError("unsatisfiable stage dependencies"))
+                break
+
+            deadlines = [deadline for _, deadline in running.values() if deadline is not None]
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                stage, _ = running.pop(future)
+                try:
+                    result.results[stage.name] = future.result()
+                except Exception as exc:
+                    result.results[stage.name] = result._fail(stage, exc)
+
+            now = time.monotonic()
+            for future, (stage, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    del running[future]
+                    future.cancel()
+                    result.results[stage.name] = result._fail(
+                        stage, TimeoutError(f"timed out after {stage.timeout}s"))
+
+        return result
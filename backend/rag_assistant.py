@@ -1,10 +1,23 @@
 import logging
+import os
+import threading
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Iterator, Tuple, Optional
 
+import requests
+from requests.adapters import HTTPAdapter
 from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizedQuery
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from azure.core.pipeline.transport import RequestsTransport
+from context_builder import ContextBuilder
+from diversity import diversify
+from embedding_cache import EmbeddingCache
+from metrics import record_usage, track_stage
+from tracing import span
+from retrieval import Retriever, LocalHybridRetriever
+from similarity import cosine_similarities, rank_by_similarity
 from config import (
     OPENAI_ENDPOINT,
     OPENAI_KEY,
@@ -14,79 +27,194 @@ from config import (
     SEARCH_INDEX,
     SEARCH_KEY,
     VECTOR_FIELD,
+    SEARCH_POOL_CONNECTIONS,
+    SEARCH_POOL_MAXSIZE,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_DB,
+    EMBEDDING_CACHE_DISK_SIZE,
+    RERANK_RESULTS,
+    SEARCH_BACKEND,
+    LOCAL_INDEX_PATH,
 )
 
 today = datetime.today().strftime("%B %d, %Y")
 logger = logging.getLogger(__name__)
 
+# Shown in place of an answer the chat completion failed to produce
+ANSWER_ERROR_TEXT = "An error occurred while generating the answer."
+
 class AzureRAGAssistant:
-    def __init__(self, client):
+    def __init__(self, client, retriever: Optional[Retriever] = None):
         self.client = client
+        # None means Azure Cognitive Search; SEARCH_BACKEND=local loads the on-disk hybrid index
+        if retriever is None and SEARCH_BACKEND == "local":
+            retriever = LocalHybridRetriever.load(LOCAL_INDEX_PATH)
+        self.retriever = retriever
+        self.context_builder = ContextBuilder()
         self.chat_deployment = CHAT_DEPLOYMENT
         self.embedding_deployment = EMBEDDING_DEPLOYMENT
         self.search_endpoint = SEARCH_ENDPOINT
         self.search_index = SEARCH_INDEX
         self.search_key = SEARCH_KEY
         self.vector_field = VECTOR_FIELD
+        self.embedding_batch_size = max(1, EMBEDDING_BATCH_SIZE)
+        self.embedding_cache = None
+        if EMBEDDING_CACHE_SIZE > 0 or EMBEDDING_CACHE_DB:
+            self.embedding_cache = EmbeddingCache(
+                namespace=self.embedding_deployment,
+                max_entries=EMBEDDING_CACHE_SIZE,
+                db_path=EMBEDDING_CACHE_DB or None,
+                max_disk_entries=EMBEDDING_CACHE_DISK_SIZE
+            )
+        self.search_pool_connections = SEARCH_POOL_CONNECTIONS
+        self.search_pool_maxsize = SEARCH_POOL_MAXSIZE
+        # (config key, SearchClient) swapped as one tuple so readers never see a
+        # client paired with the wrong key
+        self._search_state: Optional[Tuple[Tuple, SearchClient]] = None
+        self._search_client_lock = threading.Lock()
+
+    def _search_client_key(self) -> Tuple:
+        # The pid is part of the key so a forked worker never reuses the
+        # parent's sockets
+        return (
+            self.search_endpoint,
+            self.search_index,
+            self.search_key,
+            self.search_pool_connections,
+            self.search_pool_maxsize,
+            os.getpid(),
+        )
+
+    def _build_search_client(self) -> SearchClient:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.search_pool_connections,
+            pool_maxsize=self.search_pool_maxsize,
+        )
+        session.mount("https://", adapter)
+        transport = RequestsTransport(session=session, session_owner=True)
+        logger.info(f"Creating pooled SearchClient for index '{self.search_index}' (pool size {self.search_pool_maxsize})")
+        return SearchClient(
+            endpoint=f"https://{self.search_endpoint}.search.windows.net",
+            index_name=self.search_index,
+            credential=AzureKeyCredential(self.search_key),
+            transport=transport
+        )
+
+    def get_search_client(self) -> SearchClient:
+        """Return the shared SearchClient, rebuilding it if the config or process changed."""
+        key = self._search_client_key()
+        state = self._search_state
+        if state is not None and state[0] == key:
+            return state[1]
+        with self._search_client_lock:
+            state = self._search_state
+            if state is None or state[0] != key:
+                # The old client is dropped rather than closed: other threads may
+                # still be iterating its results, and its pool is released once
+                # they let go of it.
+                state = (key, self._build_search_client())
+                self._search_state = state
+            return state[1]
+
+    def reset_search_client(self, stale_client: Optional[SearchClient] = None) -> None:
+        """Discard the shared SearchClient so the next call builds a fresh one."""
+        with self._search_client_lock:
+            state = self._search_state
+            if state is not None and (stale_client is None or state[1] is stale_client):
+                self._search_state = None
 
     def generate_embedding(self, text: str) -> Optional[List[float]]:
         if not text:
             logger.warning("Empty text provided for embedding generation")
             return None
-        try:
-            response = self.client.embeddings.create(
-                input=[text.strip()],
-                model=self.embedding_deployment
-            )
-            return response.data[0].embedding
-        except Exception as e:
-            logger.error(f"Embedding generation error: {e}")
-            return None
+        return self.generate_embeddings([text])[0]
+
+    def _embedding_batches(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], List[List[Tuple[int, str]]]]:
+        """Fill what the cache already has and split the rest into request batches."""
+        if self.embedding_cache is not None:
+            self.embedding_cache.set_namespace(self.embedding_deployment)
+            embeddings = self.embedding_cache.get_many(texts)
+        else:
+            embeddings = [None] * len(texts)
+        pending = [
+            (i, text.strip()) for i, text in enumerate(texts)
+            if text and text.strip() and embeddings[i] is None
+        ]
+        batches = [pending[start:start + self.embedding_batch_size]
+                   for start in range(0, len(pending), self.embedding_batch_size)]
+        return embeddings, batches
+
+    def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed many texts in as few calls as the batch size allows.
+
+        Results line up with ``texts``; empty texts and failed batches yield None.
+        Vectors already in the embedding cache are not requested again.
+        """
+        embeddings, batches = self._embedding_batches(texts)
+        for batch in batches:
+            try:
+                with track_stage("embedding"), span("embeddings.create", kind="client", inputs=len(batch)):
+                    response = self.client.embeddings.create(
+                        input=[text for _, text in batch],
+                        model=self.embedding_deployment
+                    )
+                record_usage("embedding", response)
+                # The service reports each item's position in the request, which
+                # is not guaranteed to match the order of response.data
+                for item in response.data:
+                    embeddings[batch[item.index][0]] = item.embedding
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put_many([(text, embeddings[i]) for i, text in batch])
+            except Exception as e:
+                logger.error(f"Embedding generation error for batch of {len(batch)}: {e}")
+        return embeddings
 
     def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         try:
-            if len(vec1) != len(vec2):
-                raise ValueError("Vectors must have the same dimension")
-            dot_product = sum(a * b for a, b in zip(vec1, vec2))
-            magnitude1 = sum(a * a for a in vec1) ** 0.5
-            magnitude2 = sum(b * b for b in vec2) ** 0.5
-            if magnitude1 * magnitude2 == 0:
-                return 0
-            return dot_product / (magnitude1 * magnitude2)
+            return float(cosine_similarities(vec1, [vec2])[0])
         except Exception as e:
             logger.error(f"Cosine similarity calculation error: {e}")
             return 0
 
-    def filter_results(self, results: List[Dict], query: str, similarity_threshold: float = 0.7) -> List[Dict]:
-        filtered_results = []
-        query_embedding = self.generate_embedding(query)
+    def rerank_results(self, results: List[Dict], query: str, top_k: Optional[int] = None,
+                       similarity_threshold: Optional[float] = None) -> List[Dict]:
+        """Re-score results by query/chunk embedding similarity and keep the best top_k."""
+        if not results:
+            return []
+        embeddings = self.generate_embeddings([query] + [result.get('chunk', '') for result in results])
+        return self._rank_results(results, embeddings, top_k, similarity_threshold)
+
+    def _rank_results(self, results: List[Dict], embeddings: List[Optional[List[float]]],
+                      top_k: Optional[int], similarity_threshold: Optional[float]) -> List[Dict]:
+        # embeddings holds the query vector first, then one per result
+        query_embedding = embeddings[0]
         if not query_embedding:
             return []
-        for result in results:
-            content = result.get('chunk', '')
-            content_embedding = self.generate_embedding(content)
-            if content_embedding:
-                similarity = self.cosine_similarity(query_embedding, content_embedding)
-                if similarity > similarity_threshold:
-                    result['relevance'] = similarity
-                    filtered_results.append(result)
-        return sorted(filtered_results, key=lambda x: x['relevance'], reverse=True)
+        embedded = [(result, embedding) for result, embedding in zip(results, embeddings[1:]) if embedding]
+        if not embedded:
+            return []
+        ranked = rank_by_similarity(
+            query_embedding,
+            [embedding for _, embedding in embedded],
+            k=top_k if top_k is not None else len(embedded),
+            threshold=similarity_threshold
+        )
+        reranked_results = []
+        for index, similarity in ranked:
+            result = embedded[index][0]
+            # Cosine can dip below zero; relevance stays in [0, 1] like the retrievers'
+            result['relevance'] = max(0.0, similarity)
+            reranked_results.append(result)
+        return reranked_results
 
-    def search_knowledge_base(self, query: str) -> List[Dict]:
-        try:
-            search_client = SearchClient(
-                endpoint=f"https://{self.search_endpoint}.search.windows.net",
-                index_name=self.search_index,
-                credential=AzureKeyCredential(self.search_key)
-            )
-            query_embedding = self.generate_embedding(query)
-            if not query_embedding:
-                return []
-            vector_query = VectorizedQuery(
-                vector=query_embedding,
-                k_nearest_neighbors=10,
-                fields=self.vector_field
-            )
+    def filter_results(self, results: List[Dict], query: str, similarity_threshold: float = 0.7) -> List[Dict]:
+        return self.rerank_results(results, query, similarity_threshold=similarity_threshold)
+
+    def _run_search(self, search_client: SearchClient, query: str, vector_query: VectorizedQuery) -> List[Dict]:
+        # Results are paged in lazily, so the span covers the iteration too
+        with span("SearchClient.search", kind="client", index=self.search_index):
             results = search_client.search(
                 search_text=query,
                 vector_queries=[vector_query],
@@ -103,6 +231,44 @@ class AzureRAGAssistant:
                     "relevance": 1.0
                 })
             return processed_results
+
+    def search_knowledge_base(self, query: str) -> List[Dict]:
+        """Search, optionally re-score the hits by embedding similarity
+        (RERANK_RESULTS), then drop near-duplicates and re-rank the rest for
+        diversity.
+
+        Both _prepare_context and get_recommendations work from this order.
+        """
+        results = self._search(query)
+        if RERANK_RESULTS and results:
+            # Chunk embeddings are batched into one call and cached; if they
+            # cannot be had, keep the search order rather than lose the hits
+            results = self.rerank_results(results, query) or results
+        with span("diversify", hits=len(results)):
+            return diversify(results)
+
+    def _search(self, query: str) -> List[Dict]:
+        try:
+            query_embedding = self.generate_embedding(query)
+            if not query_embedding:
+                return []
+            if self.retriever is not None:
+                with track_stage("search"), span("retriever.search", retriever=type(self.retriever).__name__):
+                    return self.retriever.search(query, query_embedding, top=10)
+            vector_query = VectorizedQuery(
+                vector=query_embedding,
+                k_nearest_neighbors=10,
+                fields=self.vector_field
+            )
+            search_client = self.get_search_client()
+            with track_stage("search"):
+                try:
+                    return self._run_search(search_client, query, vector_query)
+                except (ServiceRequestError, ServiceResponseError) as e:
+                    # A broken pooled connection: rebuild the client and retry once
+                    logger.warning(f"Search connection error, rebuilding SearchClient: {e}")
+                    self.reset_search_client(search_client)
+                    return self._run_search(self.get_search_client(), query, vector_query)
         except Exception as e:
             logger.error(f"Knowledge base search error: {e}")
             return []
@@ -110,24 +276,27 @@ class AzureRAGAssistant:
     def validate_citations(self, answer: str, source_map: Dict) -> bool:
         return any(f"[{key}]" in answer for key in source_map)
 
-    def _prepare_context(self, search_results: List[Dict]) -> Tuple[str, Dict]:
+    def _prepare_context(self, search_results: List[Dict], query: str = "") -> Tuple[str, Dict]:
+        """Build the prompt context within CONTEXT_TOKEN_BUDGET; see ContextBuilder.
+
+        The context carries the packed (possibly trimmed) text, while the
+        source map keeps each full chunk for display.
+        """
         context_entries = []
         source_map = {}
-        for i, result in enumerate(search_results[:5], 1):
+        for i, (result, text) in enumerate(self.context_builder.build(query, search_results), 1):
             source_id = f"Source_{i}"
-            chunk = result.get('chunk', '').strip()
-            if chunk:
-                context_entries.append(f"{source_id}: {chunk}")
-                source_map[source_id] = {
-                    'title': result.get('title', f'Document {i}'),
-                    'content': chunk,
-                    'url': result.get('url', '#'),
-                    'category': result.get('category', 'Uncategorized')
-                }
+            context_entries.append(f"{source_id}: {text}")
+            source_map[source_id] = {
+                'title': result.get('title', f'Document {i}'),
+                'content': result.get('chunk', '').strip(),
+                'url': result.get('url', '#'),
+                'category': result.get('category', 'Uncategorized')
+            }
         context = "\n\n".join(context_entries)
         return context, source_map
 
-    def _generate_answer(self, query: str, context: str, source_map: Dict) -> str:
+    def _answer_messages(self, query: str, context: str) -> List[Dict]:
         system_prompt = f"""
 You are a factual, grounded AI assistant. Today is {today}. Your job is to answer questions strictly based on the provided context.
 
@@ -168,22 +337,59 @@ Also, confirm today’s date as given in your system instructions.
 ### Answer:
 """
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt.strip()},
             {"role": "user", "content": user_prompt.strip()}
         ]
 
-        try:
+    def _complete_answer(self, query: str, context: str) -> str:
+        """Request the answer; unlike _generate_answer, failures raise."""
+        with track_stage("answer"), span("chat.completions.create", kind="client", purpose="answer"):
             response = self.client.chat.completions.create(
                 model=self.chat_deployment,
-                messages=messages,
+                messages=self._answer_messages(query, context),
                 temperature=0.2,
                 max_tokens=800
             )
-            return response.choices[0].message.content.strip()
+        record_usage("answer", response)
+        return response.choices[0].message.content.strip()
+
+    def _generate_answer(self, query: str, context: str, source_map: Dict) -> str:
+        try:
+            return self._complete_answer(query, context)
         except Exception as e:
             logger.error(f"Failed to generate answer: {e}", exc_info=True)
-            return "An error occurred while generating the answer."
+            return ANSWER_ERROR_TEXT
+
+    def stream_answer(self, query: str, context: str, source_map: Dict) -> Iterator[str]:
+        """Yield the answer in pieces as the chat completion streams them back.
+
+        Raises if the completion fails, possibly after some pieces were
+        yielded; those are then only part of an answer.
+        """
+        try:
+            # Timed until the last chunk, so this includes the client reading it
+            with track_stage("answer"), span("chat.completions.create", kind="client", purpose="answer", stream=True):
+                response = self.client.chat.completions.create(
+                    model=self.chat_deployment,
+                    messages=self._answer_messages(query, context),
+                    temperature=0.2,
+                    max_tokens=800,
+                    stream=True,
+                    # Usage arrives in a final chunk with no choices
+                    stream_options={"include_usage": True}
+                )
+                for chunk in response:
+                    record_usage("answer", chunk)
+                    # Azure sends content-filter chunks with no choices
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        yield text
+        except Exception as e:
+            logger.error(f"Failed to stream answer: {e}", exc_info=True)
+            raise
 
     def _filter_cited_sources(self, answer: str, source_map: Dict) -> List[Dict]:
         cited_sources_list = []
@@ -203,14 +409,14 @@ Also, confirm today’s date as given in your system instructions.
             recommendations.append({
                 "title": result.get('title', 'Untitled'),
                 "snippet": result.get('chunk', '')[:150] + "...",
-                "score": round(result.get('relevance', 1.0) * 10, 2)
+                "score": round(min(max(result.get('relevance', 1.0), 0.0), 1.0) * 10, 2)
             })
         return recommendations
 
     def generate_rag_response(self, query: str) -> Tuple[str, List[Dict], List[Dict]]:
         try:
             search_results = self.search_knowledge_base(query)
-            context, source_map = self._prepare_context(search_results)
+            context, source_map = self._prepare_context(search_results, query)
             answer = self._generate_answer(query, context, source_map)
             cited_sources = self._filter_cited_sources(answer, source_map)
             recommendations = self.get_recommendations(search_results)
@@ -0,0 +1,126 @@
+import copy
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from similarity import cosine_similarities
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace."""
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+class SemanticResponseCache:
+    """Cache of complete run_chat results, matched by query text or meaning.
+
+    A lookup first tries the normalized query text, then the cosine
+    similarity between the query embedding and every cached query embedding.
+    Entries expire after ``ttl`` seconds, and the least recently used entry
+    is evicted once ``max_size`` is reached.
+    """
+
+    def __init__(self, embed: Callable[[str], Optional[List[float]]], max_size: int = 500,
+                 ttl: float = 3600, similarity_threshold: float = 0.95):
+        self.embed = embed
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _vectors(self):
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self._entries.items() if entry["embedding"] is not None]
+            self._matrix = np.stack([self._entries[key]["embedding"] for key in self._matrix_keys]) \
+                if self._matrix_keys else None
+        return self._matrix_keys, self._matrix
+
+    def get(self, query: str, query_embedding: Optional[List[float]] = None,
+            embed: bool = True) -> Optional[Dict]:
+        """Return a copy of the cached result for ``query``, or None.
+
+        Pass ``embed=False`` to skip the semantic lookup when no
+        ``query_embedding`` is given, e.g. from async code that must not block.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return copy.deepcopy(entry["result"])
+            if not self._entries:
+                self.misses += 1
+                return None
+
+        if query_embedding is None and embed:
+            query_embedding = self.embed(query)
+        if query_embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            keys, matrix = self._vectors()
+            if matrix is not None:
+                scores = cosine_similarities(query_embedding, matrix)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold and keys[best] in self._entries:
+                    self._entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    logger.info(f"Semantic cache hit (similarity {scores[best]:.3f}) for query: {query}")
+                    return copy.deepcopy(self._entries[keys[best]]["result"])
+            self.misses += 1
+            return None
+
+    def put(self, query: str, result: Dict, query_embedding: Optional[List[float]] = None) -> None:
+        if self.max_size <= 0:
+            return
+        if query_embedding is None:
+            query_embedding = self.embed(query)
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = {
+                "result": copy.deepcopy(result),
+                "embedding": np.asarray(query_embedding, dtype=np.float32) if query_embedding is not None else None,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
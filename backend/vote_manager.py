@@ -1,14 +1,223 @@
 # vote_manager.py
 
+import abc
+import atexit
+import base64
+import json
+import logging
+import os
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
 
-DB_NAME = "votes.db"
+from config import (
+    VOTES_DB,
+    VOTES_DB_CACHE_KB,
+    VOTES_DB_SYNCHRONOUS,
+    VOTE_WRITE_BEHIND,
+    VOTE_QUEUE_SIZE,
+    VOTE_BATCH_SIZE,
+    VOTE_FLUSH_INTERVAL,
+    VOTE_ENQUEUE_TIMEOUT,
+    VOTES_COMPRESS_MIN_BYTES,
+    VOTES_BACKEND,
+    VOTES_DATABASE_URL,
+)
 
-def init_db():
-    conn = sqlite3.connect("votes.db")
-    cursor = conn.cursor()
-    cursor.execute("""
+DB_NAME = VOTES_DB
+
+# bot_response and evaluation_json are the bulky columns; list views skip them
+SUMMARY_COLUMNS = ["id", "user_query", "vote", "comment", "timestamp"]
+PAYLOAD_COLUMNS = ["bot_response", "evaluation_json"]
+
+
+def compress_text(text, min_bytes=VOTES_COMPRESS_MIN_BYTES):
+    """zlib-compress ``text`` into a BLOB once it reaches ``min_bytes``.
+
+    Shorter values stay TEXT, so the column holds a mix of both types and
+    decompress_value tells them apart by type alone.
+    """
+    if not isinstance(text, str) or min_bytes <= 0:
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < min_bytes:
+        return text
+    return zlib.compress(raw, 6)
+
+
+def decompress_value(value):
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+
+# Evaluator fields (see EVALUATION_SYSTEM_PROMPT in assistant_core) copied into
+# their own columns so analytics can filter and aggregate without the JSON blob
+EVALUATION_COLUMNS = [
+    "factually_correct",
+    "bot_understood_question",
+    "response_type",
+    "response_effectiveness",
+    "engagement_proactiveness",
+    "context_utilization",
+    "confidence_in_evaluation",
+    "unsupported_claims",
+]
+# Column order of /votes/export
+EXPORT_COLUMNS = ["id", "user_query", "bot_response", "evaluation_json", "vote", "comment", "timestamp",
+                  *EVALUATION_COLUMNS]
+EVALUATION_CHOICES = {
+    "response_type": ("Task-based", "Informational"),
+    "response_effectiveness": ("Fully", "Mostly", "Partially", "Not at all"),
+    "engagement_proactiveness": ("Excellent", "Good", "Minimal", "None"),
+    "context_utilization": ("Fully", "Partially", "Not at all"),
+}
+
+
+def _yes_no(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str) and value.strip().lower() in ("yes", "no"):
+        return int(value.strip().lower() == "yes")
+    return None
+
+
+def _choice(field, value):
+    if not isinstance(value, str):
+        return None
+    for choice in EVALUATION_CHOICES[field]:
+        if value.strip().lower() == choice.lower():
+            return choice
+    return None
+
+
+def extract_evaluation_fields(evaluation_json):
+    """Return the EVALUATION_COLUMNS values for an evaluation, in order.
+
+    Accepts the JSON text or an already parsed dict. Missing or unexpected
+    values become None rather than failing the vote.
+    """
+    evaluation = evaluation_json
+    if isinstance(evaluation, str):
+        try:
+            evaluation = json.loads(evaluation)
+        except ValueError:
+            evaluation = None
+    if not isinstance(evaluation, dict):
+        return (None,) * len(EVALUATION_COLUMNS)
+
+    confidence = evaluation.get("confidence_in_evaluation")
+    try:
+        confidence = int(str(confidence).split("/")[0])
+        confidence = confidence if 1 <= confidence <= 5 else None
+    except ValueError:
+        confidence = None
+
+    matches = evaluation.get("context_matches")
+    unsupported = None
+    if isinstance(matches, list):
+        unsupported = sum(
+            1 for match in matches
+            if isinstance(match, dict) and "not found" in str(match.get("match", "")).lower()
+        )
+
+    return (
+        _yes_no(evaluation.get("factually_correct")),
+        _yes_no(evaluation.get("bot_understood_question")),
+        _choice("response_type", evaluation.get("response_type")),
+        _choice("response_effectiveness", evaluation.get("response_effectiveness")),
+        _choice("engagement_proactiveness", evaluation.get("engagement_proactiveness")),
+        _choice("context_utilization", evaluation.get("context_utilization")),
+        confidence,
+        unsupported,
+    )
+
+
+def _backfill_evaluation_fields(conn, batch_size=500):
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, evaluation_json FROM votes WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            f"UPDATE votes SET {', '.join(f'{column} = ?' for column in EVALUATION_COLUMNS)} WHERE id = ?",
+            [(*extract_evaluation_fields(decompress_value(row[1])), row[0]) for row in rows]
+        )
+        last_id = rows[-1][0]
+
+
+class VoteStorage(abc.ABC):
+    """Interface shared by the vote storage backends.
+
+    get_store() picks the implementation from VOTES_BACKEND: VoteStore for a
+    local SQLite file, or sqlalchemy_vote_store.SQLAlchemyVoteStore for a
+    pooled server database that several hosts can share. Rows come back as
+    dicts with the same keys and a "YYYY-MM-DD HH:MM:SS" timestamp string
+    from either backend.
+    """
+
+    @abc.abstractmethod
+    def init_db(self):
+        """Create the schema, or bring an existing one up to date."""
+
+    def close(self):
+        """Release resources held for the calling thread."""
+
+    def record_vote(self, user_query, bot_response, evaluation_json, vote, comment=""):
+        self.record_votes([(user_query, bot_response, evaluation_json, vote, comment)])
+
+    @abc.abstractmethod
+    def record_votes(self, votes):
+        """Insert many ``(user_query, bot_response, evaluation_json, vote, comment)`` rows in one transaction."""
+
+    @abc.abstractmethod
+    def fetch_vote(self, vote_id):
+        """Return one vote with its payload columns, or None."""
+
+    @abc.abstractmethod
+    def fetch_votes(self, limit=None, offset=0, vote_filter=None, start_date=None, end_date=None,
+                    include_payload=False):
+        """Return matching votes, newest first."""
+
+    @abc.abstractmethod
+    def fetch_votes_page(self, limit, cursor=None, vote_filter=None, start_date=None, end_date=None,
+                         include_payload=False):
+        """Return ``(votes, next_cursor)`` for one page, newest first."""
+
+    @abc.abstractmethod
+    def iter_votes(self, vote_filter=None, start_date=None, end_date=None, batch_size=500):
+        """Yield every matching vote (EXPORT_COLUMNS), oldest first, without loading them all."""
+
+    @abc.abstractmethod
+    def get_vote_statistics(self):
+        """Return the totals and per-day counts served by /votes/statistics."""
+
+    @abc.abstractmethod
+    def accuracy_breakdown(self, start_date=None, end_date=None, vote_filter=None):
+        """Return evaluator accuracy per day and response type."""
+
+    @abc.abstractmethod
+    def rebuild_statistics(self):
+        """Recompute the daily rollup from the votes table."""
+
+    def compress_existing(self, batch_size=500):
+        return 0
+
+
+class VoteStore(VoteStorage):
+    """SQLite vote storage with one long-lived connection per thread.
+
+    Connections run in WAL mode so readers and the writer stop blocking each
+    other across gunicorn workers. The SQL below is kept in constants so
+    sqlite3's per-connection statement cache prepares each one only once.
+    """
+
+    CREATE_TABLE = """
         CREATE TABLE IF NOT EXISTS votes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_query TEXT,
@@ -18,23 +227,542 @@ def init_db():
             comment TEXT,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
-    """)
-    conn.commit()
-    conn.close()
+    """
+    REBUILD_DAILY_STATS = [
+        "DELETE FROM vote_daily_stats",
+        "INSERT INTO vote_daily_stats (day, total, yes, no, with_comment) "
+        "SELECT day, COUNT(*), SUM(vote = 'yes'), SUM(vote = 'no'), SUM(comment != '') "
+        "FROM votes GROUP BY day",
+    ]
+    # Schema changes applied in order on top of CREATE_TABLE; PRAGMA
+    # user_version records how many have run. A step is SQL text or a
+    # callable taking the connection, for backfills SQL cannot express.
+    MIGRATIONS = [
+        # 1: day bucket column and indexes for date-range filtering and sorting
+        [
+            "ALTER TABLE votes ADD COLUMN day TEXT",
+            "UPDATE votes SET day = DATE(timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_votes_timestamp ON votes(timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_votes_vote_timestamp ON votes(vote, timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_votes_day ON votes(day)",
+        ],
+        # 2: per-day rollup that get_vote_statistics reads instead of votes
+        [
+            """
+            CREATE TABLE IF NOT EXISTS vote_daily_stats (
+                day TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                yes INTEGER NOT NULL DEFAULT 0,
+                no INTEGER NOT NULL DEFAULT 0,
+                with_comment INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            *REBUILD_DAILY_STATS,
+        ],
+        # 3: typed evaluator columns, backfilled from evaluation_json
+        [
+            "ALTER TABLE votes ADD COLUMN factually_correct INTEGER",
+            "ALTER TABLE votes ADD COLUMN bot_understood_question INTEGER",
+            "ALTER TABLE votes ADD COLUMN response_type TEXT",
+            "ALTER TABLE votes ADD COLUMN response_effectiveness TEXT",
+            "ALTER TABLE votes ADD COLUMN engagement_proactiveness TEXT",
+            "ALTER TABLE votes ADD COLUMN context_utilization TEXT",
+            "ALTER TABLE votes ADD COLUMN confidence_in_evaluation INTEGER",
+            "ALTER TABLE votes ADD COLUMN unsupported_claims INTEGER",
+            _backfill_evaluation_fields,
+            "CREATE INDEX IF NOT EXISTS idx_votes_day_type_correct "
+            "ON votes(day, response_type, factually_correct)",
+            "CREATE INDEX IF NOT EXISTS idx_votes_correct_day ON votes(factually_correct, day)",
+        ],
+    ]
+    # DATE('now') and CURRENT_TIMESTAMP see the same clock within one statement
+    INSERT_VOTE = f"""
+        INSERT INTO votes (user_query, bot_response, evaluation_json, vote, comment, day,
+                           {', '.join(EVALUATION_COLUMNS)})
+        VALUES (?, ?, ?, ?, ?, DATE('now'), {', '.join('?' for _ in EVALUATION_COLUMNS)})
+    """
+    UPSERT_DAILY_STATS = """
+        INSERT INTO vote_daily_stats (day, total, yes, no, with_comment)
+        VALUES (DATE('now'), 1, ?, ?, ?)
+        ON CONFLICT(day) DO UPDATE SET
+            total = total + 1,
+            yes = yes + excluded.yes,
+            no = no + excluded.no,
+            with_comment = with_comment + excluded.with_comment
+    """
+    SELECT_VOTES = "SELECT id, user_query, bot_response, evaluation_json, vote, comment, timestamp FROM votes"
+    SELECT_VOTE_SUMMARIES = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM votes"
+    SELECT_VOTE_EXPORT = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM votes"
+
+    def __init__(self, db_path=DB_NAME, cache_size_kb=VOTES_DB_CACHE_KB, synchronous=VOTES_DB_SYNCHRONOUS,
+                 busy_timeout=5.0):
+        self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Invalid SQLite synchronous mode: {synchronous}")
+        self.synchronous = synchronous.upper()
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        # A forked worker must not share its parent's connection
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, cached_statements=128)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            # Negative cache_size is in KiB rather than pages
+            conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close the calling thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init_db(self):
+        conn = self.connection()
+        with conn:
+            conn.execute(self.CREATE_TABLE)
+        self.migrate()
+
+    def migrate(self):
+        """Apply any migrations this database has not seen yet."""
+        conn = self.connection()
+        # Every worker runs this at startup; the write lock makes sure only
+        # one of them applies each migration
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, statements in enumerate(self.MIGRATIONS[version:], version + 1):
+                logging.info(f"Applying votes schema migration {number}")
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def record_votes(self, votes):
+        """Insert many ``(user_query, bot_response, evaluation_json, vote, comment)`` rows in one transaction."""
+        votes = list(votes)
+        for vote in votes:
+            if vote[3] not in ["yes", "no"]:
+                raise ValueError("Vote must be 'yes' or 'no'")
+        conn = self.connection()
+        rows = [
+            (user_query, compress_text(bot_response), compress_text(evaluation_json), vote, comment,
+             *extract_evaluation_fields(evaluation_json))
+            for user_query, bot_response, evaluation_json, vote, comment in votes
+        ]
+        # The votes and their rollup rows commit together
+        with conn:
+            conn.executemany(self.INSERT_VOTE, rows)
+            conn.executemany(
+                self.UPSERT_DAILY_STATS,
+                [(int(vote[3] == "yes"), int(vote[3] == "no"), int(bool(vote[4]))) for vote in votes]
+            )
+
+    def _filter_conditions(self, vote_filter=None, start_date=None, end_date=None):
+        conditions = []
+        params = []
+
+        if vote_filter:
+            conditions.append("vote = ?")
+            params.append(vote_filter)
+
+        # Plain range predicates on timestamp so the indexes can serve them;
+        # "YYYY-MM-DD HH:MM:SS" strings sort the same way as the dates they hold
+        if start_date:
+            try:
+                datetime.strptime(start_date, "%Y-%m-%d")
+                conditions.append("timestamp >= ?")
+                params.append(start_date)
+            except Exception as e:
+                logging.error(f"Invalid start_date format: {start_date} - {e}")
+
+        if end_date:
+            try:
+                end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+                conditions.append("timestamp < ?")
+                params.append(end.strftime("%Y-%m-%d"))
+            except Exception as e:
+                logging.error(f"Invalid end_date format: {end_date} - {e}")
+
+        return conditions, params
+
+    def _select(self, include_payload):
+        return self.SELECT_VOTES if include_payload else self.SELECT_VOTE_SUMMARIES
+
+    @staticmethod
+    def _vote_dict(row):
+        vote = dict(row)
+        for column in PAYLOAD_COLUMNS:
+            if column in vote:
+                vote[column] = decompress_value(vote[column])
+        return vote
+
+    def fetch_vote(self, vote_id):
+        """Return one vote with its payload columns, or None."""
+        row = self.connection().execute(self.SELECT_VOTES + " WHERE id = ?", (vote_id,)).fetchone()
+        return self._vote_dict(row) if row is not None else None
+
+    def fetch_votes(self, limit=None, offset=0, vote_filter=None, start_date=None, end_date=None,
+                    include_payload=False):
+        query = self._select(include_payload)
+        conditions, params = self._filter_conditions(vote_filter, start_date, end_date)
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        query += " ORDER BY timestamp DESC, id DESC"
+
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+
+        try:
+            return [self._vote_dict(row) for row in self.connection().execute(query, params).fetchall()]
+        except Exception as e:
+            logging.error(f"Error executing fetch_votes query: {e}")
+            return []
+
+    def fetch_votes_page(self, limit, cursor=None, vote_filter=None, start_date=None, end_date=None,
+                         include_payload=False):
+        """Return ``(votes, next_cursor)`` for one page, newest first.
+
+        Pages are keyed on ``(timestamp, id)`` of the last row rather than an
+        offset, so every page costs the same however deep it is. next_cursor
+        is None on the last page.
+        """
+        query = self._select(include_payload)
+        conditions, params = self._filter_conditions(vote_filter, start_date, end_date)
+
+        if cursor:
+            last_timestamp, last_id = decode_cursor(cursor)
+            conditions.append("(timestamp, id) < (?, ?)")
+            params.extend([last_timestamp, last_id])
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        # One extra row tells us whether another page exists
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = [self._vote_dict(row) for row in self.connection().execute(query, params).fetchall()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+        return rows, next_cursor
+
+    def iter_votes(self, vote_filter=None, start_date=None, end_date=None, batch_size=500):
+        query = self.SELECT_VOTE_EXPORT
+        conditions, params = self._filter_conditions(vote_filter, start_date, end_date)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp, id"
+
+        # sqlite3 steps the statement as rows are fetched, so only one batch
+        # is in memory; under WAL the open read does not block writers
+        cursor = self.connection().execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield self._vote_dict(row)
+        finally:
+            cursor.close()
+
+    def get_vote_statistics(self):
+        conn = self.connection()
+
+        # Totals across every day in the rollup
+        totals = conn.execute("""
+            SELECT COALESCE(SUM(total), 0), COALESCE(SUM(yes), 0), COALESCE(SUM(no), 0),
+                   COALESCE(SUM(with_comment), 0)
+            FROM vote_daily_stats
+        """).fetchone()
+        total_votes, yes_votes, no_votes, votes_with_comments = totals
+
+        # Get votes per day (last 30 days)
+        rows = conn.execute("""
+            SELECT day, total
+            FROM vote_daily_stats
+            WHERE day >= date('now', '-30 days')
+            ORDER BY day
+        """).fetchall()
+        votes_per_day = {row[0]: row[1] for row in rows}
+
+        return {
+            "total_votes": total_votes,
+            "yes_votes": yes_votes,
+            "no_votes": no_votes,
+            "yes_percentage": (yes_votes / total_votes * 100) if total_votes > 0 else 0,
+            "no_percentage": (no_votes / total_votes * 100) if total_votes > 0 else 0,
+            "votes_with_comments": votes_with_comments,
+            "votes_per_day": votes_per_day
+        }
+
+    def accuracy_breakdown(self, start_date=None, end_date=None, vote_filter=None):
+        """Evaluator accuracy per day and response type, aggregated in SQL.
+
+        ``evaluated`` counts votes whose evaluation had a factually_correct
+        verdict; ``accuracy`` is the share of those marked correct.
+        """
+        conditions, params = [], []
+        if vote_filter:
+            conditions.append("vote = ?")
+            params.append(vote_filter)
+        # day is indexed together with the grouping columns
+        if start_date:
+            conditions.append("day >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("day <= ?")
+            params.append(end_date)
+
+        query = """
+            SELECT day,
+                   COALESCE(response_type, 'Unknown') AS category,
+                   COUNT(*) AS votes,
+                   COUNT(factually_correct) AS evaluated,
+                   COALESCE(SUM(factually_correct), 0) AS factually_correct,
+                   SUM(vote = 'yes') AS yes_votes,
+                   AVG(confidence_in_evaluation) AS avg_confidence
+            FROM votes
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " GROUP BY day, category ORDER BY day, category"
+
+        breakdown = []
+        for row in self.connection().execute(query, params).fetchall():
+            entry = dict(row)
+            entry["accuracy"] = (entry["factually_correct"] / entry["evaluated"] * 100) if entry["evaluated"] else None
+            breakdown.append(entry)
+        return breakdown
+
+    def compress_existing(self, batch_size=500):
+        """Compress payload columns of rows written before compression; returns rows changed."""
+        conn = self.connection()
+        changed = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, bot_response, evaluation_json FROM votes WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return changed
+            updates = []
+            for row in rows:
+                bot_response = compress_text(row["bot_response"])
+                evaluation_json = compress_text(row["evaluation_json"])
+                if bot_response is not row["bot_response"] or evaluation_json is not row["evaluation_json"]:
+                    updates.append((bot_response, evaluation_json, row["id"]))
+            with conn:
+                conn.executemany("UPDATE votes SET bot_response = ?, evaluation_json = ? WHERE id = ?", updates)
+            changed += len(updates)
+            last_id = rows[-1]["id"]
+
+    def rebuild_statistics(self):
+        """Recompute the daily rollup from the votes table."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in self.REBUILD_DAILY_STATS:
+                conn.execute(statement)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+class VoteQueueFull(Exception):
+    """Raised when the write-behind queue stays full past the enqueue timeout,
+    or the writer has already been closed."""
+
+
+class BufferedVoteWriter:
+    """Write-behind buffer that batches votes into a single transaction.
+
+    Votes go onto a bounded queue, and a background thread writes them with
+    executemany once ``batch_size`` votes are waiting or ``flush_interval``
+    seconds have passed. A full queue blocks the caller for up to
+    ``enqueue_timeout`` seconds and then raises VoteQueueFull, as does a
+    submit after close(). close() (also registered with atexit) writes out
+    everything still queued.
+    """
+
+    _STOP = object()
+
+    def __init__(self, store, max_queue=VOTE_QUEUE_SIZE, batch_size=VOTE_BATCH_SIZE,
+                 flush_interval=VOTE_FLUSH_INTERVAL, enqueue_timeout=VOTE_ENQUEUE_TIMEOUT):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        # Guards _closed and counts submits between the closed check and the
+        # enqueue, so close() never queues STOP ahead of an accepted vote
+        self._state = threading.Condition()
+        self._submitting = 0
+        # The writer thread does not survive a fork; get_writer() checks this
+        self.pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="vote-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, user_query, bot_response, evaluation_json, vote, comment=""):
+        if vote not in ["yes", "no"]:
+            raise ValueError("Vote must be 'yes' or 'no'")
+        with self._state:
+            if self._closed:
+                raise VoteQueueFull("Vote writer is closed")
+            self._submitting += 1
+        try:
+            self._queue.put((user_query, bot_response, evaluation_json, vote, comment),
+                            timeout=self.enqueue_timeout)
+        except queue.Full:
+            raise VoteQueueFull("Vote queue is full")
+        finally:
+            with self._state:
+                self._submitting -= 1
+                self._state.notify_all()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+        self.store.close()
+
+    def _write(self, batch):
+        try:
+            self.store.record_votes(batch)
+            logging.debug(f"Flushed {len(batch)} votes")
+        except Exception as e:
+            logging.error(f"Failed to write {len(batch)} buffered votes: {e}", exc_info=True)
+
+    def close(self):
+        """Flush every queued vote and stop the writer thread."""
+        with self._state:
+            if self._closed:
+                return
+            self._closed = True
+            # The writer keeps draining, so these finish within enqueue_timeout
+            while self._submitting:
+                self._state.wait()
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+
+def encode_cursor(timestamp, vote_id):
+    """Opaque page cursor for the row at (timestamp, id)."""
+    raw = json.dumps([timestamp, vote_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor."""
+    try:
+        timestamp, vote_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(timestamp, str) or not isinstance(vote_id, int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return timestamp, vote_id
+
+
+_store = None
+_writer = None
+_store_lock = threading.Lock()
+
+
+def create_store(backend=VOTES_BACKEND):
+    """Build the VoteStorage implementation named by ``backend``."""
+    if backend == "sqlite":
+        return VoteStore(DB_NAME)
+    if backend == "sqlalchemy":
+        # Imported here: it depends on this module's helpers
+        from sqlalchemy_vote_store import SQLAlchemyVoteStore
+        return SQLAlchemyVoteStore(VOTES_DATABASE_URL)
+    raise ValueError(f"Unknown VOTES_BACKEND: {backend}")
+
+
+def get_store():
+    """Return the process-wide vote store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store()
+    return _store
+
+
+def get_writer():
+    """Return the process-wide BufferedVoteWriter, starting it on first use."""
+    global _writer
+    if _writer is None or _writer.pid != os.getpid():
+        with _store_lock:
+            if _writer is None or _writer.pid != os.getpid():
+                _writer = BufferedVoteWriter(get_store())
+    return _writer
+
+
+def init_db():
+    get_store().init_db()
 
 def record_vote(user_query, bot_response, evaluation_json, vote, comment=""):
-    if vote not in ["yes", "no"]:
-        raise ValueError("Vote must be 'yes' or 'no'")
-    conn = sqlite3.connect("votes.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO votes (user_query, bot_response, evaluation_json, vote, comment)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_query, bot_response, evaluation_json, vote, comment))
-    conn.commit()
-    conn.close()
-    
-def fetch_votes(limit=None, offset=0, vote_filter=None, start_date=None, end_date=None):
+    # With VOTE_WRITE_BEHIND the vote is queued and committed shortly after
+    if VOTE_WRITE_BEHIND:
+        get_writer().submit(user_query, bot_response, evaluation_json, vote, comment)
+    else:
+        get_store().record_vote(user_query, bot_response, evaluation_json, vote, comment)
+
+def fetch_vote(vote_id):
+    """
+    Fetch a single vote including bot_response and evaluation_json
+
+    Returns:
+        Vote dictionary, or None if no vote has that id
+    """
+    return get_store().fetch_vote(vote_id)
+
+def fetch_votes(limit=None, offset=0, vote_filter=None, start_date=None, end_date=None, include_payload=False):
     """
     Fetch votes with optional filtering and pagination
 
@@ -44,101 +772,82 @@ def fetch_votes(limit=None, offset=0, vote_filter=None, start_date=None, end_dat
         vote_filter: Filter by vote type ('yes' or 'no')
         start_date: Filter votes from this date (inclusive, format 'YYYY-MM-DD')
         end_date: Filter votes up to this date (inclusive, format 'YYYY-MM-DD')
+        include_payload: Also return bot_response and evaluation_json
 
     Returns:
         List of dictionaries containing vote data
     """
-    import logging
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-    cursor = conn.cursor()
+    return get_store().fetch_votes(limit=limit, offset=offset, vote_filter=vote_filter,
+                                   start_date=start_date, end_date=end_date, include_payload=include_payload)
 
-    query = "SELECT id, user_query, bot_response, evaluation_json, vote, comment, timestamp FROM votes"
-    conditions = []
-    params = []
+def fetch_votes_page(limit, cursor=None, vote_filter=None, start_date=None, end_date=None, include_payload=False):
+    """
+    Fetch one page of votes using keyset pagination
 
-    if vote_filter:
-        conditions.append("vote = ?")
-        params.append(vote_filter)
+    Args:
+        limit: Page size
+        cursor: next_cursor from the previous page (None for the first page)
+        vote_filter: Filter by vote type ('yes' or 'no')
+        start_date: Filter votes from this date (inclusive, format 'YYYY-MM-DD')
+        end_date: Filter votes up to this date (inclusive, format 'YYYY-MM-DD')
+        include_payload: Also return bot_response and evaluation_json
 
-    if start_date:
-        try:
-            datetime.strptime(start_date, "%Y-%m-%d")
-            conditions.append("DATE(timestamp) >= ?")
-            params.append(start_date)
-        except Exception as e:
-            logging.error(f"Invalid start_date format: {start_date} - {e}")
+    Returns:
+        Tuple of (list of vote dictionaries, next_cursor or None)
+    """
+    return get_store().fetch_votes_page(limit, cursor=cursor, vote_filter=vote_filter,
+                                        start_date=start_date, end_date=end_date, include_payload=include_payload)
 
-    if end_date:
-        try:
-            datetime.strptime(end_date, "%Y-%m-%d")
-            conditions.append("DATE(timestamp) <= ?")
-            params.append(end_date)
-        except Exception as e:
-            logging.error(f"Invalid end_date format: {end_date} - {e}")
+def iter_votes(vote_filter=None, start_date=None, end_date=None):
+    """
+    Iterate over all matching votes, oldest first, for streaming exports
+
+    Args:
+        vote_filter: Filter by vote type ('yes' or 'no')
+        start_date: Filter votes from this date (inclusive, format 'YYYY-MM-DD')
+        end_date: Filter votes up to this date (inclusive, format 'YYYY-MM-DD')
 
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
+    Returns:
+        Generator of vote dictionaries with the EXPORT_COLUMNS keys
+    """
+    return get_store().iter_votes(vote_filter=vote_filter, start_date=start_date, end_date=end_date)
 
-    query += " ORDER BY timestamp DESC"
+def get_accuracy_breakdown(start_date=None, end_date=None, vote_filter=None):
+    """
+    Get evaluator accuracy grouped by day and response type
 
-    if limit is not None:
-        query += " LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+    Args:
+        start_date: First day to include (format 'YYYY-MM-DD')
+        end_date: Last day to include (format 'YYYY-MM-DD')
+        vote_filter: Only count votes of this type ('yes' or 'no')
 
-    try:
-        cursor.execute(query, params)
-        rows = [dict(row) for row in cursor.fetchall()]
-    except Exception as e:
-        logging.error(f"Error executing fetch_votes query: {e}")
-        rows = []
-    conn.close()
-    return rows
+    Returns:
+        List of dictionaries, one per (day, category)
+    """
+    return get_store().accuracy_breakdown(start_date=start_date, end_date=end_date, vote_filter=vote_filter)
 
 def get_vote_statistics():
     """
     Get statistics about the votes
-    
+
     Returns:
         Dictionary containing vote statistics
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Get total votes
-    cursor.execute("SELECT COUNT(*) FROM votes")
-    total_votes = cursor.fetchone()[0]
-    
-    # Get yes votes
-    cursor.execute("SELECT COUNT(*) FROM votes WHERE vote = 'yes'")
-    yes_votes = cursor.fetchone()[0]
-    
-    # Get no votes
-    cursor.execute("SELECT COUNT(*) FROM votes WHERE vote = 'no'")
-    no_votes = cursor.fetchone()[0]
-    
-    # Get votes with comments
-    cursor.execute("SELECT COUNT(*) FROM votes WHERE comment != ''")
-    votes_with_comments = cursor.fetchone()[0]
-    
-    # Get votes per day (last 30 days)
-    cursor.execute("""
-        SELECT DATE(timestamp) as date, COUNT(*) as count 
-        FROM votes 
-        WHERE timestamp >= date('now', '-30 days') 
-        GROUP BY DATE(timestamp) 
-        ORDER BY date
-    """)
-    votes_per_day = {row[0]: row[1] for row in cursor.fetchall()}
-    
-    conn.close()
-    
-    return {
-        "total_votes": total_votes,
-        "yes_votes": yes_votes,
-        "no_votes": no_votes,
-        "yes_percentage": (yes_votes / total_votes * 100) if total_votes > 0 else 0,
-        "no_percentage": (no_votes / total_votes * 100) if total_votes > 0 else 0,
-        "votes_with_comments": votes_with_comments,
-        "votes_per_day": votes_per_day
-    }
+    return get_store().get_vote_statistics()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["rebuild-stats"]:
+        init_db()
+        get_store().rebuild_statistics()
+        print("Vote statistics rebuilt")
+    elif sys.argv[1:] == ["compress"]:
+        init_db()
+        changed = get_store().compress_existing()
+        # Freed pages are only returned to the filesystem by VACUUM
+        print(f"Compressed {changed} votes; run VACUUM to reclaim the space")
+    else:
+        print("Usage: python vote_manager.py rebuild-stats|compress")
+        sys.exit(1)
@@ -19,6 +19,58 @@ class AppConfig:
     SEARCH_INDEX: str = os.getenv("SEARCH_INDEX", "")
     SEARCH_KEY: str = os.getenv("SEARCH_KEY", "")
     VECTOR_FIELD: str = os.getenv("VECTOR_FIELD", "text_vector")
+    SEARCH_POOL_CONNECTIONS: int = int(os.getenv("SEARCH_POOL_CONNECTIONS", "10"))
+    SEARCH_POOL_MAXSIZE: int = int(os.getenv("SEARCH_POOL_MAXSIZE", "10"))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    EMBEDDING_CACHE_DB: str = os.getenv("EMBEDDING_CACHE_DB", "")
+    EMBEDDING_CACHE_DISK_SIZE: int = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000"))
+    # Re-score search hits by query/chunk embedding similarity before building the context.
+    # Off by default: it costs an extra embeddings call per chat (for chunks not
+    # yet in the embedding cache) and replaces Azure's hybrid ranking
+    RERANK_RESULTS: bool = os.getenv("RERANK_RESULTS", "false").lower() in ("1", "true", "yes")
+
+    # Retrieval backend: "azure" (Cognitive Search) or "local" (index built by retrieval.py)
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "azure")
+    LOCAL_INDEX_PATH: str = os.getenv("LOCAL_INDEX_PATH", "local_index")
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    # Vector leg of the local index: "exact" or "ivf" (approximate, see ann_index.py)
+    VECTOR_INDEX: str = os.getenv("VECTOR_INDEX", "exact")
+    IVF_NLIST: int = int(os.getenv("IVF_NLIST", "0"))
+    IVF_NPROBE: int = int(os.getenv("IVF_NPROBE", "8"))
+    IVF_PQ_M: int = int(os.getenv("IVF_PQ_M", "0"))
+    IVF_RERANK: int = int(os.getenv("IVF_RERANK", "200"))
+
+    # Context sent to the answer and evaluator prompts (see context_builder.py)
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    CONTEXT_CHUNK_TOKENS: int = int(os.getenv("CONTEXT_CHUNK_TOKENS", "600"))
+    CONTEXT_MAX_CHUNKS: int = int(os.getenv("CONTEXT_MAX_CHUNKS", "5"))
+    CONTEXT_TOKENIZER: str = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+    TOKEN_COUNT_CACHE_SIZE: int = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "20000"))
+    # Post-retrieval dedup and MMR re-ranking (see diversity.py); MMR_LAMBDA=1 keeps search order
+    DEDUP_THRESHOLD: float = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+    MMR_LAMBDA: float = float(os.getenv("MMR_LAMBDA", "0.5"))
+    MINHASH_PERMUTATIONS: int = int(os.getenv("MINHASH_PERMUTATIONS", "64"))
+
+    # Semantic response cache in front of run_chat (size 0 disables it)
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "500"))
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    RESPONSE_CACHE_THRESHOLD: float = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+
+    # Chat pipeline concurrency and per-stage timeouts (seconds)
+    PIPELINE_MAX_WORKERS: int = int(os.getenv("PIPELINE_MAX_WORKERS", "16"))
+    SEARCH_STAGE_TIMEOUT: float = float(os.getenv("SEARCH_STAGE_TIMEOUT", "30"))
+    ANSWER_STAGE_TIMEOUT: float = float(os.getenv("ANSWER_STAGE_TIMEOUT", "90"))
+    EVALUATION_STAGE_TIMEOUT: float = float(os.getenv("EVALUATION_STAGE_TIMEOUT", "90"))
+
+    # Background evaluation: /chat returns an evaluation_id to poll instead
+    ASYNC_EVALUATION: bool = os.getenv("ASYNC_EVALUATION", "false").lower() in ("1", "true", "yes")
+    EVALUATION_DB: str = os.getenv("EVALUATION_DB", "evaluations.db")
+    EVALUATION_WORKERS: int = int(os.getenv("EVALUATION_WORKERS", "2"))
+    EVALUATION_QUEUE_SIZE: int = int(os.getenv("EVALUATION_QUEUE_SIZE", "100"))
+
+    # asgi.py: threads serving the Flask routes; each open /chat/stream holds one
+    ASGI_WSGI_THREADS: int = int(os.getenv("ASGI_WSGI_THREADS", "20"))
 
     # Field Mappings
     FIELD_MAPPINGS: Dict[str, str] = field(default_factory=lambda: {
@@ -31,6 +83,45 @@ class AppConfig:
     # Application Settings
     FEEDBACK_DIR: str = "feedback_data"
 
+    # Vote database (SQLite)
+    VOTES_DB: str = os.getenv("VOTES_DB", "votes.db")
+    VOTES_DB_CACHE_KB: int = int(os.getenv("VOTES_DB_CACHE_KB", "8192"))
+    VOTES_DB_SYNCHRONOUS: str = os.getenv("VOTES_DB_SYNCHRONOUS", "NORMAL")
+    VOTES_PAGE_SIZE: int = int(os.getenv("VOTES_PAGE_SIZE", "50"))
+    VOTES_MAX_PAGE_SIZE: int = int(os.getenv("VOTES_MAX_PAGE_SIZE", "500"))
+
+    # Write-behind buffering for /feedback votes
+    VOTE_WRITE_BEHIND: bool = os.getenv("VOTE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+    VOTE_QUEUE_SIZE: int = int(os.getenv("VOTE_QUEUE_SIZE", "1000"))
+    VOTE_BATCH_SIZE: int = int(os.getenv("VOTE_BATCH_SIZE", "100"))
+    VOTE_FLUSH_INTERVAL: float = float(os.getenv("VOTE_FLUSH_INTERVAL", "0.5"))
+    VOTE_ENQUEUE_TIMEOUT: float = float(os.getenv("VOTE_ENQUEUE_TIMEOUT", "2"))
+    # bot_response / evaluation_json values at least this long are zlib-compressed (0 disables)
+    VOTES_COMPRESS_MIN_BYTES: int = int(os.getenv("VOTES_COMPRESS_MIN_BYTES", "256"))
+
+    # Vote storage backend: "sqlite" (VOTES_DB file) or "sqlalchemy" (VOTES_DATABASE_URL)
+    VOTES_BACKEND: str = os.getenv("VOTES_BACKEND", "sqlite")
+    VOTES_DATABASE_URL: str = os.getenv("VOTES_DATABASE_URL", os.getenv("DATABASE_URL", ""))
+    VOTES_DB_POOL_SIZE: int = int(os.getenv("VOTES_DB_POOL_SIZE", "5"))
+    VOTES_DB_MAX_OVERFLOW: int = int(os.getenv("VOTES_DB_MAX_OVERFLOW", "10"))
+    VOTES_DB_POOL_RECYCLE: int = int(os.getenv("VOTES_DB_POOL_RECYCLE", "1800"))
+
+    # Request tracing: "" (off), "jsonl" (append spans to TRACE_FILE) or "otlp" (POST to TRACE_OTLP_ENDPOINT)
+    TRACE_EXPORTER: str = os.getenv("TRACE_EXPORTER", "").lower()
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "traces.jsonl")
+    TRACE_OTLP_ENDPOINT: str = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+
+    # Logging (see logging_setup.py). LOG_LEVEL applies to every logger except
+    # api's own, which stays at DEBUG outside production
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "WARNING").upper()
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+    LOG_FILE: str = os.getenv("LOG_FILE", "logs/api.log")
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", "10485760"))
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "10"))
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Fraction of DEBUG records kept per logger prefix, e.g. "api=0.1,azure=0.01"
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+
 # Create a global instance of the config
 config = AppConfig()
 
@@ -43,11 +134,90 @@ SEARCH_ENDPOINT = config.SEARCH_ENDPOINT
 SEARCH_INDEX = config.SEARCH_INDEX
 SEARCH_KEY = config.SEARCH_KEY
 VECTOR_FIELD = config.VECTOR_FIELD
+SEARCH_POOL_CONNECTIONS = config.SEARCH_POOL_CONNECTIONS
+SEARCH_POOL_MAXSIZE = config.SEARCH_POOL_MAXSIZE
+EMBEDDING_BATCH_SIZE = config.EMBEDDING_BATCH_SIZE
+EMBEDDING_CACHE_SIZE = config.EMBEDDING_CACHE_SIZE
+EMBEDDING_CACHE_DB = config.EMBEDDING_CACHE_DB
+EMBEDDING_CACHE_DISK_SIZE = config.EMBEDDING_CACHE_DISK_SIZE
+RERANK_RESULTS = config.RERANK_RESULTS
+SEARCH_BACKEND = config.SEARCH_BACKEND
+LOCAL_INDEX_PATH = config.LOCAL_INDEX_PATH
+RRF_K = config.RRF_K
+VECTOR_INDEX = config.VECTOR_INDEX
+IVF_NLIST = config.IVF_NLIST
+IVF_NPROBE = config.IVF_NPROBE
+IVF_PQ_M = config.IVF_PQ_M
+IVF_RERANK = config.IVF_RERANK
+CONTEXT_TOKEN_BUDGET = config.CONTEXT_TOKEN_BUDGET
+CONTEXT_CHUNK_TOKENS = config.CONTEXT_CHUNK_TOKENS
+CONTEXT_MAX_CHUNKS = config.CONTEXT_MAX_CHUNKS
+CONTEXT_TOKENIZER = config.CONTEXT_TOKENIZER
+TOKEN_COUNT_CACHE_SIZE = config.TOKEN_COUNT_CACHE_SIZE
+DEDUP_THRESHOLD = config.DEDUP_THRESHOLD
+MMR_LAMBDA = config.MMR_LAMBDA
+MINHASH_PERMUTATIONS = config.MINHASH_PERMUTATIONS
+RESPONSE_CACHE_SIZE = config.RESPONSE_CACHE_SIZE
+RESPONSE_CACHE_TTL = config.RESPONSE_CACHE_TTL
+RESPONSE_CACHE_THRESHOLD = config.RESPONSE_CACHE_THRESHOLD
+PIPELINE_MAX_WORKERS = config.PIPELINE_MAX_WORKERS
+SEARCH_STAGE_TIMEOUT = config.SEARCH_STAGE_TIMEOUT
+ANSWER_STAGE_TIMEOUT = config.ANSWER_STAGE_TIMEOUT
+EVALUATION_STAGE_TIMEOUT = config.EVALUATION_STAGE_TIMEOUT
+ASYNC_EVALUATION = config.ASYNC_EVALUATION
+EVALUATION_DB = config.EVALUATION_DB
+EVALUATION_WORKERS = config.EVALUATION_WORKERS
+EVALUATION_QUEUE_SIZE = config.EVALUATION_QUEUE_SIZE
+ASGI_WSGI_THREADS = config.ASGI_WSGI_THREADS
 FIELD_MAPPINGS = config.FIELD_MAPPINGS
 FEEDBACK_DIR = config.FEEDBACK_DIR
+VOTES_DB = config.VOTES_DB
+VOTES_DB_CACHE_KB = config.VOTES_DB_CACHE_KB
+VOTES_DB_SYNCHRONOUS = config.VOTES_DB_SYNCHRONOUS
+VOTES_PAGE_SIZE = config.VOTES_PAGE_SIZE
+VOTES_MAX_PAGE_SIZE = config.VOTES_MAX_PAGE_SIZE
+VOTE_WRITE_BEHIND = config.VOTE_WRITE_BEHIND
+VOTE_QUEUE_SIZE = config.VOTE_QUEUE_SIZE
+VOTE_BATCH_SIZE = config.VOTE_BATCH_SIZE
+VOTE_FLUSH_INTERVAL = config.VOTE_FLUSH_INTERVAL
+VOTE_ENQUEUE_TIMEOUT = config.VOTE_ENQUEUE_TIMEOUT
+VOTES_COMPRESS_MIN_BYTES = config.VOTES_COMPRESS_MIN_BYTES
+VOTES_BACKEND = config.VOTES_BACKEND
+VOTES_DATABASE_URL = config.VOTES_DATABASE_URL
+VOTES_DB_POOL_SIZE = config.VOTES_DB_POOL_SIZE
+VOTES_DB_MAX_OVERFLOW = config.VOTES_DB_MAX_OVERFLOW
+VOTES_DB_POOL_RECYCLE = config.VOTES_DB_POOL_RECYCLE
+TRACE_EXPORTER = config.TRACE_EXPORTER
+TRACE_FILE = config.TRACE_FILE
+TRACE_OTLP_ENDPOINT = config.TRACE_OTLP_ENDPOINT
+LOG_LEVEL = config.LOG_LEVEL
+LOG_FORMAT = config.LOG_FORMAT
+LOG_FILE = config.LOG_FILE
+LOG_MAX_BYTES = config.LOG_MAX_BYTES
+LOG_BACKUP_COUNT = config.LOG_BACKUP_COUNT
+LOG_QUEUE_SIZE = config.LOG_QUEUE_SIZE
+LOG_SAMPLE_RATES = config.LOG_SAMPLE_RATES
 
 # Export the config instance
 __all__ = ['config', 'AppConfig',
            'OPENAI_ENDPOINT', 'OPENAI_KEY', 'EMBEDDING_DEPLOYMENT', 'CHAT_DEPLOYMENT',
            'SEARCH_ENDPOINT', 'SEARCH_INDEX', 'SEARCH_KEY', 'VECTOR_FIELD',
-           'FIELD_MAPPINGS', 'FEEDBACK_DIR']
+           'SEARCH_POOL_CONNECTIONS', 'SEARCH_POOL_MAXSIZE', 'EMBEDDING_BATCH_SIZE',
+           'EMBEDDING_CACHE_SIZE', 'EMBEDDING_CACHE_DB', 'EMBEDDING_CACHE_DISK_SIZE',
+           'RERANK_RESULTS',
+           'SEARCH_BACKEND', 'LOCAL_INDEX_PATH', 'RRF_K', 'VECTOR_INDEX', 'IVF_NLIST', 'IVF_NPROBE',
+           'IVF_PQ_M', 'IVF_RERANK',
+           'CONTEXT_TOKEN_BUDGET', 'CONTEXT_CHUNK_TOKENS', 'CONTEXT_MAX_CHUNKS', 'CONTEXT_TOKENIZER',
+           'TOKEN_COUNT_CACHE_SIZE', 'DEDUP_THRESHOLD', 'MMR_LAMBDA', 'MINHASH_PERMUTATIONS',
+           'RESPONSE_CACHE_SIZE', 'RESPONSE_CACHE_TTL', 'RESPONSE_CACHE_THRESHOLD',
+           'PIPELINE_MAX_WORKERS', 'SEARCH_STAGE_TIMEOUT', 'ANSWER_STAGE_TIMEOUT',
+           'EVALUATION_STAGE_TIMEOUT', 'ASYNC_EVALUATION', 'EVALUATION_DB', 'EVALUATION_WORKERS',
+           'EVALUATION_QUEUE_SIZE',
+           'FIELD_MAPPINGS', 'FEEDBACK_DIR',
+           'VOTES_DB', 'VOTES_DB_CACHE_KB', 'VOTES_DB_SYNCHRONOUS', 'VOTES_PAGE_SIZE',
+           'VOTES_MAX_PAGE_SIZE', 'VOTE_WRITE_BEHIND', 'VOTE_QUEUE_SIZE', 'VOTE_BATCH_SIZE',
+           'VOTE_FLUSH_INTERVAL', 'VOTE_ENQUEUE_TIMEOUT', 'VOTES_COMPRESS_MIN_BYTES', 'VOTES_BACKEND',
+           'VOTES_DATABASE_URL', 'VOTES_DB_POOL_SIZE', 'VOTES_DB_MAX_OVERFLOW', 'VOTES_DB_POOL_RECYCLE',
+           'TRACE_EXPORTER', 'TRACE_FILE', 'TRACE_OTLP_ENDPOINT',
+           'LOG_LEVEL', 'LOG_FORMAT', 'LOG_FILE', 'LOG_MAX_BYTES', 'LOG_BACKUP_COUNT', 'LOG_QUEUE_SIZE',
+           'LOG_SAMPLE_RATES', 'ASGI_WSGI_THREADS']
@@ -0,0 +1,96 @@
+import zlib
+from functools import lru_cache
+from typing import Dict, List
+
+import numpy as np
+
+from retrieval import tokenize
+from config import DEDUP_THRESHOLD, MMR_LAMBDA, MINHASH_PERMUTATIONS
+
+# Hits are re-scored against each other, not against the query: the search
+# results carry no vectors, so chunk similarity is estimated from MinHash
+# signatures of word trigrams. Query relevance is the hits' own "relevance"
+# score, or their rank when the scores cannot tell them apart.
+
+# Mersenne prime 2**31 - 1: with a, b and h all below it, a*h + b < 2**62,
+# so the permutations never overflow uint64
+_PRIME = 2147483647
+_rng = np.random.default_rng(20240601)  # fixed so signatures are comparable across processes
+_A = _rng.integers(1, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+# Chunks from the same document often overlap in meaning without sharing
+# many trigrams; treat them as at least this similar
+SAME_TITLE_SIMILARITY = 0.5
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    words = tokenize(text)
+    if len(words) < size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+@lru_cache(maxsize=10000)
+def minhash_signature(text: str) -> np.ndarray:
+    """MinHash of the text's word trigrams; cached because the same chunks recur."""
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) % _PRIME for s in set(shingles(text))), dtype=np.uint64)
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0)
+
+
+def similarity_matrix(results: List[Dict]) -> np.ndarray:
+    signatures = np.stack([minhash_signature(result.get('chunk', '')) for result in results])
+    # Fraction of matching MinHash slots for every pair at once
+    similarity = (signatures[:, None, :] == signatures[None, :, :]).mean(axis=2)
+    titles = [result.get('title') for result in results]
+    for i in range(len(results)):
+        for j in range(i + 1, len(results)):
+            if titles[i] and titles[i] == titles[j]:
+                similarity[i, j] = similarity[j, i] = max(similarity[i, j], SAME_TITLE_SIMILARITY)
+    return similarity
+
+
+def diversify(results: List[Dict], mmr_lambda: float = MMR_LAMBDA,
+              dedup_threshold: float = DEDUP_THRESHOLD) -> List[Dict]:
+    """Drop near-duplicate hits and reorder the rest by maximal marginal relevance.
+
+    ``results`` must be best first. A hit whose estimated Jaccard similarity
+    to a better one reaches ``dedup_threshold`` is removed. The rest are
+    picked greedily by ``mmr_lambda * relevance - (1 - mmr_lambda) * max
+    similarity to the hits already picked``; ``mmr_lambda=1`` orders them by
+    relevance alone.
+
+    Relevance is each hit's "relevance" scaled so the best is 1: the local
+    retriever's fused score, or the embedding similarity with RERANK_RESULTS.
+    Azure search hits all carry 1.0, so when the scores are missing or all
+    equal, relevance falls linearly with rank instead.
+    """
+    if len(results) < 2:
+        return list(results)
+    similarity = similarity_matrix(results)
+
+    kept = []
+    for i in range(len(results)):
+        if not any(similarity[i, j] >= dedup_threshold for j in kept):
+            kept.append(i)
+
+    relevance = dict(zip(kept, _relevance([results[i] for i in kept])))
+    selected: List[int] = []
+    candidates = list(kept)
+    while candidates:
+        def mmr(i):
+            redundancy = max((similarity[i, j] for j in selected), default=0.0)
+            return mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+        best = max(candidates, key=mmr)
+        selected.append(best)
+        candidates.remove(best)
+    return [results[i] for i in selected]
+
+
+def _relevance(results: List[Dict]) -> List[float]:
+    scores = [result.get('relevance') for result in results]
+    if all(isinstance(score, (int, float)) for score in scores):
+        best = max(scores)
+        if best > min(scores):
+            return [score / best for score in scores]
+    return [1.0 - rank / len(results) for rank in range(len(results))]
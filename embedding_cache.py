@@ -0,0 +1,200 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(text: str) -> str:
+    """Hash of the text exactly as it is sent to the embedding model."""
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache keyed by content hash.
+
+    The memory tier is an LRU of float32 arrays. The optional disk tier is a
+    SQLite table shared by every worker on the host. Both tiers are scoped to
+    one embedding deployment and are wiped when it changes.
+    """
+
+    # Check the disk tier's size once per this many inserts
+    EVICTION_CHECK_INTERVAL = 100
+
+    def __init__(self, namespace: str, max_entries: int = 10000,
+                 db_path: Optional[str] = None, max_disk_entries: int = 100000):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._inserts_since_check = 0
+        if db_path:
+            self._open_disk_tier()
+
+    def _open_disk_tier(self) -> None:
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.commit()
+            self._conn = conn
+            self._check_disk_namespace()
+        except sqlite3.Error as e:
+            logger.error(f"Embedding cache disk tier disabled ({self.db_path}): {e}")
+            self._conn = None
+
+    def _check_disk_namespace(self) -> None:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'namespace'").fetchone()
+        if row is None or row[0] != self.namespace:
+            if row is not None:
+                logger.info(f"Embedding deployment changed from '{row[0]}' to '{self.namespace}', clearing disk cache")
+            with self._conn:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('namespace', ?)",
+                    (self.namespace,)
+                )
+
+    def set_namespace(self, namespace: str) -> None:
+        """Switch to another embedding deployment, dropping every cached vector."""
+        if namespace == self.namespace:
+            return
+        with self._lock:
+            if namespace == self.namespace:
+                return
+            logger.info(f"Embedding deployment changed to '{namespace}', clearing embedding cache")
+            self.namespace = namespace
+            self._memory.clear()
+            if self._conn is not None:
+                try:
+                    self._check_disk_namespace()
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to reset embedding disk cache: {e}")
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Look up every text; misses come back as None."""
+        keys = [content_key(text) if text else None for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                if key is not None and key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            disk_keys = list({key for key in keys if key is not None and key not in found})
+            if disk_keys and self._conn is not None:
+                found.update(self._read_disk(disk_keys))
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += sum(1 for key in keys if key is not None) - hits
+
+        return [found[key].tolist() if key in found else None for key in keys]
+
+    def get(self, text: str) -> Optional[List[float]]:
+        return self.get_many([text])[0]
+
+    def _read_disk(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        try:
+            placeholders = ",".join("?" * len(keys))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            if rows:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                found[key] = vector
+                self._remember(key, vector)
+        except sqlite3.Error as e:
+            logger.error(f"Embedding disk cache read failed: {e}")
+        return found
+
+    def put_many(self, items: Sequence[Tuple[str, Sequence[float]]]) -> None:
+        """Store ``(text, embedding)`` pairs in both tiers."""
+        entries = [
+            (content_key(text), np.asarray(embedding, dtype=np.float32))
+            for text, embedding in items if text and embedding is not None
+        ]
+        if not entries:
+            return
+        with self._lock:
+            for key, vector in entries:
+                self._remember(key, vector)
+            if self._conn is not None:
+                self._write_disk(entries)
+
+    def put(self, text: str, embedding: Sequence[float]) -> None:
+        self.put_many([(text, embedding)])
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _write_disk(self, entries: List[Tuple[str, np.ndarray]]) -> None:
+        now = time.time()
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    [(key, vector.tobytes(), now) for key, vector in entries]
+                )
+            self._inserts_since_check += len(entries)
+            if self._inserts_since_check >= self.EVICTION_CHECK_INTERVAL:
+                self._inserts_since_check = 0
+                self._evict_disk()
+        except sqlite3.Error as e:
+            logger.error(f"Embedding disk cache write failed: {e}")
+
+    def _evict_disk(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+            logger.info(f"Evicted {excess} entries from embedding disk cache")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM embeddings")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+        }
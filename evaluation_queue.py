@@ -0,0 +1,138 @@
+import contextvars
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationQueueFull(Exception):
+    """Raised when the evaluation backlog is at capacity."""
+
+
+class EvaluationQueue:
+    """Runs answer evaluations on a bounded background pool.
+
+    Results are stored in SQLite so any worker process can serve them from
+    ``/evaluation/<id>``, not just the one that ran the evaluation. An
+    evaluation that returns an "error" is stored as failed, and rows still
+    pending after ``stale_seconds`` (their worker died) are failed on startup.
+    """
+
+    def __init__(self, evaluate: Callable[[str, str, str], Dict], db_path: str = "evaluations.db",
+                 max_workers: int = 2, max_pending: int = 100, retention_seconds: int = 86400,
+                 stale_seconds: int = 600):
+        self.evaluate = evaluate
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self.stale_seconds = stale_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="evaluation")
+        # Counts queued plus running evaluations
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._local = threading.local()
+        self._init_db()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS evaluations (
+                id TEXT PRIMARY KEY,
+                status TEXT CHECK(status IN ('pending', 'complete', 'failed')),
+                evaluation_json TEXT,
+                created_at REAL,
+                completed_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_evaluations_created_at ON evaluations(created_at)")
+        # Other workers may share the database, so only rows too old to still
+        # be running count as abandoned
+        now = time.time()
+        stale = conn.execute(
+            "UPDATE evaluations SET status = 'failed', evaluation_json = ?, completed_at = ? "
+            "WHERE status = 'pending' AND created_at < ?",
+            (json.dumps({"error": "Evaluation failed: abandoned by a stopped worker"}), now,
+             now - self.stale_seconds)
+        ).rowcount
+        conn.commit()
+        if stale:
+            logger.warning(f"Marked {stale} abandoned evaluations as failed")
+
+    def submit(self, query: str, context: str, answer: str,
+               on_complete: Optional[Callable[[Dict], None]] = None) -> str:
+        """Queue an evaluation and return its id.
+
+        Raises EvaluationQueueFull instead of blocking when the backlog is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise EvaluationQueueFull("Evaluation queue is full")
+        evaluation_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM evaluations WHERE created_at < ?", (now - self.retention_seconds,))
+                conn.execute(
+                    "INSERT INTO evaluations (id, status, created_at) VALUES (?, 'pending', ?)",
+                    (evaluation_id, now)
+                )
+            # The copied context keeps the evaluation in the submitting request's trace
+            self._executor.submit(contextvars.copy_context().run, self._run,
+                                  evaluation_id, query, context, answer, on_complete)
+        except Exception:
+            self._slots.release()
+            raise
+        logger.info(f"Queued evaluation {evaluation_id}")
+        return evaluation_id
+
+    def _run(self, evaluation_id: str, query: str, context: str, answer: str,
+             on_complete: Optional[Callable[[Dict], None]]) -> None:
+        try:
+            try:
+                evaluation = self.evaluate(query, context, answer)
+                status = "failed" if "error" in evaluation else "complete"
+            except Exception as e:
+                logger.error(f"Evaluation {evaluation_id} failed: {e}", exc_info=True)
+                evaluation = {"error": f"Evaluation failed: {str(e)}"}
+                status = "failed"
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "UPDATE evaluations SET status = ?, evaluation_json = ?, completed_at = ? WHERE id = ?",
+                    (status, json.dumps(evaluation), time.time(), evaluation_id)
+                )
+            logger.info(f"Evaluation {evaluation_id} {status}")
+            if on_complete is not None:
+                on_complete(evaluation)
+        except Exception as e:
+            logger.error(f"Failed to store evaluation {evaluation_id}: {e}", exc_info=True)
+        finally:
+            self._slots.release()
+
+    def get(self, evaluation_id: str) -> Optional[Dict]:
+        """Return ``{"id", "status", "evaluation"}`` or None for an unknown id."""
+        row = self._connection().execute(
+            "SELECT id, status, evaluation_json FROM evaluations WHERE id = ?", (evaluation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "evaluation": json.loads(row[2]) if row[2] else None,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
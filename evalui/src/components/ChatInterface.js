@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import ChatInput from './ChatInput';
 import ChatResponse from './ChatResponse';
@@ -13,27 +13,61 @@ const ChatInterface = () => {
   const [response, setResponse] = useState(null);
   const [sources, setSources] = useState([]);
   const [evaluation, setEvaluation] = useState(null);
+  const [evaluationId, setEvaluationId] = useState(null);
+  const [feedbackEvaluationId, setFeedbackEvaluationId] = useState(null); // Survives polling, for /feedback
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState(null);
   const [showDebug, setShowDebug] = useState(process.env.NODE_ENV === 'development'); // Only show debug in development
 
+  // Poll for an evaluation the backend is still running in the background
+  useEffect(() => {
+    if (!evaluationId) return;
+    let cancelled = false;
+    let timer;
+
+    const poll = async () => {
+      try {
+        const result = await axios.get(`/api/evaluation/${evaluationId}`);
+        if (cancelled) return;
+        if (result.data.status === 'pending') {
+          timer = setTimeout(poll, 1000);
+          return;
+        }
+        console.log('Received evaluation:', result.data);
+        setEvaluation(result.data.evaluation || null);
+        setEvaluationId(null);
+      } catch (err) {
+        console.error('Error fetching evaluation:', err);
+        if (!cancelled) setEvaluationId(null);
+      }
+    };
+
+    poll();
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [evaluationId]);
+
   const handleSendMessage = async (message) => {
     setQuery(message);
     setIsLoading(true);
     setError(null);
+    setEvaluationId(null);
+    setFeedbackEvaluationId(null);
     
     console.log('Sending query to backend:', message);
     
     try {
       // Make API call to the backend
       console.log('Making API request to /api/chat');
-      const result = await axios.post('/api/chat', { query: message });
+      const result = await axios.post('/api/chat', { query: message, async_evaluation: true });
       
       // Log the full response for debugging
       console.log('Received API response:', result);
       
       // Process the response
-      const { answer, sources, evaluation } = result.data;
+      const { answer, sources, evaluation, evaluation_id } = result.data;
       
       console.log('Extracted answer:', answer);
       console.log('Extracted sources:', sources);
@@ -42,6 +76,8 @@ const ChatInterface = () => {
       setResponse(answer);
       setSources(sources || []);
       setEvaluation(evaluation || null);
+      setEvaluationId(evaluation ? null : evaluation_id || null);
+      setFeedbackEvaluationId(evaluation_id || null);
     } catch (err) {
       console.error('Error fetching response:', err);
       console.error('Error details:', err.response ? err.response.data : 'No response data');
@@ -57,6 +93,8 @@ const ChatInterface = () => {
         user_query: query,
         bot_response: response,
         evaluation_json: JSON.stringify(evaluation),
+        // Lets the backend attach the evaluation if our poll never delivered it
+        ...(feedbackEvaluationId && { evaluation_id: feedbackEvaluationId }),
         vote,
         comment
       });
@@ -122,9 +160,10 @@ const ChatInterface = () => {
           <div className="response-container">
             <ChatResponse response={response} sources={sources} />
             
-            <EvaluationCard evaluation={evaluation} />
+            <EvaluationCard evaluation={evaluation} pending={Boolean(evaluationId)} />
             
-            <FeedbackButtons onFeedbackSubmit={handleFeedbackSubmit} />
+            {/* Votes are stored with the evaluation, so wait for it to arrive */}
+            <FeedbackButtons onFeedbackSubmit={handleFeedbackSubmit} disabled={Boolean(evaluationId)} />
           </div>
         )}
         
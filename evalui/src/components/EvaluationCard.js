@@ -2,8 +2,20 @@ import React from 'react';
 import { useTheme } from '../contexts/ThemeContext';
 import './EvaluationCard.css';
 
-const EvaluationCard = ({ evaluation }) => {
+const EvaluationCard = ({ evaluation, pending = false }) => {
   const { getThemeClass, getThemeStyle } = useTheme();
+
+  if (pending && !evaluation) {
+    return (
+      <div className={getThemeClass('evaluationCard')} style={getThemeStyle('evaluationCard')}>
+        <h3 className={getThemeClass('evaluationHeader')} style={getThemeStyle('evaluationHeader')}>Evaluation</h3>
+        <div className={getThemeClass('evaluationContent')} style={getThemeStyle('evaluationContent')}>
+          Evaluating response...
+        </div>
+      </div>
+    );
+  }
+
   if (!evaluation) return null;
 
   // Handle case where evaluation is just raw text
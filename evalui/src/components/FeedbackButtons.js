@@ -2,7 +2,7 @@ import React, { useState } from 'react';
 import { useTheme } from '../contexts/ThemeContext';
 import './FeedbackButtons.css';
 
-const FeedbackButtons = ({ onFeedbackSubmit }) => {
+const FeedbackButtons = ({ onFeedbackSubmit, disabled = false }) => {
   const { getThemeClass, getThemeStyle } = useTheme();
   const [feedback, setFeedback] = useState(null);
   const [comment, setComment] = useState('');
@@ -10,12 +10,13 @@ const FeedbackButtons = ({ onFeedbackSubmit }) => {
   const [submitted, setSubmitted] = useState(false);
 
   const handleFeedbackClick = (value) => {
+    if (disabled) return;
     setFeedback(value);
     setShowCommentBox(true);
   };
 
   const handleSubmit = () => {
-    if (feedback) {
+    if (feedback && !disabled) {
       onFeedbackSubmit(feedback, comment);
       setSubmitted(true);
       setShowCommentBox(false);
@@ -41,12 +42,13 @@ const FeedbackButtons = ({ onFeedbackSubmit }) => {
   return (
     <div className={getThemeClass('feedbackContainer')} style={getThemeStyle('feedbackContainer')}>
       <div className="feedback-prompt">
-        <span className={getThemeClass('feedbackTitle')} style={getThemeStyle('feedbackTitle')}>Was this response helpful?</span>
+        <span className={getThemeClass('feedbackTitle')} style={getThemeStyle('feedbackTitle')}>{disabled ? 'Waiting for the evaluation...' : 'Was this response helpful?'}</span>
         <div className={getThemeClass('feedbackButtons')} style={getThemeStyle('feedbackButtons')}>
           <button 
             className={`${getThemeClass('feedbackButton')} ${getThemeClass('feedbackButtonPositive')} ${feedback === 'yes' ? 'selected' : ''}`}
             style={getThemeStyle('feedbackButton')}
             onClick={() => handleFeedbackClick('yes')}
+            disabled={disabled}
             aria-label="Thumbs up"
           >
             👍
@@ -55,6 +57,7 @@ const FeedbackButtons = ({ onFeedbackSubmit }) => {
             className={`${getThemeClass('feedbackButton')} ${getThemeClass('feedbackButtonNegative')} ${feedback === 'no' ? 'selected' : ''}`}
             style={getThemeStyle('feedbackButton')}
             onClick={() => handleFeedbackClick('no')}
+            disabled={disabled}
             aria-label="Thumbs down"
           >
             👎
@@ -80,6 +83,7 @@ const FeedbackButtons = ({ onFeedbackSubmit }) => {
               className={getThemeClass('feedbackSubmit')}
               style={getThemeStyle('feedbackSubmit')}
               onClick={handleSubmit}
+              disabled={disabled}
             >
               Submit Feedback
             </button>
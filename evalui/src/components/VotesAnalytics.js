@@ -15,12 +15,18 @@ function getDefaultDateRange() {
 const VotesAnalytics = () => {
   const [votes, setVotes] = useState([]);
   const [statistics, setStatistics] = useState(null);
+  const [accuracy, setAccuracy] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [filter, setFilter] = useState('all');
   const [page, setPage] = useState(1);
   const [limit] = useState(10);
+  // cursors[n] is the cursor that fetches page n + 1; page 1 needs none
+  const [cursors, setCursors] = useState([null]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [expandedVote, setExpandedVote] = useState(null);
+  // Full response/evaluation of the expanded vote; the list only has summaries
+  const [voteDetails, setVoteDetails] = useState(null);
 
   // Date range state for CSV export
   const defaultRange = getDefaultDateRange();
@@ -35,9 +41,11 @@ const VotesAnalytics = () => {
       try {
         // Fetch votes
         const votesParams = {
-          offset: (page - 1) * limit,
           limit: limit
         };
+        if (cursors[page - 1]) {
+          votesParams.cursor = cursors[page - 1];
+        }
         
         if (filter !== 'all') {
           votesParams.vote = filter;
@@ -47,11 +55,24 @@ const VotesAnalytics = () => {
         const votesResponse = await axios.get('http://localhost:5001/votes', { params: votesParams });
         console.log('Votes response:', votesResponse);
         setVotes(votesResponse.data.votes || []);
+        const next = votesResponse.data.next_cursor || null;
+        setNextCursor(next);
+        if (next) {
+          setCursors(prev => {
+            const updated = prev.slice(0, page);
+            updated[page] = next;
+            return updated;
+          });
+        }
         
         // Fetch statistics
         const statsResponse = await axios.get('http://localhost:5001/votes/statistics');
         console.log('Statistics response:', statsResponse);
         setStatistics(statsResponse.data);
+
+        // Fetch evaluator accuracy by day and response type
+        const accuracyResponse = await axios.get('http://localhost:5001/votes/accuracy');
+        setAccuracy(accuracyResponse.data.breakdown || []);
         
         setError(null);
       } catch (err) {
@@ -63,6 +84,8 @@ const VotesAnalytics = () => {
     };
     
     fetchData();
+    // cursors is read, not watched: it changes as a result of this fetch
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [filter, page, limit]);
 
   // CSV export handler
@@ -70,53 +93,17 @@ const VotesAnalytics = () => {
     setCsvLoading(true);
     setError(null);
     try {
-      const params = {
-        start_date: startDate,
-        end_date: endDate,
-      };
-      // Fetch all votes in date range (no limit)
-      const response = await axios.get('http://localhost:5001/votes', { params });
-      const allVotes = response.data.votes || [];
-      if (allVotes.length === 0) {
+      // The server streams the CSV, so large ranges don't load into memory there
+      const response = await axios.get('http://localhost:5001/votes/export', {
+        params: { format: 'csv', start_date: startDate, end_date: endDate },
+        responseType: 'blob',
+      });
+      const csvContent = await response.data.text();
+      if (csvContent.trim().split('\n').length <= 1) {
         setError('No votes found in the selected date range.');
         setCsvLoading(false);
         return;
       }
-      // Convert to CSV
-      const headers = [
-        'id',
-        'user_query',
-        'bot_response',
-        'evaluation_json',
-        'vote',
-        'comment',
-        'timestamp'
-      ];
-      const csvRows = [
-        headers.join(','),
-        ...allVotes.map(vote =>
-          headers.map(h => {
-            let val = vote[h];
-            if (h === 'evaluation_json') {
-              // Ensure JSON is stringified and escaped
-              try {
-                val = typeof val === 'string' ? val : JSON.stringify(val);
-              } catch {
-                val = '';
-              }
-            }
-            // Escape double quotes and wrap in quotes if needed
-            if (typeof val === 'string') {
-              val = val.replace(/"/g, '""');
-              if (val.includes(',') || val.includes('"') || val.includes('\n')) {
-                val = `"${val}"`;
-              }
-            }
-            return val ?? '';
-          }).join(',')
-        )
-      ];
-      const csvContent = csvRows.join('\n');
       // Trigger download
       const blob = new Blob([csvContent], { type: 'text/csv' });
       const url = URL.createObjectURL(blob);
@@ -139,6 +126,7 @@ const VotesAnalytics = () => {
   const handleFilterChange = (e) => {
     setFilter(e.target.value);
     setPage(1); // Reset to first page when filter changes
+    setCursors([null]);
   };
 
   // Handle page change
@@ -147,11 +135,19 @@ const VotesAnalytics = () => {
   };
 
   // Toggle expanded vote
-  const toggleExpandVote = (id) => {
+  const toggleExpandVote = async (id) => {
     if (expandedVote === id) {
       setExpandedVote(null);
-    } else {
-      setExpandedVote(id);
+      return;
+    }
+    setExpandedVote(id);
+    setVoteDetails(null);
+    try {
+      const response = await axios.get(`http://localhost:5001/votes/${id}`);
+      setVoteDetails(response.data);
+    } catch (err) {
+      console.error('Error fetching vote details:', err);
+      setVoteDetails({ id, bot_response: 'Failed to load details.', evaluation_json: '' });
     }
   };
 
@@ -245,6 +241,35 @@ const VotesAnalytics = () => {
               </div>
             </div>
           )}
+
+          {/* Accuracy Section */}
+          {accuracy.length > 0 && (
+            <div className="statistics-section">
+              <h3>Evaluator Accuracy</h3>
+              <table className="votes-table">
+                <thead>
+                  <tr>
+                    <th>Day</th>
+                    <th>Category</th>
+                    <th>Votes</th>
+                    <th>Evaluated</th>
+                    <th>Factually Correct</th>
+                  </tr>
+                </thead>
+                <tbody>
+                  {accuracy.map(row => (
+                    <tr key={`${row.day}-${row.category}`}>
+                      <td>{row.day}</td>
+                      <td>{row.category}</td>
+                      <td>{row.votes}</td>
+                      <td>{row.evaluated}</td>
+                      <td>{row.accuracy === null ? '-' : `${row.accuracy.toFixed(1)}%`}</td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+            </div>
+          )}
           
           {/* Votes Table Section */}
           <div className="votes-table-section">
@@ -272,7 +297,7 @@ const VotesAnalytics = () => {
                 <span>Page {page}</span>
                 <button 
                   onClick={() => handlePageChange(page + 1)} 
-                  disabled={votes.length < limit}
+                  disabled={!nextCursor}
                 >
                   Next
                 </button>
@@ -326,7 +351,7 @@ const VotesAnalytics = () => {
                               
                               <div className="expanded-section">
                                 <h4>Bot Response</h4>
-                                <p>{vote.bot_response}</p>
+                                <p>{voteDetails && voteDetails.id === vote.id ? voteDetails.bot_response : 'Loading...'}</p>
                               </div>
                               
                               {vote.comment && (
@@ -338,7 +363,7 @@ const VotesAnalytics = () => {
                               
                               <div className="expanded-section">
                                 <h4>Evaluation</h4>
-                                <pre>{vote.evaluation_json}</pre>
+                                <pre>{voteDetails && voteDetails.id === vote.id ? voteDetails.evaluation_json : 'Loading...'}</pre>
                               </div>
                             </div>
                           </td>
@@ -21,6 +21,7 @@ module.exports = function(app) {
   app.use('/api', createProxyMiddleware(proxyConfig));
   app.use('/chat', createProxyMiddleware(proxyConfig));
   app.use('/feedback', createProxyMiddleware(proxyConfig));
+  app.use('/evaluation', createProxyMiddleware(proxyConfig));
   app.use('/votes', createProxyMiddleware({...proxyConfig, pathRewrite: {'^/votes': '/votes'}}));
   app.use('/votes/statistics', createProxyMiddleware({...proxyConfig, pathRewrite: {'^/votes/statistics': '/votes/statistics'}}));
   app.use('/health', createProxyMiddleware(proxyConfig));
@@ -0,0 +1,99 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR before any
+# worker imports this module; every worker then writes its samples to files
+# there and render() merges them, so /metrics is the same whichever worker
+# serves the scrape. Without it (python api.py, uvicorn) the metrics are
+# simply per-process.
+
+STAGE_DURATION = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of answering a chat",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90),
+)
+STAGE_ERRORS = Counter(
+    "rag_stage_errors_total",
+    "Stage failures, including ones answered with a fallback",
+    ["stage"],
+)
+TOKENS = Histogram(
+    "rag_tokens",
+    "Tokens per Azure OpenAI call, from response.usage",
+    ["operation", "kind"],
+    buckets=(10, 25, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "rag_http_request_duration_seconds",
+    "HTTP request latency by endpoint",
+    ["endpoint", "method", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Time the enclosed block as ``stage`` and count it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        STAGE_ERRORS.labels(stage).inc()
+        # Tell record_error this one is already counted, should it reach a
+        # pipeline stage of the same name
+        try:
+            exc._rag_counted_stages = getattr(exc, "_rag_counted_stages", ()) + (stage,)
+        except AttributeError:
+            pass
+        raise
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - start)
+
+
+def record_error(stage: str, exc: Optional[BaseException] = None) -> None:
+    """Count a failure that track_stage did not see, e.g. a pipeline stage timing out.
+
+    ``exc`` is skipped if track_stage already counted it under ``stage``.
+    """
+    if stage in getattr(exc, "_rag_counted_stages", ()):
+        return
+    STAGE_ERRORS.labels(stage).inc()
+
+
+def record_usage(operation: str, response) -> None:
+    """Observe the prompt/completion token counts reported in ``response.usage``.
+
+    Streamed responses only report usage in their last chunk, and only when
+    requested with ``stream_options={"include_usage": True}``, so a response
+    without it is skipped.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        count = getattr(usage, kind, None)
+        if count is not None:
+            TOKENS.labels(operation, kind.replace("_tokens", "")).observe(count)
+
+
+def render() -> Tuple[bytes, str]:
+    """Prometheus text exposition of every metric, across workers when multiprocess."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
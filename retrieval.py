@@ -0,0 +1,301 @@
+import abc
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ann_index import IVFIndex, save_array
+from config import FIELD_MAPPINGS, RRF_K, VECTOR_INDEX
+from similarity import Vector, as_matrix, normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class Retriever(abc.ABC):
+    """Source of search results for AzureRAGAssistant.search_knowledge_base.
+
+    ``search`` returns dicts shaped like the Azure Search results:
+    ``{"chunk", "title", "relevance"}``, best first, with relevance in [0, 1]
+    so scoring downstream does not depend on the backend.
+    """
+
+    @abc.abstractmethod
+    def search(self, query: str, query_embedding: Optional[Vector], top: int = 10) -> List[Dict]:
+        """Return the ``top`` best results for the query."""
+
+
+class BM25Index:
+    """In-memory BM25 inverted index (Okapi weighting, Lucene-style IDF)."""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(texts)
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = np.zeros(self.num_docs, dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((doc_id, tf))
+        self.doc_lengths = lengths
+        self.avg_doc_length = float(lengths.mean()) if self.num_docs else 0.0
+        # term -> (doc ids, term frequencies, idf)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, entries in postings.items():
+            docs = np.fromiter((doc for doc, _ in entries), dtype=np.int32, count=len(entries))
+            tfs = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            df = len(entries)
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            self.postings[term] = (docs, tfs, idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        if not self.num_docs or self.avg_doc_length == 0:
+            return scores
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            docs, tfs, idf = entry
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avg_doc_length)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(doc ids, scores)`` of the top-k documents that match any query term."""
+        scores = self.scores(query)
+        matching = np.flatnonzero(scores > 0)
+        order = matching[top_k_indices(scores[matching], k)]
+        return order, scores[order]
+
+
+class ExactVectorIndex:
+    """Brute-force cosine search over a (possibly memory-mapped) matrix.
+
+    Rows are stored L2-normalized, so a search is one matrix-vector product.
+    Fine up to a few hundred thousand rows; beyond that use ann_index.IVFIndex.
+    """
+
+    def __init__(self, vectors: np.ndarray, deleted: Optional[np.ndarray] = None):
+        self.vectors = vectors
+        self.deleted = deleted if deleted is not None else np.zeros(vectors.shape[0], dtype=bool)
+
+    @classmethod
+    def from_vectors(cls, vectors: Iterable[Vector]) -> "ExactVectorIndex":
+        return cls(normalize_rows(as_matrix(list(vectors))))
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def search(self, query_vector: Vector, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm == 0 or len(self) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+        scores = self.vectors @ (query / norm)
+        live = np.flatnonzero(~self.deleted)
+        order = live[top_k_indices(scores[live], k)] if self.deleted.any() else top_k_indices(scores, k)
+        return order, scores[order]
+
+    def add(self, vectors) -> np.ndarray:
+        """Append vectors and return their ids; copies a memory-mapped matrix into memory."""
+        vectors = normalize_rows(as_matrix(vectors))
+        ids = np.arange(len(self), len(self) + vectors.shape[0])
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(ids), dtype=bool)])
+        return ids
+
+    def delete(self, ids) -> None:
+        self.deleted[np.asarray(ids, dtype=np.int64)] = True
+
+    def save(self, path: str) -> None:
+        save_array(os.path.join(path, "vectors.npy"), np.asarray(self.vectors, dtype=np.float32))
+        # An IVF index previously saved here would otherwise be loaded instead
+        if IVFIndex.exists(path):
+            os.remove(os.path.join(path, "ann_meta.json"))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "ExactVectorIndex":
+        return cls(np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Merge ranked id lists into ``(id, score)`` pairs, best first.
+
+    Each list contributes ``1 / (k + rank)`` per document (rank from 1),
+    which is how Azure Search fuses the text and vector legs of a hybrid
+    query.
+    """
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[int(doc_id)] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))
+
+
+class LocalHybridRetriever(Retriever):
+    """Offline stand-in for the Azure hybrid query: BM25 + vectors, fused with RRF.
+
+    Built from documents carrying the index's FIELD_MAPPINGS fields
+    (id, chunk, title, text_vector), e.g. an export of the Azure index.
+    Each leg returns ``candidates`` results before fusion, like the
+    ``k_nearest_neighbors`` of the Azure vector query. ``relevance`` is the
+    fused score divided by the best one possible (first in every leg), so it
+    falls in [0, 1] however many legs ran.
+
+    The vector leg is an ExactVectorIndex or, for large corpora, an
+    ann_index.IVFIndex. Deleted documents stay in place (so ids remain
+    positions in ``documents``) and are skipped by both legs.
+    """
+
+    def __init__(self, documents: List[Dict], vector_index, candidates: int = 50, rrf_k: int = RRF_K):
+        if len(documents) != len(vector_index):
+            raise ValueError("Every document needs exactly one vector")
+        self.documents = documents
+        self.vector_index = vector_index
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self._index_text()
+        deleted = [doc_id for doc_id, doc in enumerate(documents) if doc.get("deleted")]
+        if deleted:
+            self.vector_index.delete(deleted)
+
+    def _index_text(self) -> None:
+        self.bm25 = BM25Index([f"{doc['title']}\n{doc['chunk']}" for doc in self.documents])
+        self.live = np.array([not doc.get("deleted") for doc in self.documents], dtype=bool)
+
+    @staticmethod
+    def _document(document: Dict, field_mappings: Dict[str, str]) -> Tuple[Dict, Vector]:
+        return {
+            "id": document.get(field_mappings["id"]),
+            "chunk": (document.get(field_mappings["content"]) or "").strip(),
+            "title": document.get(field_mappings["title"]) or "Untitled Document",
+        }, document[field_mappings["text_vector"]]
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict], field_mappings: Dict[str, str] = FIELD_MAPPINGS,
+                       vector_index: str = VECTOR_INDEX, **kwargs) -> "LocalHybridRetriever":
+        """Index documents; ``vector_index`` is "exact" or "ivf"."""
+        docs, vectors = [], []
+        for document in documents:
+            doc, vector = cls._document(document, field_mappings)
+            docs.append(doc)
+            vectors.append(vector)
+        if vector_index == "ivf":
+            index = IVFIndex.build(vectors)
+        elif vector_index == "exact":
+            index = ExactVectorIndex.from_vectors(vectors)
+        else:
+            raise ValueError(f"Unknown VECTOR_INDEX: {vector_index}")
+        return cls(docs, index, **kwargs)
+
+    def add_documents(self, documents: Iterable[Dict], field_mappings: Dict[str, str] = FIELD_MAPPINGS) -> None:
+        """Insert documents; the BM25 index is rebuilt, the vector index updated in place."""
+        docs, vectors = [], []
+        for document in documents:
+            doc, vector = self._document(document, field_mappings)
+            docs.append(doc)
+            vectors.append(vector)
+        if not docs:
+            return
+        self.vector_index.add(vectors)
+        self.documents.extend(docs)
+        self._index_text()
+
+    def delete_documents(self, ids: Iterable) -> int:
+        """Delete documents by their index id (FIELD_MAPPINGS["id"]); returns how many matched."""
+        ids = set(ids)
+        positions = [pos for pos, doc in enumerate(self.documents) if doc["id"] in ids and not doc.get("deleted")]
+        for pos in positions:
+            self.documents[pos]["deleted"] = True
+            self.live[pos] = False
+        if positions:
+            self.vector_index.delete(positions)
+        return len(positions)
+
+    def search(self, query: str, query_embedding: Optional[Vector], top: int = 10) -> List[Dict]:
+        text_ranking = self.bm25.search(query, self.candidates + int((~self.live).sum()))[0]
+        rankings = [text_ranking[self.live[text_ranking]][:self.candidates]]
+        if query_embedding is not None:
+            rankings.append(self.vector_index.search(query_embedding, self.candidates)[0])
+        best_possible = len(rankings) / (self.rrf_k + 1)
+        results = []
+        for doc_id, score in reciprocal_rank_fusion(rankings, self.rrf_k)[:top]:
+            document = self.documents[doc_id]
+            results.append({"chunk": document["chunk"], "title": document["title"],
+                            "relevance": score / best_possible})
+        return results
+
+    def save(self, path: str) -> None:
+        """Write documents.json and the vector index; the BM25 index is rebuilt on load."""
+        os.makedirs(path, exist_ok=True)
+        tmp_path = os.path.join(path, "documents.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.documents, f)
+        os.replace(tmp_path, os.path.join(path, "documents.json"))
+        self.vector_index.save(path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, **kwargs) -> "LocalHybridRetriever":
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as f:
+            documents = json.load(f)
+        if IVFIndex.exists(path):
+            vector_index = IVFIndex.load(path, mmap=mmap)
+        else:
+            vector_index = ExactVectorIndex.load(path, mmap=mmap)
+        retriever = cls(documents, vector_index, **kwargs)
+        logger.info(f"Loaded local index from {path} with {len(documents)} documents")
+        return retriever
+
+
+def read_jsonl(path: str) -> Iterable[Dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def export_azure_index(path: str) -> int:
+    """Dump every document of the configured Azure Search index to JSONL."""
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+    from config import SEARCH_ENDPOINT, SEARCH_INDEX, SEARCH_KEY
+
+    search_client = SearchClient(
+        endpoint=f"https://{SEARCH_ENDPOINT}.search.windows.net",
+        index_name=SEARCH_INDEX,
+        credential=AzureKeyCredential(SEARCH_KEY)
+    )
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for document in search_client.search(search_text="*", select=list(FIELD_MAPPINGS.values())):
+            f.write(json.dumps({field: document.get(field) for field in FIELD_MAPPINGS.values()}) + "\n")
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] == "export-azure":
+        print(f"Exported {export_azure_index(sys.argv[2])} documents")
+    elif len(sys.argv) == 4 and sys.argv[1] == "build":
+        retriever = LocalHybridRetriever.from_documents(read_jsonl(sys.argv[2]))
+        retriever.save(sys.argv[3])
+        print(f"Indexed {len(retriever.documents)} documents into {sys.argv[3]}")
+    else:
+        print("Usage: python retrieval.py export-azure <documents.jsonl>\n"
+              "       python retrieval.py build <documents.jsonl> <index_dir>")
+        sys.exit(1)
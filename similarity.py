@@ -0,0 +1,62 @@
+import numpy as np
+from typing import List, Optional, Sequence, Tuple, Union
+
+Vector = Union[Sequence[float], np.ndarray]
+
+
+def as_matrix(vectors: Union[Sequence[Vector], np.ndarray]) -> np.ndarray:
+    """Stack vectors into a 2-D float32 matrix (one row per vector)."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit L2 norm; all-zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def cosine_similarities(query_vector: Vector, candidate_vectors: Union[Sequence[Vector], np.ndarray]) -> np.ndarray:
+    """Cosine similarity of one query vector against every row of a candidate matrix.
+
+    Zero-length vectors score 0 instead of producing NaNs.
+    """
+    query = np.asarray(query_vector, dtype=np.float32).ravel()
+    if len(candidate_vectors) == 0:
+        return np.zeros(0, dtype=np.float32)
+    matrix = as_matrix(candidate_vectors)
+    if matrix.shape[1] != query.shape[0]:
+        raise ValueError("Vectors must have the same dimension")
+
+    query_norm = np.linalg.norm(query)
+    if query_norm == 0:
+        return np.zeros(matrix.shape[0], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * query_norm
+    dots = matrix @ query
+    return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    scores = np.asarray(scores)
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def rank_by_similarity(query_vector: Vector, candidate_vectors: Union[Sequence[Vector], np.ndarray],
+                       k: int, threshold: Optional[float] = None) -> List[Tuple[int, float]]:
+    """Return ``(index, score)`` pairs for the top-k candidates above ``threshold``."""
+    scores = cosine_similarities(query_vector, candidate_vectors)
+    if threshold is not None:
+        eligible = np.flatnonzero(scores > threshold)
+    else:
+        eligible = np.arange(scores.shape[0])
+    order = eligible[top_k_indices(scores[eligible], k)]
+    return [(int(i), float(scores[i])) for i in order]
@@ -6,7 +6,7 @@ echo "Creating backend and frontend folders..."
 mkdir -p backend frontend
 
 echo "Copying backend files..."
-cp api.py assistant_core.py config.py rag_assistant.py vote_manager.py backend/
+cp api.py assistant_core.py config.py rag_assistant.py similarity.py embedding_cache.py response_cache.py pipeline.py evaluation_queue.py async_rag_assistant.py async_assistant_core.py asgi.py vote_manager.py sqlalchemy_vote_store.py retrieval.py ann_index.py metrics.py tracing.py logging_setup.py context_builder.py diversity.py gunicorn.conf.py backend/
 cp Dockerfile docker-compose.yml Procfile .env.template requirements.txt runtime.txt backend/
 cp start_app.sh stop_servers.sh backend/
 cp -r __pycache__ feedback_data logs backend/
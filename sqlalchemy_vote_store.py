@@ -0,0 +1,413 @@
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    Text,
+    case,
+    create_engine,
+    func,
+    select,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.types import TypeDecorator
+
+from config import VOTES_DB_POOL_SIZE, VOTES_DB_MAX_OVERFLOW, VOTES_DB_POOL_RECYCLE, VOTES_COMPRESS_MIN_BYTES
+from vote_manager import (
+    EVALUATION_COLUMNS,
+    EXPORT_COLUMNS,
+    PAYLOAD_COLUMNS,
+    SUMMARY_COLUMNS,
+    VoteStorage,
+    VoteStore,
+    compress_text,
+    decode_cursor,
+    encode_cursor,
+    extract_evaluation_fields,
+)
+
+logger = logging.getLogger(__name__)
+
+# Same text format SQLite's CURRENT_TIMESTAMP produces, so cursors and API
+# output look identical whichever backend stored the vote
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# SQLite keeps DATETIME as text; store it in that same format rather than
+# SQLAlchemy's default with microseconds, so rows match VoteStore's
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
+
+def _is_zlib_stream(raw):
+    # Compression method 8 in the low nibble and a header divisible by 31
+    return len(raw) >= 2 and raw[0] & 0x0F == 8 and ((raw[0] << 8) | raw[1]) % 31 == 0
+
+
+class CompressedText(TypeDecorator):
+    """Text that is zlib-compressed once it reaches ``min_bytes``, like VoteStore's payloads.
+
+    On SQLite shorter values stay TEXT, exactly as VoteStore writes them, so
+    an existing votes.db reads back as is. Other databases get a binary
+    column holding either the compressed value or plain UTF-8; plain text
+    that happens to start with a zlib header is compressed regardless, so the
+    header alone tells the two apart.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, min_bytes=VOTES_COMPRESS_MIN_BYTES):
+        super().__init__()
+        self.min_bytes = min_bytes
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            # A TEXT column still stores BLOB values unchanged
+            return dialect.type_descriptor(Text())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        value = compress_text(value, self.min_bytes)
+        if isinstance(value, bytes) or dialect.name == "sqlite":
+            return value
+        raw = value.encode("utf-8")
+        return zlib.compress(raw, 6) if _is_zlib_stream(raw) else raw
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        raw = bytes(value)
+        if _is_zlib_stream(raw):
+            return zlib.decompress(raw).decode("utf-8")
+        return raw.decode("utf-8")
+
+
+metadata = MetaData()
+
+votes = Table(
+    "votes",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_query", Text),
+    Column("bot_response", CompressedText),
+    Column("evaluation_json", CompressedText),
+    Column("vote", String(3), CheckConstraint("vote IN ('yes', 'no')"), nullable=False),
+    Column("comment", Text),
+    Column("timestamp", Timestamp, nullable=False),
+    Column("day", String(10), nullable=False),
+    Column("factually_correct", Integer),
+    Column("bot_understood_question", Integer),
+    Column("response_type", String(32)),
+    Column("response_effectiveness", String(32)),
+    Column("engagement_proactiveness", String(32)),
+    Column("context_utilization", String(32)),
+    Column("confidence_in_evaluation", Integer),
+    Column("unsupported_claims", Integer),
+    Index("idx_votes_timestamp", "timestamp"),
+    Index("idx_votes_vote_timestamp", "vote", "timestamp"),
+    Index("idx_votes_day", "day"),
+    Index("idx_votes_day_type_correct", "day", "response_type", "factually_correct"),
+    Index("idx_votes_correct_day", "factually_correct", "day"),
+)
+
+vote_daily_stats = Table(
+    "vote_daily_stats",
+    metadata,
+    Column("day", String(10), primary_key=True),
+    Column("total", Integer, nullable=False, default=0),
+    Column("yes", Integer, nullable=False, default=0),
+    Column("no", Integer, nullable=False, default=0),
+    Column("with_comment", Integer, nullable=False, default=0),
+)
+
+
+def normalize_database_url(url):
+    # Heroku still hands out postgres:// URLs, which SQLAlchemy 1.4+ rejects
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+class SQLAlchemyVoteStore(VoteStorage):
+    """Vote storage on any SQLAlchemy database through a pooled engine.
+
+    Meant for Postgres, so that every dyno and worker shares one set of
+    votes; SQLite URLs work too, including one pointing at a votes.db that
+    VoteStore created. Payload columns are compressed past
+    VOTES_COMPRESS_MIN_BYTES, as in VoteStore. The engine's pool is replaced
+    after a fork so gunicorn workers never share connections.
+    """
+
+    def __init__(self, url, pool_size=VOTES_DB_POOL_SIZE, max_overflow=VOTES_DB_MAX_OVERFLOW,
+                 pool_recycle=VOTES_DB_POOL_RECYCLE):
+        if not url:
+            raise ValueError("VOTES_DATABASE_URL must be set when VOTES_BACKEND is 'sqlalchemy'")
+        url = normalize_database_url(url)
+        options = {"pool_pre_ping": True}
+        if not url.startswith("sqlite"):
+            options.update(pool_size=pool_size, max_overflow=max_overflow, pool_recycle=pool_recycle)
+        self._engine = create_engine(url, **options)
+        self._pid = os.getpid()
+
+    @property
+    def engine(self):
+        if self._pid != os.getpid():
+            # Drop the parent's pooled connections without closing them under it
+            self._engine.dispose(close=False)
+            self._pid = os.getpid()
+        return self._engine
+
+    def init_db(self):
+        database = self.engine.url.database
+        if self.engine.dialect.name == "sqlite" and database and database != ":memory:":
+            # Same layout as VoteStore's, so let its migrations create the file
+            # or upgrade an older votes.db (no day or evaluator columns yet)
+            store = VoteStore(database)
+            try:
+                store.init_db()
+            finally:
+                store.close()
+        metadata.create_all(self.engine)
+
+    def dispose(self):
+        self.engine.dispose()
+
+    def _add_daily_stats(self, conn, day, total, yes, no, with_comment):
+        values = {"day": day, "total": total, "yes": yes, "no": no, "with_comment": with_comment}
+        dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(conn.dialect.name)
+        if dialect is not None:
+            statement = dialect.insert(vote_daily_stats).values(**values)
+            conn.execute(statement.on_conflict_do_update(
+                index_elements=["day"],
+                set_={
+                    column: vote_daily_stats.c[column] + statement.excluded[column]
+                    for column in ("total", "yes", "no", "with_comment")
+                }
+            ))
+            return
+        updated = conn.execute(
+            vote_daily_stats.update()
+            .where(vote_daily_stats.c.day == day)
+            .values(
+                total=vote_daily_stats.c.total + total,
+                yes=vote_daily_stats.c.yes + yes,
+                no=vote_daily_stats.c.no + no,
+                with_comment=vote_daily_stats.c.with_comment + with_comment,
+            )
+        )
+        if updated.rowcount == 0:
+            conn.execute(vote_daily_stats.insert().values(**values))
+
+    def record_votes(self, votes_to_record):
+        """Insert many ``(user_query, bot_response, evaluation_json, vote, comment)`` rows in one transaction."""
+        votes_to_record = list(votes_to_record)
+        for vote in votes_to_record:
+            if vote[3] not in ["yes", "no"]:
+                raise ValueError("Vote must be 'yes' or 'no'")
+        if not votes_to_record:
+            return
+
+        # UTC to second precision, matching SQLite's CURRENT_TIMESTAMP
+        now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        day = now.strftime("%Y-%m-%d")
+        rows = []
+        for user_query, bot_response, evaluation_json, vote, comment in votes_to_record:
+            row = {
+                "user_query": user_query,
+                "bot_response": bot_response,
+                "evaluation_json": evaluation_json,
+                "vote": vote,
+                "comment": comment,
+                "timestamp": now,
+                "day": day,
+            }
+            row.update(zip(EVALUATION_COLUMNS, extract_evaluation_fields(evaluation_json)))
+            rows.append(row)
+
+        # The votes and their rollup row commit together
+        with self.engine.begin() as conn:
+            conn.execute(votes.insert(), rows)
+            self._add_daily_stats(
+                conn, day,
+                total=len(rows),
+                yes=sum(row["vote"] == "yes" for row in rows),
+                no=sum(row["vote"] == "no" for row in rows),
+                with_comment=sum(bool(row["comment"]) for row in rows),
+            )
+
+    def _filter_conditions(self, vote_filter=None, start_date=None, end_date=None):
+        conditions = []
+        if vote_filter:
+            conditions.append(votes.c.vote == vote_filter)
+
+        if start_date:
+            try:
+                conditions.append(votes.c.timestamp >= datetime.strptime(start_date, "%Y-%m-%d"))
+            except Exception as e:
+                logger.error(f"Invalid start_date format: {start_date} - {e}")
+
+        if end_date:
+            try:
+                end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+                conditions.append(votes.c.timestamp < end)
+            except Exception as e:
+                logger.error(f"Invalid end_date format: {end_date} - {e}")
+
+        return conditions
+
+    @staticmethod
+    def _select(include_payload):
+        names = SUMMARY_COLUMNS + PAYLOAD_COLUMNS if include_payload else SUMMARY_COLUMNS
+        return select(*(votes.c[name] for name in names))
+
+    @staticmethod
+    def _vote_dict(row):
+        vote = dict(row._mapping)
+        if vote.get("timestamp") is not None:
+            vote["timestamp"] = vote["timestamp"].strftime(TIMESTAMP_FORMAT)
+        return vote
+
+    def fetch_vote(self, vote_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(self._select(True).where(votes.c.id == vote_id)).first()
+        return self._vote_dict(row) if row is not None else None
+
+    def fetch_votes(self, limit=None, offset=0, vote_filter=None, start_date=None, end_date=None,
+                    include_payload=False):
+        query = (
+            self._select(include_payload)
+            .where(*self._filter_conditions(vote_filter, start_date, end_date))
+            .order_by(votes.c.timestamp.desc(), votes.c.id.desc())
+        )
+        if limit is not None:
+            query = query.limit(limit).offset(offset)
+
+        try:
+            with self.engine.connect() as conn:
+                return [self._vote_dict(row) for row in conn.execute(query)]
+        except Exception as e:
+            logger.error(f"Error executing fetch_votes query: {e}")
+            return []
+
+    def fetch_votes_page(self, limit, cursor=None, vote_filter=None, start_date=None, end_date=None,
+                         include_payload=False):
+        conditions = self._filter_conditions(vote_filter, start_date, end_date)
+        if cursor:
+            last_timestamp, last_id = decode_cursor(cursor)
+            try:
+                last_timestamp = datetime.strptime(last_timestamp, TIMESTAMP_FORMAT)
+            except ValueError as e:
+                raise ValueError(f"Invalid cursor: {cursor}") from e
+            conditions.append(tuple_(votes.c.timestamp, votes.c.id) < (last_timestamp, last_id))
+
+        # One extra row tells us whether another page exists
+        query = (
+            self._select(include_payload)
+            .where(*conditions)
+            .order_by(votes.c.timestamp.desc(), votes.c.id.desc())
+            .limit(limit + 1)
+        )
+        with self.engine.connect() as conn:
+            rows = [self._vote_dict(row) for row in conn.execute(query)]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+        return rows, next_cursor
+
+    def iter_votes(self, vote_filter=None, start_date=None, end_date=None, batch_size=500):
+        query = (
+            select(*(votes.c[name] for name in EXPORT_COLUMNS))
+            .where(*self._filter_conditions(vote_filter, start_date, end_date))
+            .order_by(votes.c.timestamp, votes.c.id)
+        )
+        # stream_results uses a server-side cursor where the driver has one
+        # (psycopg2), so rows arrive batch_size at a time
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+            for row in result:
+                yield self._vote_dict(row)
+
+    def get_vote_statistics(self):
+        since = (datetime.now(timezone.utc) - timedelta(days=30)).strftime("%Y-%m-%d")
+        with self.engine.connect() as conn:
+            total_votes, yes_votes, no_votes, votes_with_comments = conn.execute(select(
+                func.coalesce(func.sum(vote_daily_stats.c.total), 0),
+                func.coalesce(func.sum(vote_daily_stats.c.yes), 0),
+                func.coalesce(func.sum(vote_daily_stats.c.no), 0),
+                func.coalesce(func.sum(vote_daily_stats.c.with_comment), 0),
+            )).one()
+            rows = conn.execute(
+                select(vote_daily_stats.c.day, vote_daily_stats.c.total)
+                .where(vote_daily_stats.c.day >= since)
+                .order_by(vote_daily_stats.c.day)
+            ).all()
+
+        return {
+            "total_votes": total_votes,
+            "yes_votes": yes_votes,
+            "no_votes": no_votes,
+            "yes_percentage": (yes_votes / total_votes * 100) if total_votes > 0 else 0,
+            "no_percentage": (no_votes / total_votes * 100) if total_votes > 0 else 0,
+            "votes_with_comments": votes_with_comments,
+            "votes_per_day": {row[0]: row[1] for row in rows}
+        }
+
+    def accuracy_breakdown(self, start_date=None, end_date=None, vote_filter=None):
+        category = func.coalesce(votes.c.response_type, "Unknown").label("category")
+        query = select(
+            votes.c.day,
+            category,
+            func.count().label("votes"),
+            func.count(votes.c.factually_correct).label("evaluated"),
+            func.coalesce(func.sum(votes.c.factually_correct), 0).label("factually_correct"),
+            func.sum(case((votes.c.vote == "yes", 1), else_=0)).label("yes_votes"),
+            func.avg(votes.c.confidence_in_evaluation).label("avg_confidence"),
+        )
+        if vote_filter:
+            query = query.where(votes.c.vote == vote_filter)
+        if start_date:
+            query = query.where(votes.c.day >= start_date)
+        if end_date:
+            query = query.where(votes.c.day <= end_date)
+        query = query.group_by(votes.c.day, category).order_by(votes.c.day, category)
+
+        breakdown = []
+        with self.engine.connect() as conn:
+            for row in conn.execute(query):
+                entry = dict(row._mapping)
+                # Postgres returns AVG as Decimal
+                if entry["avg_confidence"] is not None:
+                    entry["avg_confidence"] = float(entry["avg_confidence"])
+                entry["accuracy"] = (entry["factually_correct"] / entry["evaluated"] * 100) if entry["evaluated"] else None
+                breakdown.append(entry)
+        return breakdown
+
+    def rebuild_statistics(self):
+        with self.engine.begin() as conn:
+            conn.execute(vote_daily_stats.delete())
+            conn.execute(vote_daily_stats.insert().from_select(
+                ["day", "total", "yes", "no", "with_comment"],
+                select(
+                    votes.c.day,
+                    func.count(),
+                    func.sum(case((votes.c.vote == "yes", 1), else_=0)),
+                    func.sum(case((votes.c.vote == "no", 1), else_=0)),
+                    func.sum(case((func.coalesce(votes.c.comment, "") != "", 1), else_=0)),
+                ).group_by(votes.c.day)
+            ))
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# The application modules live at the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config reads the environment once, on first import; give it placeholder
+# Azure settings so assistant_core can be imported without a .env. The tests
+# replace the clients before anything is sent.
+os.environ.setdefault("OPENAI_ENDPOINT", "https://test.openai.azure.com/")
+os.environ.setdefault("OPENAI_KEY", "test-key")
+os.environ.setdefault("SEARCH_ENDPOINT", "test-search")
+os.environ.setdefault("SEARCH_INDEX", "test-index")
+os.environ.setdefault("SEARCH_KEY", "test-key")
+os.environ.setdefault("EVALUATION_DB", os.path.join(tempfile.mkdtemp(prefix="rag-tests-"), "evaluations.db"))
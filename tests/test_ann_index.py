@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex
+from similarity import normalize_rows
+
+DIM = 16
+
+
+@pytest.fixture
+def vectors():
+    return normalize_rows(np.random.default_rng(7).normal(size=(300, DIM)).astype(np.float32))
+
+
+@pytest.fixture(params=[0, 4], ids=["flat", "pq"])
+def index(request, vectors):
+    # Probing every list makes the search exact, so results can be compared
+    return IVFIndex.build(vectors, nlist=8, pq_m=request.param, nprobe=8, rerank=300)
+
+
+def test_finds_each_vector_itself(index, vectors):
+    for row in (0, 17, 299):
+        ids, scores = index.search(vectors[row], 3)
+        assert ids[0] == row
+        assert scores[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_matches_brute_force(index, vectors):
+    query = np.random.default_rng(8).normal(size=DIM)
+    ids, _ = index.search(query, 10)
+    expected = np.argsort(-(vectors @ (query / np.linalg.norm(query))))[:10]
+    assert list(ids) == list(expected)
+
+
+def test_add_and_delete(index, vectors):
+    new = normalize_rows(np.random.default_rng(9).normal(size=(5, DIM)).astype(np.float32))
+    ids = index.add(new)
+    assert list(ids) == list(range(300, 305))
+    assert len(index) == 305
+    assert index.search(new[2], 1)[0][0] == 302
+
+    index.delete([302, 0])
+    assert 302 not in index.search(new[2], 5)[0]
+    assert 0 not in index.search(vectors[0], 5)[0]
+
+
+def test_save_and_load_keeps_inserts_and_deletes(index, vectors, tmp_path):
+    new = normalize_rows(np.random.default_rng(9).normal(size=(5, DIM)).astype(np.float32))
+    index.add(new)
+    index.delete([1, 303])
+    index.save(str(tmp_path))
+
+    assert IVFIndex.exists(str(tmp_path))
+    loaded = IVFIndex.load(str(tmp_path), nprobe=8, rerank=300)
+    assert len(loaded) == 305
+    assert loaded.added == {}
+    for query in (vectors[1], vectors[50], new[0], new[3]):
+        expected_ids, expected_scores = index.search(query, 5)
+        ids, scores = loaded.search(query, 5)
+        assert list(ids) == list(expected_ids)
+        assert np.allclose(scores, expected_scores)
+    assert 1 not in loaded.search(vectors[1], 5)[0]
+
+    # The loaded index stays writable although its arrays are memory-mapped
+    loaded.delete([50])
+    assert 50 not in loaded.search(vectors[50], 5)[0]
+    assert loaded.add(new[:1])[0] == 305
+
+
+def test_build_rejects_bad_input():
+    with pytest.raises(ValueError):
+        IVFIndex.build(np.zeros((0, DIM), dtype=np.float32))
+    with pytest.raises(ValueError):
+        IVFIndex.build(np.ones((10, DIM), dtype=np.float32), nlist=2, pq_m=5)
+
+
+def test_pq_shortlist_is_rescored_exactly(vectors):
+    index = IVFIndex.build(vectors, nlist=8, pq_m=4, nprobe=8, rerank=20)
+    hits = sum(index.search(vectors[row], 1)[0][0] == row for row in range(0, 300, 10))
+    assert hits == 30
+    _, scores = index.search(vectors[5], 5)
+    assert scores[0] == pytest.approx(1.0, abs=1e-5)
@@ -0,0 +1,123 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+import assistant_core
+from rag_assistant import ANSWER_ERROR_TEXT
+from retrieval import Retriever
+
+EVALUATION = {"factually_correct": "Yes", "response_effectiveness": "Fully"}
+
+
+class FakeRetriever(Retriever):
+    def search(self, query, query_embedding, top=10):
+        return [{"chunk": f"Calibration step {i}: hold the reset button.", "title": f"Manual {i}", "relevance": 1.0}
+                for i in range(3)]
+
+
+class FakeOpenAI:
+    """Stands in for AzureOpenAI: embeddings and the answer/evaluation completions."""
+
+    def __init__(self):
+        self.fail_answers = False
+        self.fail_evaluations = False
+        self.stream_options = None
+        self.answer_calls = 0
+        self.embeddings = SimpleNamespace(create=self._embed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+
+    def _embed(self, input, model):
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[1.0, float(len(text) % 7)])
+                                     for i, text in enumerate(input)])
+
+    def _complete(self, model, messages, **kwargs):
+        if "forensic" in messages[0]["content"]:
+            if self.fail_evaluations:
+                raise RuntimeError("evaluator unavailable")
+            content = json.dumps(EVALUATION)
+        else:
+            self.answer_calls += 1
+            if kwargs.get("stream"):
+                self.stream_options = kwargs.get("stream_options")
+                return self._stream(["Hold the reset ", "button [Source_1]"])
+            if self.fail_answers:
+                raise RuntimeError("429 rate limited")
+            content = "Hold the reset button [Source_1]"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    def _stream(self, pieces):
+        for i, text in enumerate(pieces):
+            if self.fail_answers and i > 0:
+                raise RuntimeError("connection reset")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=120, completion_tokens=8))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeOpenAI()
+    monkeypatch.setattr(assistant_core, "client", client)
+    monkeypatch.setattr(assistant_core.rag_assistant, "client", client)
+    monkeypatch.setattr(assistant_core.rag_assistant, "retriever", FakeRetriever())
+    assistant_core.response_cache.clear()
+    yield client
+    assistant_core.response_cache.clear()
+
+
+def stage_errors(stage):
+    return REGISTRY.get_sample_value("rag_stage_errors_total", {"stage": stage}) or 0.0
+
+
+def test_answer_is_cached(client):
+    first = assistant_core.run_chat("How do I calibrate?", async_evaluation=False)
+    assert first["answer"] == "Hold the reset button [Source_1]"
+    assert first["evaluation"] == EVALUATION
+
+    second = assistant_core.run_chat("How do I calibrate?", async_evaluation=False)
+    assert second["answer"] == first["answer"]
+    assert client.answer_calls == 1
+
+
+def test_failed_answer_is_not_cached(client):
+    client.fail_answers = True
+    errors_before = stage_errors("answer")
+    failed = assistant_core.run_chat("How do I calibrate?", async_evaluation=False)
+    assert failed["answer"] == ANSWER_ERROR_TEXT
+    assert stage_errors("answer") == errors_before + 1
+
+    # Once the model recovers, the same query is answered afresh
+    client.fail_answers = False
+    retried = assistant_core.run_chat("How do I calibrate?", async_evaluation=False)
+    assert retried["answer"] == "Hold the reset button [Source_1]"
+    assert client.answer_calls == 2
+
+
+def test_failed_evaluation_is_counted_once_and_not_cached(client):
+    client.fail_evaluations = True
+    errors_before = stage_errors("evaluation")
+    failed = assistant_core.run_chat("How do I calibrate?", async_evaluation=False)
+    assert failed["answer"] == "Hold the reset button [Source_1]"
+    assert "error" in failed["evaluation"]
+    assert stage_errors("evaluation") == errors_before + 1
+
+    client.fail_evaluations = False
+    retried = assistant_core.run_chat("How do I calibrate?", async_evaluation=False)
+    assert retried["evaluation"] == EVALUATION
+    assert client.answer_calls == 2
+
+
+def test_stream_records_usage_and_is_cached(client):
+    events = list(assistant_core.stream_chat("How do I calibrate?", async_evaluation=False))
+    assert [event for event, _ in events] == ["token", "token", "sources", "evaluation", "done"]
+    assert client.stream_options == {"include_usage": True}
+    assert REGISTRY.get_sample_value("rag_tokens_count", {"operation": "answer", "kind": "completion"})
+    assert assistant_core.response_cache.get("How do I calibrate?")["answer"] == "Hold the reset button [Source_1]"
+
+
+def test_stream_failure_is_an_error_event_and_not_cached(client):
+    client.fail_answers = True
+    events = list(assistant_core.stream_chat("How do I calibrate?", async_evaluation=False))
+    assert [event for event, _ in events] == ["token", "error"]
+    assert assistant_core.response_cache.get("How do I calibrate?") is None
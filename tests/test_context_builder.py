@@ -0,0 +1,44 @@
+import pytest
+
+import context_builder
+from context_builder import count_tokens, truncate_to_tokens
+
+
+class CharEncoding:
+    """One token per character, standing in for a tiktoken encoding."""
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture(params=["tiktoken", "approximate"])
+def encoding(request, monkeypatch):
+    monkeypatch.setattr(context_builder, "_get_encoding",
+                        lambda: CharEncoding() if request.param == "tiktoken" else None)
+    count_tokens.cache_clear()
+    yield request.param
+    count_tokens.cache_clear()
+
+
+def test_short_text_is_unchanged(encoding):
+    assert truncate_to_tokens("Hold the reset button.", 100) == "Hold the reset button."
+
+
+def test_cuts_on_a_word_boundary(encoding):
+    text = "Hold the reset button for ten seconds until the status light blinks " * 5
+    cut = truncate_to_tokens(text, 12)
+    assert cut
+    assert count_tokens(cut) <= 12
+    assert text.startswith(cut)
+    assert text[len(cut)] == " "
+
+
+@pytest.mark.parametrize("text", ["x" * 500, " " + "x" * 500, "https://example.com/" + "a/" * 200])
+def test_long_first_word_is_cut_not_dropped(encoding, text):
+    cut = truncate_to_tokens(text, 10)
+    assert cut.strip()
+    assert count_tokens(cut) <= 10
+    assert cut in text
@@ -0,0 +1,43 @@
+import warnings
+
+import numpy as np
+
+from diversity import _PRIME, diversify, minhash_signature
+
+PARAGRAPH = "Hold the reset button for ten seconds until the status light blinks green twice."
+
+
+def hit(chunk, title, relevance=1.0):
+    return {"chunk": chunk, "title": title, "relevance": relevance}
+
+
+def test_signature_stays_below_the_prime():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        signature = minhash_signature(PARAGRAPH + " 0xFFFFFFFF https://example.com/manual")
+    assert signature.dtype == np.uint64
+    assert int(signature.max()) < _PRIME
+
+
+def test_near_duplicates_are_dropped():
+    results = [
+        hit(PARAGRAPH, "Manual A"),
+        hit(PARAGRAPH + " Then release it.", "Manual B"),
+        hit("Replace the lamp every two thousand hours of use.", "Manual C"),
+    ]
+    assert [result["title"] for result in diversify(results, dedup_threshold=0.5)] == ["Manual A", "Manual C"]
+
+
+def test_equal_scores_keep_the_retrieval_order():
+    results = [hit(f"Topic {i}: {word} calibration notes", f"Manual {i}")
+               for i, word in enumerate(["pump", "lamp", "valve", "detector"])]
+    assert diversify(results, mmr_lambda=1.0) == results
+
+
+def test_scores_decide_relevance_when_they_differ():
+    results = [
+        hit("Pump seals wear out and need replacing yearly.", "Pumps", relevance=0.4),
+        hit("The detector lamp warms up for thirty minutes.", "Detectors", relevance=0.9),
+        hit("Valves are rated for four hundred bar.", "Valves", relevance=0.1),
+    ]
+    assert [result["title"] for result in diversify(results, mmr_lambda=1.0)] == ["Detectors", "Pumps", "Valves"]
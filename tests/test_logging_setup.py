@@ -0,0 +1,92 @@
+import json
+import logging
+import queue
+
+from logging_setup import (
+    DebugSampler,
+    JsonFormatter,
+    MultiProcessRotatingFileHandler,
+    RequestQueueHandler,
+    parse_sample_rates,
+)
+from tracing import start_trace
+
+
+def make_record(name="api", level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter():
+    entry = json.loads(JsonFormatter().format(make_record(request_id="abc123", query_chars=42)))
+    assert entry["message"] == "hello world"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "api"
+    assert entry["request_id"] == "abc123"
+    assert entry["query_chars"] == 42
+    assert "args" not in entry
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("api=0.1, azure.core=0.01,") == {"api": 0.1, "azure.core": 0.01}
+    assert parse_sample_rates("") == {}
+
+
+def test_debug_sampler_uses_the_longest_prefix(monkeypatch):
+    sampler = DebugSampler({"azure": 0.0, "azure.core.pipeline": 1.0})
+    assert not sampler.filter(make_record("azure.identity", logging.DEBUG))
+    assert sampler.filter(make_record("azure.core.pipeline.policies", logging.DEBUG))
+    assert sampler.filter(make_record("azure.identity", logging.WARNING))
+    assert sampler.filter(make_record("azurefoo", logging.DEBUG))
+
+    monkeypatch.setattr("logging_setup.random.random", lambda: 0.3)
+    half = DebugSampler({"api": 0.5})
+    assert half.filter(make_record("api", logging.DEBUG))
+    monkeypatch.setattr("logging_setup.random.random", lambda: 0.7)
+    assert not half.filter(make_record("api", logging.DEBUG))
+
+
+def test_queue_handler_renders_the_message_when_logged():
+    log_queue = queue.Queue()
+    handler = RequestQueueHandler(log_queue)
+    sources = ["Manual A"]
+    with start_trace("POST /chat") as root:
+        handler.handle(make_record(msg="sources: %s", args=(sources,)))
+    # Mutating the argument afterwards must not change what gets written
+    sources.append("Manual B")
+
+    record = log_queue.get_nowait()
+    assert record.getMessage() == "sources: ['Manual A']"
+    assert record.args is None
+    assert record.request_id == root.trace_id
+
+
+def test_queue_handler_drops_when_full():
+    handler = RequestQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(3):
+        handler.handle(make_record())
+    assert handler.dropped == 2
+
+
+def test_rotated_file_is_reopened_by_other_writers(tmp_path):
+    path = str(tmp_path / "api.log")
+    first = MultiProcessRotatingFileHandler(path, maxBytes=200, backupCount=2)
+    second = MultiProcessRotatingFileHandler(path, maxBytes=200, backupCount=2)
+    for handler in (first, second):
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    try:
+        second.emit(make_record(msg="second: before rotation", args=()))
+        for i in range(10):
+            first.emit(make_record(msg=f"first {i:02d}: " + "x" * 30, args=()))
+        second.emit(make_record(msg="second: after rotation", args=()))
+    finally:
+        first.close()
+        second.close()
+
+    current = (tmp_path / "api.log").read_text()
+    assert "second: after rotation" in current
+    backups = "".join(p.read_text() for p in tmp_path.glob("api.log.*") if not p.name.endswith(".lock"))
+    assert "second: after rotation" not in backups
+    lines = current.splitlines() + backups.splitlines()
+    assert sum(line.startswith("first") for line in lines) >= 8
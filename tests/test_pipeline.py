@@ -0,0 +1,111 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from prometheus_client import REGISTRY
+
+from metrics import track_stage
+from pipeline import PipelineExecutor, Stage, StageError
+
+
+@pytest.fixture
+def pipeline():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield PipelineExecutor(executor)
+    executor.shutdown(wait=False)
+
+
+def stage_errors(stage):
+    return REGISTRY.get_sample_value("rag_stage_errors_total", {"stage": stage}) or 0.0
+
+
+def test_stages_receive_their_inputs(pipeline):
+    result = pipeline.run([
+        Stage("numbers", lambda: [1, 2, 3]),
+        Stage("total", lambda numbers: sum(numbers), requires=["numbers"]),
+        Stage("report", lambda numbers, total: f"{len(numbers)} numbers, total {total}", requires=["numbers", "total"]),
+    ])
+    assert result["report"] == "3 numbers, total 6"
+    assert set(result.durations) == {"numbers", "total", "report"}
+    assert result.errors == {}
+
+
+def test_independent_stages_run_concurrently(pipeline):
+    both_started = threading.Barrier(2, timeout=2)
+    result = pipeline.run([
+        Stage("left", lambda: both_started.wait() is not None),
+        Stage("right", lambda: both_started.wait() is not None),
+    ])
+    assert result["left"] and result["right"]
+
+
+def test_failure_uses_the_fallback(pipeline):
+    def broken():
+        raise RuntimeError("boom")
+
+    errors_before = stage_errors("test-fallback")
+    result = pipeline.run([
+        Stage("test-fallback", broken, on_error=lambda e: f"fallback after {e}"),
+        Stage("after", lambda **inputs: inputs["test-fallback"].upper(), requires=["test-fallback"]),
+    ])
+    assert result["after"] == "FALLBACK AFTER BOOM"
+    assert isinstance(result.errors["test-fallback"], RuntimeError)
+    assert stage_errors("test-fallback") == errors_before + 1
+
+
+def test_failure_without_fallback_raises(pipeline):
+    def broken():
+        raise RuntimeError("boom")
+
+    with pytest.raises(StageError) as raised:
+        pipeline.run([Stage("test-fatal", broken)])
+    assert raised.value.stage == "test-fatal"
+    assert isinstance(raised.value.cause, RuntimeError)
+
+
+def test_error_counted_by_track_stage_is_not_counted_again(pipeline):
+    def broken():
+        with track_stage("test-tracked"):
+            raise RuntimeError("boom")
+
+    errors_before = stage_errors("test-tracked")
+    pipeline.run([Stage("test-tracked", broken, on_error=lambda e: None)])
+    assert stage_errors("test-tracked") == errors_before + 1
+
+
+def test_timeout_uses_the_fallback(pipeline):
+    started = time.monotonic()
+    result = pipeline.run([
+        Stage("slow", lambda: time.sleep(1) or "late", timeout=0.1, on_error=lambda e: "fallback"),
+        Stage("fast", lambda: "on time"),
+    ])
+    assert time.monotonic() - started < 0.9
+    assert result["slow"] == "fallback"
+    assert result["fast"] == "on time"
+    assert isinstance(result.errors["slow"], TimeoutError)
+
+
+def test_detached_stage_is_collected_with_wait(pipeline):
+    release = threading.Event()
+    result = pipeline.run([
+        Stage("answer", lambda: "42"),
+        Stage("check", lambda answer: release.wait(2) and answer == "42", requires=["answer"]),
+    ], detach=["check"])
+    assert "check" not in result.results
+    release.set()
+    assert result.wait("check") is True
+    assert result.wait("check") is True
+
+
+def test_detached_stage_timeout_counts_from_submission(pipeline):
+    result = pipeline.run([
+        Stage("slow", lambda: time.sleep(1) or "late", timeout=0.1, on_error=lambda e: "fallback"),
+    ], detach=["slow"])
+    assert result.wait("slow") == "fallback"
+    assert isinstance(result.errors["slow"], TimeoutError)
+
+
+def test_unsatisfiable_dependencies_raise(pipeline):
+    with pytest.raises(StageError):
+        pipeline.run([Stage("orphan", lambda missing: missing, requires=["missing"])])
@@ -0,0 +1,93 @@
+import pytest
+
+import response_cache
+from response_cache import SemanticResponseCache, normalize_query
+
+VECTORS = {
+    "how do i calibrate": [1.0, 0.0],
+    "what is the calibration procedure": [0.99, 0.05],
+    "where is the manual": [0.0, 1.0],
+}
+
+
+class Embedder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, query):
+        self.calls += 1
+        return VECTORS.get(normalize_query(query))
+
+
+@pytest.fixture
+def embed():
+    return Embedder()
+
+
+def test_normalize_query():
+    assert normalize_query("  How do I  calibrate?! ") == "how do i calibrate"
+
+
+def test_exact_hit_skips_the_embedding(embed):
+    cache = SemanticResponseCache(embed)
+    cache.put("How do I calibrate?", {"answer": "Hold reset"})
+    calls = embed.calls
+    assert cache.get("how do i CALIBRATE") == {"answer": "Hold reset"}
+    assert embed.calls == calls
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_semantic_hit_and_miss(embed):
+    cache = SemanticResponseCache(embed, similarity_threshold=0.95)
+    cache.put("How do I calibrate?", {"answer": "Hold reset"})
+    assert cache.get("What is the calibration procedure?") == {"answer": "Hold reset"}
+    assert cache.get("Where is the manual?") is None
+    assert cache.get("Something unembeddable") is None
+    assert cache.stats() == {"exact_hits": 0, "semantic_hits": 1, "misses": 2, "entries": 1}
+
+
+def test_embed_false_skips_the_semantic_lookup(embed):
+    cache = SemanticResponseCache(embed)
+    cache.put("How do I calibrate?", {"answer": "Hold reset"})
+    calls = embed.calls
+    assert cache.get("What is the calibration procedure?", embed=False) is None
+    assert embed.calls == calls
+
+
+def test_results_are_copies(embed):
+    cache = SemanticResponseCache(embed)
+    result = {"answer": "Hold reset", "sources": [{"title": "Manual"}]}
+    cache.put("How do I calibrate?", result)
+    result["sources"].append({"title": "Changed"})
+    cached = cache.get("How do I calibrate?")
+    cached["sources"].clear()
+    assert cache.get("How do I calibrate?")["sources"] == [{"title": "Manual"}]
+
+
+def test_least_recently_used_entry_is_evicted(embed):
+    cache = SemanticResponseCache(embed, max_size=2)
+    cache.put("How do I calibrate?", {"answer": "1"})
+    cache.put("Where is the manual?", {"answer": "2"})
+    cache.get("How do I calibrate?")
+    cache.put("What is the warranty?", {"answer": "3"})
+    assert cache.get("Where is the manual?", embed=False) is None
+    assert cache.get("How do I calibrate?") == {"answer": "1"}
+
+
+def test_entries_expire(embed, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = SemanticResponseCache(embed, ttl=60)
+    cache.put("How do I calibrate?", {"answer": "Hold reset"})
+    now[0] += 59
+    assert cache.get("How do I calibrate?") is not None
+    now[0] += 2
+    assert cache.get("How do I calibrate?") is None
+    assert cache.get("What is the calibration procedure?") is None
+
+
+def test_zero_size_disables_the_cache(embed):
+    cache = SemanticResponseCache(embed, max_size=0)
+    cache.put("How do I calibrate?", {"answer": "Hold reset"})
+    assert cache.get("How do I calibrate?") is None
+    assert embed.calls == 0
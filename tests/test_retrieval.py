@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from retrieval import ExactVectorIndex, LocalHybridRetriever, Retriever, reciprocal_rank_fusion
+
+FIELDS = {"id": "id", "content": "chunk", "title": "title", "text_vector": "text_vector"}
+
+DOCUMENTS = [
+    {"id": "pump", "title": "Pump guide", "chunk": "Replace the pump seals every year.", "text_vector": [1.0, 0.0, 0.0]},
+    {"id": "lamp", "title": "Lamp guide", "chunk": "The detector lamp warms up for thirty minutes.", "text_vector": [0.0, 1.0, 0.0]},
+    {"id": "valve", "title": "Valve guide", "chunk": "Valves are rated for four hundred bar.", "text_vector": [0.0, 0.0, 1.0]},
+]
+
+
+@pytest.fixture(params=["exact", "ivf"])
+def retriever(request):
+    return LocalHybridRetriever.from_documents(
+        [dict(document) for document in DOCUMENTS], field_mappings=FIELDS, vector_index=request.param
+    )
+
+
+def test_retriever_is_abstract():
+    with pytest.raises(TypeError):
+        Retriever()
+
+    class NoSearch(Retriever):
+        pass
+
+    with pytest.raises(TypeError):
+        NoSearch()
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [2, 1]], k=60)
+    assert [doc_id for doc_id, _ in fused] == [1, 2, 3]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[2][1] == pytest.approx(1 / 63)
+
+
+def test_top_hit_in_both_legs_has_relevance_one(retriever):
+    results = retriever.search("pump seals", [1.0, 0.1, 0.0], top=3)
+    assert results[0]["title"] == "Pump guide"
+    assert results[0]["relevance"] == pytest.approx(1.0)
+    assert all(0.0 <= result["relevance"] <= 1.0 for result in results)
+
+
+def test_text_only_search_is_scaled_to_one_leg(retriever):
+    results = retriever.search("detector lamp", None, top=3)
+    assert results[0]["title"] == "Lamp guide"
+    assert results[0]["relevance"] == pytest.approx(1.0)
+
+
+def test_add_and_delete_documents(retriever):
+    retriever.add_documents([{"id": "oven", "title": "Oven guide", "chunk": "The column oven holds 80 degrees.",
+                              "text_vector": [0.6, 0.0, 0.8]}], field_mappings=FIELDS)
+    assert retriever.search("column oven", [0.6, 0.0, 0.8], top=1)[0]["title"] == "Oven guide"
+
+    assert retriever.delete_documents(["oven", "missing"]) == 1
+    titles = [result["title"] for result in retriever.search("column oven", [0.6, 0.0, 0.8], top=4)]
+    assert "Oven guide" not in titles
+
+
+def test_save_and_load_round_trip(retriever, tmp_path):
+    retriever.delete_documents(["valve"])
+    retriever.save(str(tmp_path))
+    loaded = LocalHybridRetriever.load(str(tmp_path))
+    assert type(loaded.vector_index) is type(retriever.vector_index)
+    for query, embedding in [("pump seals", [1.0, 0.0, 0.0]), ("valves bar", [0.0, 0.0, 1.0])]:
+        assert loaded.search(query, embedding) == retriever.search(query, embedding)
+    assert "Valve guide" not in [result["title"] for result in loaded.search("valves bar", [0.0, 0.0, 1.0])]
+
+
+def test_exact_index_skips_deleted_rows():
+    index = ExactVectorIndex.from_vectors(np.eye(3))
+    index.delete([0])
+    ids, _ = index.search([1.0, 0.1, 0.0], 3)
+    assert 0 not in ids
+    assert list(index.add([[1.0, 0.0, 0.0]])) == [3]
+    assert index.search([1.0, 0.0, 0.0], 1)[0][0] == 3
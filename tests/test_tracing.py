@@ -0,0 +1,119 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tracing
+from pipeline import PipelineExecutor, Stage
+from tracing import JsonlExporter, SpanProcessor, current_trace_id, read_spans, slowest_traces, span, start_trace
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    """Turn tracing on with an in-memory exporter; yields a function returning the finished spans."""
+    exporter = ListExporter()
+    processor = SpanProcessor(exporter, flush_interval=0.05)
+    monkeypatch.setattr(tracing, "TRACE_EXPORTER", "memory")
+    monkeypatch.setattr(tracing, "_processor", processor)
+    monkeypatch.setattr(tracing, "_processor_pid", os.getpid())
+
+    def finished():
+        processor.close()
+        return {s.name: s for s in exporter.spans}
+
+    yield finished
+    processor.close()
+
+
+def test_spans_nest_under_the_trace(exported):
+    with start_trace("POST /chat", route="/chat") as root:
+        assert current_trace_id() == root.trace_id
+        with span("search", kind="client", hits=3):
+            with span("embeddings.create"):
+                pass
+    assert current_trace_id() is None
+
+    spans = exported()
+    assert {s.trace_id for s in spans.values()} == {root.trace_id}
+    assert spans["POST /chat"].parent_id is None
+    assert spans["search"].parent_id == spans["POST /chat"].span_id
+    assert spans["embeddings.create"].parent_id == spans["search"].span_id
+    assert spans["search"].attributes == {"hits": 3}
+    assert spans["search"].end_ns >= spans["embeddings.create"].end_ns
+
+
+def test_pipeline_stages_join_the_trace(exported):
+    executor = ThreadPoolExecutor(max_workers=2)
+    with start_trace("POST /chat") as root:
+        result = PipelineExecutor(executor).run([
+            Stage("search", lambda: current_trace_id()),
+        ])
+    executor.shutdown()
+    assert result["search"] == root.trace_id
+    assert exported()["stage:search"].parent_id == root.span_id
+
+
+def test_errors_are_recorded(exported):
+    with pytest.raises(ValueError):
+        with start_trace("POST /chat"):
+            with span("answer"):
+                raise ValueError("bad request")
+    spans = exported()
+    assert spans["answer"].error == "ValueError: bad request"
+    assert spans["POST /chat"].error == "ValueError: bad request"
+
+
+def test_span_is_a_no_op_outside_a_trace_or_with_tracing_off(monkeypatch):
+    with span("orphan") as orphan:
+        assert orphan is None
+    monkeypatch.setattr(tracing, "TRACE_EXPORTER", "")
+    with start_trace("POST /chat") as root:
+        assert root.trace_id
+        with span("search") as child:
+            assert child is None
+
+
+def test_full_queue_drops_spans():
+    exporting, release = threading.Event(), threading.Event()
+
+    class BlockedExporter:
+        def export(self, spans):
+            exporting.set()
+            release.wait(2)
+
+    processor = SpanProcessor(BlockedExporter(), max_queue=1, flush_interval=0.01)
+    spans = [tracing.Span("t", None, f"span {i}", "internal", {}) for i in range(5)]
+    processor.on_end(spans[0])
+    assert exporting.wait(2)
+    # The exporter is stuck: one span fits in the queue, the rest are dropped
+    for s in spans[1:]:
+        processor.on_end(s)
+    assert processor.dropped == 3
+    release.set()
+    processor.close()
+
+
+def test_jsonl_exporter_round_trip(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    exporter = JsonlExporter(path)
+    fast, slow = (tracing.Span("t1", None, "fast", "server", {}), tracing.Span("t2", None, "slow", "server", {}))
+    fast.end_ns = fast.start_ns + 1_000_000
+    slow.end_ns = slow.start_ns + 5_000_000
+    child = tracing.Span("t2", slow.span_id, "search", "client", {"hits": 2})
+    child.end_ns = child.start_ns
+    exporter.export([fast, slow])
+    exporter.export([child])
+
+    spans = read_spans(path)
+    assert len(spans) == 3
+    assert [s["name"] for s in slowest_traces(spans, 1)] == ["slow"]
+    assert spans[2]["attributes"] == {"hits": 2}
@@ -0,0 +1,377 @@
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from config import TRACE_EXPORTER, TRACE_FILE, TRACE_OTLP_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "rag-assistant"
+
+# The innermost open span of the current request. Context variables follow
+# asyncio tasks and asyncio.to_thread on their own; thread pools need
+# contextvars.copy_context().run (see pipeline.py and evaluation_queue.py).
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation in a trace; ``trace_id`` doubles as the request ID."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_ns", "end_ns", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: str, attributes: Dict):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+            "pid": os.getpid(),
+        }
+
+
+class JsonlExporter:
+    """Appends one JSON object per span to ``path``.
+
+    Each batch is a single O_APPEND write, so gunicorn workers sharing the
+    file do not interleave partial lines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        data = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans).encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _from_otlp_value(value: Dict):
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()), None)
+
+
+def _otlp_span(span: Span) -> Dict:
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": _OTLP_KINDS.get(span.kind, 1),
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+class OtlpExporter:
+    """Posts spans as OTLP/HTTP JSON, e.g. to an OpenTelemetry Collector on :4318."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def export(self, spans: List[Span]) -> None:
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [_otlp_span(span) for span in spans]}],
+        }]}
+        response = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class SpanProcessor:
+    """Hands finished spans to an exporter from a background thread.
+
+    Requests never wait on the exporter: when the queue is full, spans are
+    dropped and counted rather than slowing the chat down.
+    """
+
+    def __init__(self, exporter, max_queue: int = 10000, batch_size: int = 256, flush_interval: float = 1.0):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        closing = False
+        while not closing:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            item = first
+            while True:
+                if item is None:
+                    closing = True
+                else:
+                    batch.append(item)
+                if closing or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    logger.warning(f"Failed to export {len(batch)} spans: {e}")
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+def create_processor(exporter_name: str) -> Optional[SpanProcessor]:
+    if exporter_name == "jsonl":
+        return SpanProcessor(JsonlExporter(TRACE_FILE))
+    if exporter_name == "otlp":
+        return SpanProcessor(OtlpExporter(TRACE_OTLP_ENDPOINT))
+    if exporter_name:
+        logger.warning(f"Unknown TRACE_EXPORTER '{exporter_name}', tracing disabled")
+    return None
+
+
+_processor: Optional[SpanProcessor] = None
+_processor_pid: Optional[int] = None
+_processor_lock = threading.Lock()
+
+
+def get_processor() -> Optional[SpanProcessor]:
+    """The process's span processor, recreated in a forked worker like vote_manager's writer."""
+    global _processor, _processor_pid
+    if not TRACE_EXPORTER:
+        return None
+    if _processor_pid != os.getpid():
+        with _processor_lock:
+            if _processor_pid != os.getpid():
+                _processor = create_processor(TRACE_EXPORTER)
+                _processor_pid = os.getpid()
+    return _processor
+
+
+@contextmanager
+def _open_span(trace_id: str, parent_id: Optional[str], name: str, kind: str, attributes: Dict) -> Iterator[Span]:
+    current = Span(trace_id, parent_id, name, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # A streaming generator finalised from another context
+            pass
+        current.end_ns = time.time_ns()
+        processor = get_processor()
+        if processor is not None:
+            processor.on_end(current)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+    """Open the root span of a new trace; its ``trace_id`` is the request ID.
+
+    Pass ``trace_id`` when the ID has to be handed out before the work starts,
+    as with a streamed response. The root span is created even with tracing
+    off, so the ID is always there for responses and logs.
+    """
+    with _open_span(trace_id or new_trace_id(), None, name, "server", attributes) as root:
+        yield root
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes) -> Iterator[Optional[Span]]:
+    """Open a child of the current span; a no-op outside a trace or with tracing off."""
+    parent = _current_span.get()
+    if parent is None or not TRACE_EXPORTER:
+        yield None
+        return
+    with _open_span(parent.trace_id, parent.span_id, name, kind, attributes) as child:
+        yield child
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+
+# --- Local tooling -----------------------------------------------------------
+
+def read_spans(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_trace(spans: List[Dict], trace_id: str) -> None:
+    """Print one trace as an indented tree with offsets from the root start."""
+    spans = [s for s in spans if s["trace_id"] == trace_id]
+    if not spans:
+        print(f"No spans for trace {trace_id}")
+        return
+    children: Dict[Optional[str], List[Dict]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in sorted(spans, key=lambda s: s["start_ns"]):
+        # Spans whose parent never arrived are shown at the top level
+        children.setdefault(s["parent_id"] if s["parent_id"] in ids else None, []).append(s)
+    origin = min(s["start_ns"] for s in spans)
+
+    def walk(parent_id, depth):
+        for s in children.get(parent_id, []):
+            offset = (s["start_ns"] - origin) / 1e6
+            attributes = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+            error = f" ERROR {s['error']}" if s.get("error") else ""
+            print(f"{offset:9.1f}ms {s['duration_ms']:9.1f}ms  {'  ' * depth}{s['name']} {attributes}{error}")
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+
+
+def slowest_traces(spans: List[Dict], top: int) -> List[Dict]:
+    roots = [s for s in spans if s["parent_id"] is None]
+    return sorted(roots, key=lambda s: s["duration_ms"], reverse=True)[:top]
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    """Accepts OTLP/HTTP JSON exports and appends them to a JSONL file."""
+
+    out_path = TRACE_FILE
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+        lines = []
+        for resource_spans in payload.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for s in scope_spans.get("spans", []):
+                    start, end = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+                    status = s.get("status", {})
+                    lines.append(json.dumps({
+                        "trace_id": s["traceId"],
+                        "span_id": s["spanId"],
+                        "parent_id": s.get("parentSpanId"),
+                        "name": s["name"],
+                        "start_ns": start,
+                        "end_ns": end,
+                        "duration_ms": round((end - start) / 1e6, 3),
+                        "attributes": {a["key"]: _from_otlp_value(a["value"]) for a in s.get("attributes", [])},
+                        "error": status.get("message") if status.get("code") == 2 else None,
+                    }) + "\n")
+        with open(self.out_path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect request traces")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="print the span tree of one request")
+    show.add_argument("trace_id")
+    show.add_argument("--file", default=TRACE_FILE)
+    slowest = commands.add_parser("slowest", help="list the slowest requests")
+    slowest.add_argument("--file", default=TRACE_FILE)
+    slowest.add_argument("--top", type=int, default=10)
+    collect = commands.add_parser("collect", help="run a stand-in OTLP/HTTP collector writing JSONL")
+    collect.add_argument("--port", type=int, default=4318)
+    collect.add_argument("--out", default=TRACE_FILE)
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        print_trace(read_spans(args.file), args.trace_id)
+    elif args.command == "slowest":
+        for root in slowest_traces(read_spans(args.file), args.top):
+            print(f"{root['duration_ms']:9.1f}ms  {root['trace_id']}  {root['name']}")
+    else:
+        _CollectorHandler.out_path = args.out
+        server = ThreadingHTTPServer(("0.0.0.0", args.port), _CollectorHandler)
+        print(f"Collecting OTLP spans on :{args.port}/v1/traces into {args.out}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()